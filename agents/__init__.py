@@ -1,4 +1,5 @@
 from .watcher import watcher_agent
+from .screener import screener_agent
 from .analyzer import analyzer_agent
 from .pattern import pattern_agent
 from .alerter import alerter_agent
@@ -6,6 +7,7 @@ from .blocker import blocker_agent
 
 __all__ = [
     "watcher_agent",
+    "screener_agent",
     "analyzer_agent", 
     "pattern_agent",
     "alerter_agent",
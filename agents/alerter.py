@@ -20,7 +20,8 @@ def should_alert(state: AgentState) -> bool:
         state.get('risk_score', 0) > settings.RISK_SCORE_BLOCK_THRESHOLD or
         state.get('pattern_confidence', 0) > settings.RISK_SCORE_BLOCK_THRESHOLD or
         state.get('known_scammer', False) or
-        state.get('url_malicious', False)
+        state.get('url_malicious', False) or
+        state.get('sender_blocked', False)
     )
 
 
@@ -57,10 +58,10 @@ async def alerter_agent(state: AgentState) -> AgentState:
         alert_type = "SCAM_WARNING"
     else:
         return {
-            **state,
             "alerted": False,
             "channels_used": [],
-            "family_notified": False
+            "family_notified": False,
+            "agents_involved": ["alerter"]
         }
     
     alert_data = {
@@ -77,8 +78,8 @@ async def alerter_agent(state: AgentState) -> AgentState:
         alerted = True
     
     return {
-        **state,
         "alerted": alerted,
         "channels_used": channels_used,
-        "family_notified": family_notified
+        "family_notified": family_notified,
+        "agents_involved": ["alerter"]
     }
@@ -1,12 +1,41 @@
+import asyncio
 import json
 import logging
-from typing import Dict, Any
+from collections import Counter
+from typing import Dict, Any, List, Optional
+import numpy as np
 from langchain_core.messages import HumanMessage, SystemMessage
+from config.settings import settings
 from models.scam import AgentState
-from services.gemini_client import get_llm, SCAM_ANALYSIS_SYSTEM_PROMPT, get_analysis_prompt
+from agents.keywords import get_keyword_engine, keyword_confidence
+from agents.local_model import get_local_model
+from services.gemini_client import get_llm, gemini_pool, MAIN_TIER, FAST_TIER, SCAM_ANALYSIS_SYSTEM_PROMPT, get_analysis_prompt
+from services.analysis_cache import get_cached_analysis, set_cached_analysis, analysis_cache_key, CACHED_FIELDS
+from services.near_duplicate_index import find_near_duplicate, remember_analysis
+from services.single_flight import single_flight
+from services.llm_batcher import gemini_batcher
+from services.llm_governor import (
+    llm_governor,
+    estimate_tokens,
+    is_rate_limit_error,
+    GovernorTimeout,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_NAMES
+)
+from services.circuit_breaker import gemini_breaker, CircuitOpenError, OPEN
+from services.llm_stream import stream_until_decision
+from services.llm_hedging import gemini_hedger
+from services.deadline import has_budget, within_deadline_detached
 
 logger = logging.getLogger("scamshield.agents.analyzer")
 
+# How many messages each cascade tier decided: local_pass, local_block, model_pass,
+# model_block, cache, near_duplicate, coalesced, llm, fallback, circuit_open, deadline
+tier_counters: Counter = Counter()
+
+# Fields the pipeline needs to route a message; the prompt asks for them first
+STREAM_DECISION_FIELDS = ("risk_score", "detected_tactics", "confidence")
+
 
 def parse_llm_response(response_text: str) -> Dict[str, Any]:
     import re
@@ -52,159 +81,280 @@ def fallback_analyze(message: str, sender: str) -> Dict[str, Any]:
     Keyword-based fallback analyzer when Gemini API is unavailable.
     This ensures the system ALWAYS provides a meaningful score.
     """
-    message_lower = message.lower()
-    score = 0
-    tactics = []
-    analysis = {
-        "urgency_indicators": [],
-        "authority_claims": [],
-        "threats_found": [],
-        "suspicious_elements": []
-    }
-    
-    # URGENCY detection (+20 points)
-    urgency_words = ["urgent", "immediately", "act now", "limited time", "expires", "hurry", "asap", "right now"]
-    for word in urgency_words:
-        if word in message_lower:
-            score += 20
-            tactics.append("URGENCY")
-            analysis["urgency_indicators"].append(word)
-            break
-    
-    # AUTHORITY detection (+25 points)
-    authority_words = ["irs", "bank", "police", "government", "social security", "fbi", "ssa", "tax", "citibank", "chase", "wells fargo"]
-    for word in authority_words:
-        if word in message_lower:
-            score += 25
-            tactics.append("AUTHORITY")
-            analysis["authority_claims"].append(word)
-            break
-    
-    # THREATS detection (+25 points)
-    threat_words = ["suspended", "arrested", "legal action", "account closed", "warrant", "jail", "prosecute", "terminate"]
-    for word in threat_words:
-        if word in message_lower:
-            score += 25
-            tactics.append("THREATS")
-            analysis["threats_found"].append(word)
-            break
-    
-    # TOO_GOOD detection (+20 points)
-    too_good_words = ["you won", "winner", "lottery", "free money", "inheritance", "million", "prize", "congratulations"]
-    for word in too_good_words:
-        if word in message_lower:
-            score += 20
-            tactics.append("TOO_GOOD")
-            analysis["suspicious_elements"].append(word)
-            break
-    
-    # INFO_REQUEST detection (+20 points)
-    info_words = ["ssn", "social security", "password", "otp", "bank details", "credit card", "account number", "pin"]
-    for word in info_words:
-        if word in message_lower:
-            score += 20
-            tactics.append("INFO_REQUEST")
-            analysis["suspicious_elements"].append(f"Requests: {word}")
-            break
-    
-    # SUSPICIOUS URLs (+15 points)
-    suspicious_url_patterns = ["bit.ly", "tinyurl", "goo.gl", "t.co", "-verify", "-secure", "-login"]
-    for pattern in suspicious_url_patterns:
-        if pattern in message_lower:
-            score += 15
-            tactics.append("SUSPICIOUS_URLS")
-            analysis["suspicious_elements"].append(f"Suspicious URL: {pattern}")
-            break
-    
-    # Cap at 100
-    score = min(100, score)
-    
-    return {
-        "risk_score": score,
-        "detected_tactics": list(set(tactics)),
-        "analysis": analysis,
-        "confidence": 0.8 if score > 50 else 0.5,
-        "explanation": f"Fallback analysis: detected {len(tactics)} scam indicators"
+    return get_keyword_engine().analyze(message)
+
+
+def local_decision_tier(risk_score: int, confidence: float) -> Optional[str]:
+    """Return the cascade tier that can decide a local score, or None if it is ambiguous or not confident."""
+    if confidence < settings.CASCADE_LOCAL_MIN_CONFIDENCE:
+        return None
+    if risk_score < settings.CASCADE_LLM_BAND_MIN:
+        return "local_pass"
+    if risk_score > settings.CASCADE_LLM_BAND_MAX:
+        return "local_block"
+    return None
+
+
+def model_decision_tier(risk_score: int) -> Optional[str]:
+    """Return the cascade tier for a confident local model score, or None to ask Gemini."""
+    if risk_score < settings.LOCAL_MODEL_PASS_BELOW * 100:
+        return "model_pass"
+    if risk_score > settings.LOCAL_MODEL_BLOCK_ABOVE * 100:
+        return "model_block"
+    return None
+
+
+def score_batch(messages: List[str]) -> Dict[str, Any]:
+    """
+    Local scores for many messages at once, for bulk rescans such as replaying
+    traffic under new keyword rules. Each entry equals what analyzer_agent's
+    local tiers compute for that message; tiers is "" where Gemini would be asked.
+    """
+    keyword_scores = get_keyword_engine().score_batch(messages)
+    tiers = np.full(len(messages), "", dtype=object)
+    confident = keyword_confidence(keyword_scores) >= settings.CASCADE_LOCAL_MIN_CONFIDENCE
+    tiers[confident & (keyword_scores < settings.CASCADE_LLM_BAND_MIN)] = "local_pass"
+    tiers[confident & (keyword_scores > settings.CASCADE_LLM_BAND_MAX)] = "local_block"
+    model_scores = None
+    model = get_local_model()
+    if model is not None:
+        model_scores = np.rint(model.predict_proba_batch(messages) * 100).astype(np.int64)
+        undecided = tiers == ""
+        tiers[undecided & (model_scores < settings.LOCAL_MODEL_PASS_BELOW * 100)] = "model_pass"
+        tiers[undecided & (model_scores > settings.LOCAL_MODEL_BLOCK_ABOVE * 100)] = "model_block"
+    return {"keyword_scores": keyword_scores, "model_scores": model_scores, "tiers": tiers}
+
+
+def get_tier_stats() -> Dict[str, int]:
+    return dict(tier_counters)
+
+
+def analysis_update(result: Dict[str, Any], tier: str) -> Dict[str, Any]:
+    tier_counters[tier] += 1
+    update = {
+        "risk_score": result.get("risk_score", 50),
+        "analysis": result.get("analysis", {}),
+        "detected_tactics": result.get("detected_tactics", []),
+        "confidence": result.get("confidence", 0.5),
+        "analysis_tier": tier,
+        "agents_involved": ["analyzer"]
     }
+    if tier == "deadline":
+        update["degraded_stages"] = ["llm"]
+    return update
 
 
-async def analyzer_agent(state: AgentState) -> AgentState:
-    """Analyze message with Gemini LLM, with retry logic for rate limiting."""
-    import asyncio
-    
-    logger.info("Analyzer Agent: Analyzing message with Gemini")
+async def store_gemini_result(message: str, urls: List[str], fingerprint: int, result: Dict[str, Any]) -> Dict[str, Any]:
+    cacheable = {field: result[field] for field in CACHED_FIELDS if field in result}
+    await set_cached_analysis(message, urls, cacheable)
+    remember_analysis(fingerprint, cacheable)
+    return cacheable
+
+
+def routing_tier(message: str) -> str:
+    """Short messages go to the fast model when one is configured."""
+    if gemini_pool.has_tier(FAST_TIER) and len(message) <= settings.GEMINI_FAST_MAX_CHARS:
+        return FAST_TIER
+    return MAIN_TIER
+
+
+def needs_escalation(tier: str, result: Dict[str, Any]) -> bool:
+    confidence = result.get("confidence", 0)
+    if not isinstance(confidence, (int, float)):
+        confidence = 0
+    return tier == FAST_TIER and confidence < settings.GEMINI_ESCALATE_BELOW_CONFIDENCE
+
+
+async def store_streamed_result(message: str, urls: List[str], fingerprint: int, tier: str, response_text: str):
+    result = parse_llm_response(response_text)
+    if result is None or needs_escalation(tier, result):
+        return
+    try:
+        await store_gemini_result(message, urls, fingerprint, result)
+    except Exception as e:
+        logger.warning(f"Could not cache streamed analysis: {type(e).__name__}: {e}")
+
+
+async def analyze_with_gemini(
+    sender: str,
+    message: str,
+    urls: List[str],
+    fingerprint: int,
+    priority: int = PRIORITY_INTERACTIVE
+) -> Optional[Dict[str, Any]]:
+    """
+    Call Gemini behind the circuit breaker and cache the parsed result.
+    Returns None if the reply can't be parsed; raises CircuitOpenError without
+    calling Gemini while the circuit is open.
+    """
+    if not gemini_breaker.allow_request():
+        raise CircuitOpenError("Gemini circuit is open")
+    try:
+        result = await request_gemini_analysis(sender, message, urls, fingerprint, priority)
+    except (GovernorTimeout, CircuitOpenError, asyncio.CancelledError):
+        # queueing locally, or a caller giving up, says nothing about Gemini's health
+        gemini_breaker.release_probe()
+        raise
+    except Exception:
+        gemini_breaker.record_failure()
+        raise
+    gemini_breaker.record_success()
+    return result
+
+
+async def request_gemini_analysis(
+    sender: str,
+    message: str,
+    urls: List[str],
+    fingerprint: int,
+    priority: int
+) -> Optional[Dict[str, Any]]:
+    """Gemini call through the governor with rate-limit retries; raises once retries are exhausted."""
+    if settings.LLM_BATCH_ENABLED:
+        result = await gemini_batcher.submit(sender, message, urls, priority)
+        if result is not None:
+            return await store_gemini_result(message, urls, fingerprint, result)
     
-    llm = get_llm()
-    user_prompt = get_analysis_prompt(
-        sender=state['sender'],
-        message=state['message'],
-        urls=state.get('urls', [])
-    )
+    tier = routing_tier(message)
+    result = await request_tier_analysis(tier, sender, message, urls, fingerprint, priority)
+    if result is not None and needs_escalation(tier, result):
+        logger.info(f"Fast model confidence {result.get('confidence')} too low, escalating")
+        gemini_pool.counters["escalations"] += 1
+        result = await request_tier_analysis(MAIN_TIER, sender, message, urls, fingerprint, priority)
+    return result
+
+
+async def request_tier_analysis(
+    tier: str,
+    sender: str,
+    message: str,
+    urls: List[str],
+    fingerprint: int,
+    priority: int
+) -> Optional[Dict[str, Any]]:
+    """
+    One analysis on a pooled client of the tier, picked again on every
+    attempt so a rate-limited key is routed around. Results that will be
+    escalated are returned without caching.
+    """
+    messages = [
+        SystemMessage(content=SCAM_ANALYSIS_SYSTEM_PROMPT),
+        HumanMessage(content=get_analysis_prompt(sender=sender, message=message, urls=urls))
+    ]
+    estimated_tokens = estimate_tokens(m.content for m in messages) + settings.GEMINI_MAX_TOKENS
     
     max_retries = 3
-    retry_delay = 5  # seconds
     
     for attempt in range(max_retries):
+        if attempt > 0 and gemini_breaker.state == OPEN:
+            raise CircuitOpenError("Gemini circuit opened while retrying")
+        llm = get_llm(tier)
         try:
-            response = await llm.ainvoke([
-                SystemMessage(content=SCAM_ANALYSIS_SYSTEM_PROMPT),
-                HumanMessage(content=user_prompt)
-            ])
-            
-            raw_content = response.content
-            logger.info(f"Gemini response received (attempt {attempt + 1})")
-
-            
-            result = parse_llm_response(raw_content)
-            if result is None:
-                logger.error(f"Failed to parse LLM response")
-                result = get_default_analysis()
-            
-            return {
-                **state,
-                "risk_score": result.get("risk_score", 50),
-                "analysis": result.get("analysis", {}),
-                "detected_tactics": result.get("detected_tactics", []),
-                "confidence": result.get("confidence", 0.5)
-            }
-            
+            if settings.LLM_STREAMING_ENABLED:
+                early, response_text = await stream_until_decision(
+                    llm, messages, STREAM_DECISION_FIELDS, priority, estimated_tokens,
+                    lambda text: store_streamed_result(message, urls, fingerprint, tier, text)
+                )
+            else:
+                call = lambda: llm_governor.run(lambda: llm.ainvoke(messages), priority, estimated_tokens)
+                response = await (gemini_hedger.run(call) if settings.LLM_HEDGING_ENABLED else call())
+                early, response_text = None, response.content
+        except GovernorTimeout:
+            raise
         except Exception as e:
-            error_str = str(e).lower()
+            # the governor has already backed off for everyone; just requeue
+            if is_rate_limit_error(e) and attempt < max_retries - 1:
+                logger.warning(f"Rate limited by Gemini API, requeueing (attempt {attempt + 1}/{max_retries})")
+                continue
             
-            # Check for rate limiting errors
-            if "429" in error_str or "rate" in error_str or "quota" in error_str or "resource" in error_str:
-                if attempt < max_retries - 1:
-                    wait_time = retry_delay * (2 ** attempt)  # Exponential backoff
-                    logger.warning(f"Rate limited. Retrying in {wait_time}s... (attempt {attempt + 1}/{max_retries})")
-                    logger.warning(f"Rate limited by Gemini API. Waiting {wait_time}s before retry...")
-                    await asyncio.sleep(wait_time)
-                    continue
-            
-            # Log the error
-            import traceback
-            traceback.print_exc()
             logger.error(f"Analyzer error (attempt {attempt + 1}): {type(e).__name__}: {str(e)}")
-            
-            # On final attempt, use FALLBACK ANALYZER instead of 50%
             if attempt == max_retries - 1:
-                logger.info("Using fallback keyword-based analyzer")
-                logger.info("Gemini unavailable - using fallback keyword analyzer")
-                fallback_result = fallback_analyze(state['message'], state['sender'])
-                return {
-                    **state,
-                    "risk_score": fallback_result["risk_score"],
-                    "analysis": fallback_result["analysis"],
-                    "detected_tactics": fallback_result["detected_tactics"],
-                    "confidence": fallback_result["confidence"]
-                }
-    
-    # Should not reach here, but use fallback just in case
-    logger.info("Using fallback keyword-based analyzer (loop exit)")
-    fallback_result = fallback_analyze(state['message'], state['sender'])
-    return {
-        **state,
-        "risk_score": fallback_result["risk_score"],
-        "analysis": fallback_result["analysis"],
-        "detected_tactics": fallback_result["detected_tactics"],
-        "confidence": fallback_result["confidence"]
-    }
+                raise
+            continue
+        
+        if early is not None and not response_text:
+            # cached once the rest of the stream arrives
+            logger.info(f"Gemini decision streamed (attempt {attempt + 1})")
+            return early
+        
+        logger.info(f"Gemini response received (attempt {attempt + 1})")
+        result = parse_llm_response(response_text)
+        if result is None:
+            logger.error(f"Failed to parse LLM response")
+            return None
+        if needs_escalation(tier, result):
+            return result
+        
+        return await store_gemini_result(message, urls, fingerprint, result)
+
+
+async def analyzer_agent(state: AgentState) -> AgentState:
+    """Analyze message with the local scorer first, then Gemini for the ambiguous band."""
+    message = state['message']
+    sender = state['sender']
+    
+    if settings.CASCADE_ENABLED:
+        local_result = fallback_analyze(message, sender)
+        tier = local_decision_tier(local_result["risk_score"], local_result["confidence"])
+        if tier is not None:
+            logger.info(f"Analyzer Agent: Local score {local_result['risk_score']} decided without Gemini ({tier})")
+            return analysis_update(local_result, tier)
+        
+        model = get_local_model()
+        if model is not None:
+            model_result = model.analyze(message, local_result)
+            tier = model_decision_tier(model_result["risk_score"])
+            if tier is not None:
+                logger.info(f"Analyzer Agent: Local model score {model_result['risk_score']} decided without Gemini ({tier})")
+                return analysis_update(model_result, tier)
+    
+    urls = state.get('urls', [])
+    cached = await get_cached_analysis(message, urls)
+    if cached is not None:
+        logger.info("Analyzer Agent: Reusing cached Gemini analysis")
+        return analysis_update(cached, "cache")
+    
+    fingerprint = state.get('fingerprint', 0)
+    near_duplicate = find_near_duplicate(fingerprint)
+    if near_duplicate is not None:
+        logger.info("Analyzer Agent: Reusing analysis of a near-duplicate campaign message")
+        return analysis_update(near_duplicate, "near_duplicate")
+    
+    if not has_budget(state, settings.DEADLINE_LLM_MIN_MS):
+        logger.info("Analyzer Agent: Not enough budget left for Gemini - using local scorer")
+        return analysis_update(fallback_analyze(message, sender), "deadline")
+    
+    logger.info("Analyzer Agent: Analyzing message with Gemini")
+    
+    priority = PRIORITY_NAMES.get(state.get('priority', 'interactive'), PRIORITY_INTERACTIVE)
+    
+    def compute():
+        return analyze_with_gemini(sender, message, urls, fingerprint, priority)
+    
+    async def analyze():
+        if settings.SINGLE_FLIGHT_ENABLED:
+            return await single_flight(
+                analysis_cache_key(message, urls),
+                compute,
+                lookup=lambda: get_cached_analysis(message, urls),
+                timeout=settings.SINGLE_FLIGHT_TIMEOUT_SECONDS,
+                lock_ttl=settings.SINGLE_FLIGHT_LOCK_TTL_SECONDS
+            )
+        return await compute(), False
+    
+    try:
+        # a call that outlives this request still lands in the cache, and other waiters keep it
+        answer, late = await within_deadline_detached(state, analyze(), None, "llm")
+    except CircuitOpenError:
+        logger.info("Gemini circuit open - using fallback keyword analyzer")
+        return analysis_update(fallback_analyze(message, sender), "circuit_open")
+    except Exception as e:
+        logger.error(f"Gemini unavailable ({type(e).__name__}: {e}) - using fallback keyword analyzer")
+        return analysis_update(fallback_analyze(message, sender), "fallback")
+    
+    if late:
+        return analysis_update(fallback_analyze(message, sender), "deadline")
+    result, shared = answer
+    if result is None:
+        result = get_default_analysis()
+    return analysis_update(result, "coalesced" if shared else "llm")
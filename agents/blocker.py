@@ -6,6 +6,10 @@ from typing import List
 from models.scam import AgentState
 from services import database
 from services.elasticsearch_client import log_incident, update_scam_number
+from services.deadline import within_deadline_detached
+from services.user_stats import record_block, record_incident, utc_midnight
+from services.phone_numbers import phone_number_key
+from agents.pattern import calculate_pattern_confidence
 from config.settings import settings
 
 logger = logging.getLogger("scamshield.agents.blocker")
@@ -18,8 +22,9 @@ def determine_decision(state: AgentState) -> str:
     
     known_scammer = state.get('known_scammer', False)
     url_malicious = state.get('url_malicious', False)
+    sender_blocked = state.get('sender_blocked', False)
     
-    if final_score > settings.RISK_SCORE_BLOCK_THRESHOLD or known_scammer or url_malicious:
+    if final_score > settings.RISK_SCORE_BLOCK_THRESHOLD or known_scammer or url_malicious or sender_blocked:
         return "BLOCK"
     elif final_score > settings.RISK_SCORE_WARN_THRESHOLD:
         return "WARN"
@@ -27,25 +32,53 @@ def determine_decision(state: AgentState) -> str:
         return "PASS"
 
 
+def blocks_on_sender_evidence(state: AgentState) -> bool:
+    """
+    True if the message is blocked without its reported body numbers and
+    without the sender being on this user's blocklist. Body numbers count
+    against the message, and one user's blocklist is that user's choice;
+    neither alone puts the sender into scam_numbers for everyone.
+    """
+    sender_confidence = calculate_pattern_confidence(
+        known_scammer=state.get('known_scammer', False),
+        previous_reports=state.get('previous_reports', 0),
+        url_malicious=state.get('url_malicious', False),
+        similar_patterns=state.get('similar_patterns', [])
+    )
+    return determine_decision({**state, "pattern_confidence": sender_confidence, "sender_blocked": False}) == "BLOCK"
+
+
 def hash_message(message: str) -> str:
     return hashlib.sha256(message.encode()).hexdigest()
 
 
 async def add_to_blocklist(user_id: str, sender: str, reason: str) -> bool:
+    # the same number written differently is one blocklist entry
+    identifier = phone_number_key(sender, settings.DEFAULT_PHONE_COUNTRY_CODE)
     try:
         async with database.db_pool.acquire() as conn:
-            await conn.execute("""
+            # the previous block time tells the stats counters whether this sender is new overall or for today
+            previous_blocked_at = await conn.fetchval("""
+                WITH previous AS (
+                    SELECT blocked_at FROM user_blocklist WHERE user_id = $1 AND blocked_identifier = $2
+                )
                 INSERT INTO user_blocklist 
                 (user_id, blocked_identifier, identifier_type, reason, auto_blocked)
                 VALUES ($1, $2, $3, $4, true)
                 ON CONFLICT (user_id, blocked_identifier) DO UPDATE 
                 SET reason = $4, blocked_at = NOW()
+                RETURNING (SELECT blocked_at FROM previous)
             """,
                 uuid.UUID(user_id),
-                sender,
-                'phone' if sender.startswith('+') or sender[0].isdigit() else 'email',
+                identifier,
+                'phone' if identifier.startswith('+') or identifier[0].isdigit() else 'email',
                 reason
             )
+        await record_block(
+            user_id,
+            new_identifier=previous_blocked_at is None,
+            new_today=previous_blocked_at is None or previous_blocked_at < utc_midnight()
+        )
         return True
     except Exception as e:
         logger.error(f"Failed to add to blocklist: {e}")
@@ -64,57 +97,71 @@ async def log_incident_to_es(state: AgentState, decision: str) -> bool:
         "message_hash": hash_message(state.get('message', '')),
         "risk_score": state.get('risk_score', 0),
         "decision": decision,
-        "agents_involved": ["watcher", "analyzer", "pattern", "alerter", "blocker"],
+        "agents_involved": state.get('agents_involved', []) + ["blocker"],
         "actions_taken": state.get('actions_taken', []),
+        "degraded_stages": state.get('degraded_stages', []),
         "processing_time_ms": processing_time
     }
-    return await log_incident(incident)
+    if not await log_incident(incident):
+        return False
+    await record_incident(incident["user_id"], decision, incident["risk_score"], incident["timestamp"])
+    return True
 
 
 async def blocker_agent(state: AgentState) -> AgentState:
     logger.info("Blocker Agent: Taking protective actions")
     
     actions_taken: List[str] = []
+    degraded: List[str] = []
     blocked = False
     logged = False
     community_updated = False
     
+    async def write(stage: str, call) -> bool:
+        # writes past the deadline still finish, the response just doesn't wait for them
+        done, late = await within_deadline_detached(state, call, False, stage)
+        if late:
+            degraded.append(stage)
+        return done
+    
     final_decision = determine_decision(state)
     
     if final_decision == "BLOCK":
         reason = f"Auto-blocked: Risk score {state.get('risk_score', 0)}"
-        blocked = await add_to_blocklist(
+        blocked = await write("blocklist_write", add_to_blocklist(
             user_id=state.get('user_id', ''),
             sender=state.get('sender', ''),
             reason=reason
-        )
+        ))
         if blocked:
             actions_taken.append("sender_blocked")
         
-        logged = await log_incident_to_es(state, final_decision)
+        logged = await write("incident_log", log_incident_to_es(state, final_decision))
         if logged:
             actions_taken.append("incident_logged")
         
-        community_updated = await update_scam_number(
-            phone_number=state.get('sender', ''),
-            scam_types=state.get('detected_tactics', ['unknown']),
-            risk_score=state.get('risk_score', 0)
-        )
-        if community_updated:
-            actions_taken.append("community_database_updated")
+        if blocks_on_sender_evidence(state):
+            community_updated = await write("community_update", update_scam_number(
+                phone_number=state.get('sender', ''),
+                scam_types=state.get('detected_tactics', ['unknown']),
+                risk_score=state.get('risk_score', 0)
+            ))
+            if community_updated:
+                actions_taken.append("community_database_updated")
     
     elif final_decision == "WARN":
-        logged = await log_incident_to_es(state, final_decision)
+        logged = await write("incident_log", log_incident_to_es(state, final_decision))
         if logged:
             actions_taken.append("warning_logged")
     else:
         actions_taken.append("passed")
     
     return {
-        **state,
         "final_decision": final_decision,
         "blocked": blocked,
         "logged": logged,
         "community_updated": community_updated,
-        "actions_taken": actions_taken
+        "actions_taken": actions_taken,
+        "agents_involved": ["blocker"],
+        "degraded_stages": degraded
     }
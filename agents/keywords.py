@@ -0,0 +1,356 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Optional, Dict, Any, List, NamedTuple
+import numpy as np
+from config.settings import settings
+
+logger = logging.getLogger("scamshield.agents.keywords")
+
+# joins messages for batch scans; no keyword can match across it
+BATCH_SEPARATOR = "\x00"
+
+ANALYSIS_FIELDS = ("urgency_indicators", "authority_claims", "threats_found", "suspicious_elements")
+
+DEFAULT_TACTIC_RULES: List[Dict[str, Any]] = [
+    {"tactic": "URGENCY", "score": 20, "field": "urgency_indicators", "label": "{keyword}",
+     "keywords": ["urgent", "immediately", "act now", "limited time", "expires", "hurry", "asap", "right now"]},
+    {"tactic": "AUTHORITY", "score": 25, "field": "authority_claims", "label": "{keyword}",
+     "keywords": ["irs", "bank", "police", "government", "social security", "fbi", "ssa", "tax", "citibank", "chase", "wells fargo"]},
+    {"tactic": "THREATS", "score": 25, "field": "threats_found", "label": "{keyword}",
+     "keywords": ["suspended", "arrested", "legal action", "account closed", "warrant", "jail", "prosecute", "terminate"]},
+    {"tactic": "TOO_GOOD", "score": 20, "field": "suspicious_elements", "label": "{keyword}",
+     "keywords": ["you won", "winner", "lottery", "free money", "inheritance", "million", "prize", "congratulations"]},
+    {"tactic": "INFO_REQUEST", "score": 20, "field": "suspicious_elements", "label": "Requests: {keyword}",
+     "keywords": ["ssn", "social security", "password", "otp", "bank details", "credit card", "account number", "pin"]},
+    {"tactic": "SUSPICIOUS_URLS", "score": 15, "field": "suspicious_elements", "label": "Suspicious URL: {keyword}",
+     "keywords": ["bit.ly", "tinyurl", "goo.gl", "t.co", "-verify", "-secure", "-login"]},
+]
+
+
+class KeywordMatch(NamedTuple):
+    keyword: str
+    start: int
+    end: int
+
+
+def keyword_confidence(scores):
+    """Confidence of keyword scores (an int or an array): keywords can show risk, never its absence."""
+    return np.where(np.asarray(scores) > 50, 0.8, 0.5)
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+# character classes for batch scans
+WORD_CHAR = 1
+KEYWORD_START = 2
+
+ASCII_WORD_CHARS = np.array([_is_word_char(chr(code)) for code in range(128)], dtype=bool)
+
+
+def _word_char_mask(codes: np.ndarray) -> np.ndarray:
+    """Vectorized _is_word_char over code points."""
+    mask = np.zeros(len(codes), dtype=bool)
+    ascii_chars = codes < 128
+    mask[ascii_chars] = ASCII_WORD_CHARS[codes[ascii_chars]]
+    others = ~ascii_chars
+    unique = np.unique(codes[others])
+    word_codes = unique[[_is_word_char(chr(code)) for code in unique]]
+    mask[others] = np.isin(codes[others], word_codes)
+    return mask
+
+
+def _compile_trie(keywords: List[str]) -> str:
+    """
+    Compile keywords into one regex shaped like their trie, so matching
+    every keyword is a single left-to-right pass inside the re engine.
+    Keywords that start or end with a word character only match on word
+    boundaries ("pin" does not match inside "shopping").
+    """
+    trie: Dict[str, Any] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = keyword
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if "" in node:
+            # longer keywords are tried first, this one last
+            branches.append(r"(?!\w)" if _is_word_char(node[""][-1]) else "")
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+    word_start = {char: child for char, child in trie.items() if _is_word_char(char)}
+    other_start = {char: child for char, child in trie.items() if not _is_word_char(char)}
+    alternatives = []
+    if word_start:
+        alternatives.append(r"(?<!\w)" + build(word_start))
+    if other_start:
+        alternatives.append(build(other_start))
+    return "|".join(alternatives)
+
+
+def validate_rules(rules: Any) -> List[Dict[str, Any]]:
+    if not isinstance(rules, list) or not rules:
+        raise ValueError("keyword rules must be a non-empty list")
+    for rule in rules:
+        if not isinstance(rule.get("tactic"), str) or not isinstance(rule.get("score"), int):
+            raise ValueError(f"rule needs a tactic name and an integer score: {rule}")
+        if rule.get("field") not in ANALYSIS_FIELDS:
+            raise ValueError(f"rule field must be one of {ANALYSIS_FIELDS}: {rule}")
+        if not rule.get("keywords") or not all(isinstance(k, str) and k.strip() and BATCH_SEPARATOR not in k for k in rule["keywords"]):
+            raise ValueError(f"rule needs a non-empty keyword list: {rule}")
+    return rules
+
+
+class KeywordEngine:
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self.rules = validate_rules(rules)
+        # keyword -> (rule index, position of the keyword within that rule)
+        self.owners: Dict[str, List[tuple]] = {}
+        for rule_index, rule in enumerate(self.rules):
+            for position, keyword in enumerate(rule["keywords"]):
+                self.owners.setdefault(keyword.lower(), []).append((rule_index, position))
+        keywords = list(self.owners)
+        # shorter keywords that start where a longer one matched ("bank" in "bank details")
+        self.prefixes = {
+            keyword: [other for other in keywords if other != keyword and keyword.startswith(other)]
+            for keyword in keywords
+        }
+        self.pattern = re.compile(_compile_trie(keywords))
+        self.rule_scores = np.array([rule["score"] for rule in self.rules], dtype=np.int64)
+        self.longest = max(len(keyword) for keyword in keywords)
+        self.first_chars = {keyword[0] for keyword in keywords}
+        # batch scan tables for ASCII text: a class byte per character and the
+        # two-character prefixes (first << 8 | second) that can begin a keyword
+        self.ascii_classes = bytes(
+            (WORD_CHAR if _is_word_char(chr(code)) else 0) | (KEYWORD_START if chr(code) in self.first_chars else 0)
+            for code in range(256)
+        )
+        self.ascii_prefixes = np.zeros(1 << 16, dtype=bool)
+        for keyword in keywords:
+            if not keyword.isascii():
+                continue
+            if len(keyword) == 1:
+                self.ascii_prefixes[ord(keyword) << 8:(ord(keyword) + 1) << 8] = True
+            else:
+                self.ascii_prefixes[ord(keyword[0]) << 8 | ord(keyword[1])] = True
+
+    def scan(self, text: str) -> List[KeywordMatch]:
+        """All keyword occurrences in text (lowercased) with offsets, including overlapping ones."""
+        matches = []
+        position = 0
+        search = self.pattern.search
+        while (found := search(text, position)) is not None:
+            start, end = found.span()
+            keyword = text[start:end]
+            matches.append(KeywordMatch(keyword, start, end))
+            for prefix in self.prefixes[keyword]:
+                prefix_end = start + len(prefix)
+                if not (_is_word_char(prefix[-1]) and _is_word_char(text[prefix_end])):
+                    matches.append(KeywordMatch(prefix, start, prefix_end))
+            position = start + 1
+        return matches
+
+    def score_batch(self, messages: List[str]) -> np.ndarray:
+        """
+        Risk scores for many messages, equal to analyze(m)["risk_score"] for each.
+
+        The messages are joined into one lowercased text and turned into code
+        point and character class arrays. Positions where a keyword could
+        start are found in a few vectorized passes and bucketed by their first
+        two characters with one sort. Each keyword then starts from its bucket
+        (or from the matches of its longest keyword prefix) and is narrowed
+        one character at a time with array comparisons. Rule hits are summed
+        as a messages x rules matrix.
+        """
+        if not messages:
+            return np.zeros(0, dtype=np.int64)
+        # NUL is neither cased nor a word character, so lowering the joined text
+        # lowers each message exactly as analyze() does; the padding lets
+        # comparisons run past either end
+        padding = BATCH_SEPARATOR * (self.longest + 1)
+        text = BATCH_SEPARATOR + BATCH_SEPARATOR.join(messages).lower() + padding
+        if text.isascii():
+            raw = text.encode("ascii")
+            codes = np.frombuffer(raw, dtype=np.uint8)
+            classes = np.frombuffer(raw.translate(self.ascii_classes), dtype=np.uint8)
+            shift = 8
+        else:
+            codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+            first_codes = np.array([ord(char) for char in self.first_chars])
+            classes = _word_char_mask(codes) * WORD_CHAR | np.isin(codes, first_codes) * KEYWORD_START
+            shift = 21
+        separators = np.flatnonzero(codes == 0)
+        if len(separators) != len(messages) + len(padding):
+            # a message containing the separator would shift every row after it
+            inside = np.array([BATCH_SEPARATOR in message for message in messages])
+            scores = np.zeros(len(messages), dtype=np.int64)
+            scores[~inside] = self.score_batch([m for m, bad in zip(messages, inside) if not bad])
+            scores[inside] = [self.analyze(m)["risk_score"] for m, bad in zip(messages, inside) if bad]
+            return scores
+
+        # keyword starts: word characters after a non-word character, or any non-word keyword start
+        current, previous = classes[1:], classes[:-1]
+        candidates = np.flatnonzero(
+            ((current == WORD_CHAR | KEYWORD_START) & (previous & WORD_CHAR == 0)) | (current == KEYWORD_START)
+        ) + 1
+        prefixes = (codes[candidates].astype(np.uint16 if shift == 8 else np.int64) << shift) | codes[candidates + 1]
+        if shift == 8:
+            wanted = np.flatnonzero(self.ascii_prefixes[prefixes])
+            candidates, prefixes = candidates.take(wanted), prefixes.take(wanted)
+        order = np.argsort(prefixes, kind="stable")
+        candidates, prefixes = candidates[order], prefixes[order]
+        max_code = (1 << shift) - 1
+
+        # keyword -> start positions before the right-boundary check; sorted order puts prefixes first
+        occurrences: Dict[str, np.ndarray] = {}
+        hits = np.zeros((len(messages), len(self.rules)), dtype=bool)
+        for keyword in sorted(self.owners):
+            if any(ord(char) > max_code for char in keyword):
+                continue
+            known = [prefix for prefix in self.prefixes[keyword] if prefix in occurrences]
+            if known:
+                base = max(known, key=len)
+                positions, matched = occurrences[base], len(base)
+            else:
+                low = ord(keyword[0]) << shift
+                high = low + (1 << shift)
+                if len(keyword) > 1:
+                    low |= ord(keyword[1])
+                    high = low + 1
+                start, end = np.searchsorted(prefixes, np.array([low, high], dtype=prefixes.dtype))
+                positions, matched = candidates[start:end], min(2, len(keyword))
+            for offset in range(matched, len(keyword)):
+                if not len(positions):
+                    break
+                positions = positions[codes[positions + offset] == ord(keyword[offset])]
+            occurrences[keyword] = positions
+            if _is_word_char(keyword[-1]):
+                positions = positions[classes[positions + len(keyword)] & WORD_CHAR == 0]
+            if not len(positions):
+                continue
+            rows = np.searchsorted(separators, positions) - 1
+            for rule_index, _ in self.owners[keyword]:
+                hits[rows, rule_index] = True
+        return np.minimum(100, hits @ self.rule_scores)
+
+    def analyze(self, message: str) -> Dict[str, Any]:
+        matches = self.scan(message.lower())
+
+        # for each rule, the matched keyword listed first in that rule wins
+        best: Dict[int, tuple] = {}
+        for match in matches:
+            for rule_index, position in self.owners[match.keyword]:
+                if rule_index not in best or position < best[rule_index][0]:
+                    best[rule_index] = (position, match.keyword)
+
+        score = 0
+        tactics = []
+        analysis = {field: [] for field in ANALYSIS_FIELDS}
+        for rule_index, rule in enumerate(self.rules):
+            if rule_index not in best:
+                continue
+            keyword = best[rule_index][1]
+            score += rule["score"]
+            if rule["tactic"] not in tactics:
+                tactics.append(rule["tactic"])
+            analysis[rule["field"]].append(rule.get("label", "{keyword}").format(keyword=keyword))
+
+        score = min(100, score)
+        return {
+            "risk_score": score,
+            "detected_tactics": tactics,
+            "analysis": analysis,
+            "confidence": float(keyword_confidence(score)),
+            "explanation": f"Fallback analysis: detected {len(best)} scam indicators",
+            "matches": [match._asdict() for match in matches]
+        }
+
+
+active_engine = KeywordEngine(DEFAULT_TACTIC_RULES)
+rules_source = {"origin": "default", "mtime": None}
+refresh_task: Optional[asyncio.Task] = None
+
+
+def get_keyword_engine() -> KeywordEngine:
+    return active_engine
+
+
+def set_keyword_rules(rules: List[Dict[str, Any]], origin: str) -> bool:
+    """Build a new engine and swap it in; the old one keeps serving if the rules are invalid."""
+    global active_engine
+    try:
+        engine = KeywordEngine(rules)
+    except (ValueError, KeyError, TypeError, AttributeError, re.error) as e:
+        logger.error(f"Rejected keyword rules from {origin}: {e}")
+        return False
+    active_engine = engine
+    rules_source["origin"] = origin
+    logger.info(f"Keyword engine reloaded from {origin}: {len(engine.owners)} keywords in {len(engine.rules)} rules")
+    return True
+
+
+def reload_rules_from_file(path: str) -> bool:
+    try:
+        mtime = os.path.getmtime(path)
+        if rules_source["origin"] == path and rules_source["mtime"] == mtime:
+            return False
+        with open(path, encoding="utf-8") as handle:
+            rules = json.load(handle)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error(f"Could not read keyword rules from {path}: {e}")
+        return False
+    if set_keyword_rules(rules, origin=path):
+        rules_source["mtime"] = mtime
+        return True
+    return False
+
+
+async def reload_rules_from_es() -> bool:
+    from services import elasticsearch_client
+    try:
+        result = await elasticsearch_client.es_client.search(
+            index=settings.KEYWORD_RULES_INDEX,
+            query={"match_all": {}},
+            size=1000
+        )
+        rules = [hit["_source"] for hit in result["hits"]["hits"]]
+    except Exception as e:
+        logger.error(f"Could not load keyword rules from Elasticsearch: {e}")
+        return False
+    if rules == active_engine.rules:
+        return False
+    return set_keyword_rules(rules, origin=f"es:{settings.KEYWORD_RULES_INDEX}")
+
+
+async def refresh_keyword_rules():
+    if settings.KEYWORD_RULES_PATH:
+        reload_rules_from_file(settings.KEYWORD_RULES_PATH)
+    elif settings.KEYWORD_RULES_FROM_ES:
+        await reload_rules_from_es()
+
+
+async def _refresh_loop():
+    while True:
+        await asyncio.sleep(settings.KEYWORD_REFRESH_INTERVAL_SECONDS)
+        await refresh_keyword_rules()
+
+
+async def start_keyword_refresh():
+    global refresh_task
+    await refresh_keyword_rules()
+    if settings.KEYWORD_RULES_PATH or settings.KEYWORD_RULES_FROM_ES:
+        refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def stop_keyword_refresh():
+    global refresh_task
+    if refresh_task:
+        refresh_task.cancel()
+        refresh_task = None
@@ -0,0 +1,145 @@
+import json
+import logging
+import re
+import zipfile
+import zlib
+from itertools import chain
+from typing import Optional, Dict, Any, List, Tuple
+import numpy as np
+from agents.watcher import mask_volatile_tokens_batch
+
+logger = logging.getLogger("scamshield.agents.local_model")
+
+MODEL_FORMAT_VERSION = 1
+DEFAULT_FEATURE_BITS = 18
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?|[!?$€£₹]")
+
+
+def batch_features(messages: List[str], feature_bits: int = DEFAULT_FEATURE_BITS) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sparse feature matrix for messages as (row ids, bucket indices, values):
+    hashed word unigrams and bigrams of each masked message, with
+    L2-normalized presence values so long messages don't score higher just
+    for having more words. crc32 keeps buckets stable across processes,
+    unlike hash(). Entries are sorted by row, then bucket.
+    """
+    mask = (1 << feature_bits) - 1
+    buckets: Dict[str, int] = {}
+    keys = []
+    for row, text in enumerate(mask_volatile_tokens_batch(messages)):
+        tokens = TOKEN_PATTERN.findall(text)
+        for gram in chain(tokens, map(" ".join, zip(tokens, tokens[1:]))):
+            bucket = buckets.get(gram)
+            if bucket is None:
+                bucket = buckets[gram] = zlib.crc32(gram.encode()) & mask
+            keys.append((row << feature_bits) | bucket)
+    keys = np.unique(np.array(keys, dtype=np.int64))
+    row_ids = keys >> feature_bits
+    indices = keys & mask
+    counts = np.bincount(row_ids, minlength=len(messages))
+    values = 1.0 / np.sqrt(counts[row_ids])
+    return row_ids, indices, values
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+def train_logistic_regression(
+    messages: List[str],
+    labels: List[int],
+    feature_bits: int = DEFAULT_FEATURE_BITS,
+    epochs: int = 500,
+    learning_rate: float = 5.0,
+    l2: float = 1e-4
+) -> "LocalModel":
+    """Full-batch gradient descent on hashed features; labels are 1 for scam, 0 for legitimate."""
+    row_ids, indices, values = batch_features(messages, feature_bits)
+    y = np.asarray(labels, dtype=np.float64)
+    n = len(y)
+    weights = np.zeros(1 << feature_bits, dtype=np.float64)
+    bias = 0.0
+    for _ in range(epochs):
+        logits = np.bincount(row_ids, weights=weights[indices] * values, minlength=n) + bias
+        error = _sigmoid(logits) - y
+        gradient = np.bincount(indices, weights=error[row_ids] * values, minlength=len(weights)) / n
+        weights -= learning_rate * (gradient + l2 * weights)
+        bias -= learning_rate * error.mean()
+    return LocalModel(weights.astype(np.float32), float(bias), feature_bits)
+
+
+class LocalModel:
+    """Hashed n-gram logistic regression; scores one message in well under a millisecond on CPU."""
+
+    def __init__(self, weights: np.ndarray, bias: float, feature_bits: int, metadata: Optional[Dict[str, Any]] = None):
+        self.weights = weights
+        self.bias = bias
+        self.feature_bits = feature_bits
+        self.metadata = metadata or {}
+
+    def predict_proba(self, message: str) -> float:
+        # same arithmetic as the batch path, so both give identical scores
+        return float(self.predict_proba_batch([message])[0])
+
+    def predict_proba_batch(self, messages: List[str]) -> np.ndarray:
+        """Scam probabilities for many messages as one sparse matrix-vector product."""
+        row_ids, indices, values = batch_features(messages, self.feature_bits)
+        logits = np.bincount(row_ids, weights=self.weights[indices] * values, minlength=len(messages))
+        return _sigmoid(logits + self.bias)
+
+    def analyze(self, message: str, keyword_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Model probability as the risk score; tactics and indicators come from the keyword scan."""
+        probability = self.predict_proba(message)
+        return {
+            "risk_score": int(round(probability * 100)),
+            "detected_tactics": keyword_result.get("detected_tactics", []),
+            "analysis": keyword_result.get("analysis", {}),
+            "confidence": round(max(probability, 1 - probability), 3),
+            "explanation": f"Local model: scam probability {probability:.2f}"
+        }
+
+    def save(self, path: str):
+        """Only non-zero weights are stored, so the file stays small however many buckets there are."""
+        nonzero = np.flatnonzero(self.weights)
+        metadata = {**self.metadata, "format_version": MODEL_FORMAT_VERSION, "feature_bits": self.feature_bits, "bias": self.bias}
+        with open(path, "wb") as handle:
+            np.savez_compressed(
+                handle,
+                indices=nonzero.astype(np.uint32),
+                values=self.weights[nonzero].astype(np.float32),
+                metadata=np.frombuffer(json.dumps(metadata).encode(), dtype=np.uint8)
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "LocalModel":
+        with np.load(path) as data:
+            metadata = json.loads(data["metadata"].tobytes().decode())
+            if metadata.get("format_version") != MODEL_FORMAT_VERSION:
+                raise ValueError(f"unsupported local model format: {metadata.get('format_version')}")
+            feature_bits = metadata["feature_bits"]
+            weights = np.zeros(1 << feature_bits, dtype=np.float32)
+            weights[data["indices"]] = data["values"]
+        return cls(weights, metadata["bias"], feature_bits, metadata)
+
+
+local_model: Optional[LocalModel] = None
+
+
+def get_local_model() -> Optional[LocalModel]:
+    return local_model
+
+
+def load_local_model(path: Optional[str]) -> bool:
+    """Load the model at startup; without one the analyzer goes straight from keywords to Gemini."""
+    global local_model
+    if not path:
+        return False
+    try:
+        local_model = LocalModel.load(path)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        logger.error(f"Could not load local model from {path}: {type(e).__name__}: {e}")
+        local_model = None
+        return False
+    logger.info(f"Local model loaded from {path} (trained {local_model.metadata.get('trained_at', 'unknown')})")
+    return True
@@ -1,11 +1,9 @@
 import logging
 from typing import Dict, Any, List
 from models.scam import AgentState
-from services.elasticsearch_client import (
-    search_scam_number,
-    search_malicious_url,
-    search_similar_patterns
-)
+from config.settings import settings
+from services.elasticsearch_client import search_similar_patterns
+from services.deadline import has_budget, within_deadline
 
 logger = logging.getLogger("scamshield.agents.pattern")
 
@@ -14,53 +12,52 @@ def calculate_pattern_confidence(
     known_scammer: bool,
     previous_reports: int,
     url_malicious: bool,
-    similar_patterns: List[Dict[str, Any]]
+    similar_patterns: List[Dict[str, Any]],
+    number_reported: bool = False
 ) -> int:
     confidence = 0
     if known_scammer:
         confidence += 40
     if url_malicious:
         confidence += 30
+    # a reported number in the body is evidence about the message, not the sender: legitimate warnings quote them too
+    if number_reported:
+        confidence += 30
     confidence += min(30, len(similar_patterns) * 10)
     confidence += min(20, previous_reports * 0.5)
     return min(100, int(confidence))
 
 
 async def pattern_agent(state: AgentState) -> AgentState:
-    logger.info("Pattern Agent: Searching Elasticsearch for matches")
+    logger.info("Pattern Agent: Searching Elasticsearch for similar patterns")
     
-    known_scammer = False
-    previous_reports = 0
+    # sender and URL lookups already ran in the screener
+    known_scammer = state.get('known_scammer', False)
+    previous_reports = state.get('previous_reports', 0)
+    url_malicious = state.get('url_malicious', False)
     similar_patterns = []
-    url_malicious = False
-    
-    sender_result = await search_scam_number(state['sender'])
-    if sender_result:
-        known_scammer = True
-        previous_reports = sender_result.get('report_count', 0)
-    
-    urls = state.get('urls', [])
-    for url in urls:
-        if await search_malicious_url(url):
-            url_malicious = True
-            break
+    degraded = []
     
     message = state.get('message', '')
-    if message:
-        similar_patterns = await search_similar_patterns(message, size=5)
+    if message and not has_budget(state, settings.DEADLINE_PATTERN_SEARCH_MIN_MS):
+        logger.info("Pattern Agent: Not enough budget left, skipping similar-pattern search")
+        degraded.append("pattern_search")
+    elif message:
+        similar_patterns, late = await within_deadline(state, search_similar_patterns(message, size=5), [], "pattern_search")
+        if late:
+            degraded.append("pattern_search")
     
     pattern_confidence = calculate_pattern_confidence(
         known_scammer=known_scammer,
         previous_reports=previous_reports,
         url_malicious=url_malicious,
-        similar_patterns=similar_patterns
+        similar_patterns=similar_patterns,
+        number_reported=bool(state.get('reported_numbers'))
     )
     
     return {
-        **state,
-        "known_scammer": known_scammer,
-        "previous_reports": previous_reports,
         "similar_patterns": similar_patterns,
-        "url_malicious": url_malicious,
-        "pattern_confidence": pattern_confidence
+        "pattern_confidence": pattern_confidence,
+        "agents_involved": ["pattern"],
+        "degraded_stages": degraded
     }
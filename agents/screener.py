@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import uuid
+from models.scam import AgentState
+from services import database
+from services.elasticsearch_client import search_message_reputation
+from services.deadline import within_deadline
+from services.phone_numbers import phone_number_key
+from config.settings import settings
+from agents.pattern import calculate_pattern_confidence
+
+logger = logging.getLogger("scamshield.agents.screener")
+
+FAST_PATH = "fast_path"
+FULL_ANALYSIS = "full"
+
+
+async def is_sender_blocked(user_id: str, sender: str) -> bool:
+    """Blocklist entries are keyed with phone_number_key; rows written before that match as given."""
+    if database.db_pool is None or not user_id or not sender:
+        return False
+    identifiers = list(dict.fromkeys([phone_number_key(sender, settings.DEFAULT_PHONE_COUNTRY_CODE), sender]))
+    try:
+        async with database.db_pool.acquire() as conn:
+            row = await conn.fetchval(
+                "SELECT 1 FROM user_blocklist WHERE user_id = $1 AND blocked_identifier = ANY($2::varchar[]) LIMIT 1",
+                uuid.UUID(user_id),
+                identifiers
+            )
+        return row is not None
+    except Exception as e:
+        logger.error(f"Blocklist lookup failed: {e}")
+        return False
+
+
+def is_decision_settled(state: AgentState) -> bool:
+    """True when the deterministic checks alone force a BLOCK, whatever the LLM says."""
+    return (
+        state.get('known_scammer', False) or
+        state.get('url_malicious', False) or
+        state.get('sender_blocked', False)
+    )
+
+
+async def screener_agent(state: AgentState) -> AgentState:
+    logger.info("Screener Agent: Running deterministic checks")
+    
+    sender = state.get('sender', '')
+    urls = state.get('urls', [])
+    # sender, body number and URL lookups share one msearch; a lookup that runs out of budget counts as a miss
+    reputation = search_message_reputation(sender, state.get('phone_numbers', []), urls)
+    ((sender_result, reported_numbers, reported_urls), reputation_late), (sender_blocked, blocklist_late) = await asyncio.gather(
+        within_deadline(state, reputation, (None, [], []), "reputation_lookup"),
+        within_deadline(state, is_sender_blocked(state.get('user_id', ''), sender), False, "blocklist_lookup")
+    )
+    url_malicious = any(reported_urls)
+    degraded = [stage for stage, late in (("reputation_lookup", reputation_late), ("blocklist_lookup", blocklist_late)) if late]
+    
+    known_scammer = sender_result is not None
+    previous_reports = sender_result.get('report_count', 0) if sender_result else 0
+    
+    update = {
+        "known_scammer": known_scammer,
+        "previous_reports": previous_reports,
+        "url_malicious": url_malicious,
+        "reported_numbers": reported_numbers,
+        "sender_blocked": sender_blocked,
+        "agents_involved": ["screener"],
+        "degraded_stages": degraded
+    }
+    
+    if is_decision_settled(update):
+        logger.info("Screener Agent: Decision settled by deterministic checks, skipping LLM")
+        # the block comes from decision_path; the score stays what the checks measured, since
+        # the blocker passes it on to scam_numbers and the per-user risk average
+        pattern_confidence = calculate_pattern_confidence(
+            known_scammer=known_scammer,
+            previous_reports=previous_reports,
+            url_malicious=url_malicious,
+            similar_patterns=[],
+            number_reported=bool(reported_numbers)
+        )
+        update.update({
+            "decision_path": FAST_PATH,
+            "risk_score": pattern_confidence,
+            "pattern_confidence": pattern_confidence
+        })
+    else:
+        update["decision_path"] = FULL_ANALYSIS
+    return update
+
+
+def route_after_screening(state: AgentState):
+    if state.get('decision_path') == FAST_PATH:
+        return "alerter"
+    return ["analyzer", "pattern"]
@@ -1,8 +1,11 @@
 import re
+import hashlib
 import logging
 from datetime import datetime
 from typing import List
 from models.scam import AgentState
+from config.settings import settings
+from services.phone_numbers import canonicalize_phone_number
 
 logger = logging.getLogger("scamshield.agents.watcher")
 
@@ -30,15 +33,32 @@ def extract_urls(text: str) -> List[str]:
     return unique_urls
 
 
+PHONE_NUMBER_PATTERN = re.compile(
+    # international: + or 00, country code, then digit groups
+    r'(?:\+|\b00)[1-9][\d\s().-]{6,18}\d'
+    # NANP vanity numbers such as 1-800-SCAM-001; letters must be upper case
+    r'|(?:\+?\b1[-.\s]?)?\(?\b[2-9]\d{2}\)?[-.\s](?=[A-Z0-9-]*[A-Z])[A-Z0-9]{3,4}-?[A-Z0-9]{3,4}\b'
+    r'|\+?1?[-.\s]?\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}'
+    r'|\b\d{10}\b'
+)
+
+
+# digit runs labelled as references (Invoice #4155551234, Order no. ...) aren't phone numbers
+REFERENCE_LABEL = re.compile(r'(?:#|\b(?:ref|reference|invoice|inv|order|acct|account|txn|transaction|id|no)\b[.:#\s]*)\s*$', re.IGNORECASE)
+
+
 def extract_phone_numbers(text: str) -> List[str]:
-    patterns = [
-        r'\+?1?[-.\s]?\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}',
-        r'\b\d{10}\b',
-    ]
-    phones = []
-    for pattern in patterns:
-        phones.extend(re.findall(pattern, text))
-    return list(set(phones))
+    numbers = (
+        match.group().strip() for match in PHONE_NUMBER_PATTERN.finditer(text)
+        if not REFERENCE_LABEL.search(text[max(0, match.start() - 16):match.start()])
+    )
+    return list(dict.fromkeys(numbers))
+
+
+def canonical_phone_numbers(text: str) -> List[str]:
+    """Phone numbers in the text in E.164, in order of appearance and without repeats."""
+    numbers = (canonicalize_phone_number(raw, settings.DEFAULT_PHONE_COUNTRY_CODE) for raw in extract_phone_numbers(text))
+    return list(dict.fromkeys(number for number in numbers if number))
 
 
 def clean_content(text: str, urls: List[str]) -> str:
@@ -49,6 +69,64 @@ def clean_content(text: str, urls: List[str]) -> str:
     return content.strip()
 
 
+SIMHASH_BITS = 64
+MIN_FINGERPRINT_TOKENS = 5
+
+VOLATILE_TOKEN_PATTERNS = [
+    (re.compile(r'https?://\S+|\b(?:bit\.ly|goo\.gl|t\.co|tinyurl\.com)/\S+', re.IGNORECASE), ' urltoken '),
+    (re.compile(r'\b[\w.+-]+@[\w-]+\.[\w.-]+\b'), ' emailtoken '),
+    (re.compile(r'\+?1?[-.\s]?\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}'), ' phonetoken '),
+    (re.compile(r'[$€£₹]\s?\d[\d,]*(?:\.\d+)?|\b\d[\d,]*(?:\.\d+)?\s?(?:usd|dollars|eur|inr|rs)\b', re.IGNORECASE), ' amounttoken '),
+    (re.compile(r'\b(?:dear|hi|hello|hey|attn:?)\s+[A-Z][a-z]+', re.IGNORECASE), ' greetingtoken '),
+    (re.compile(r'\d+'), ' numtoken '),
+]
+
+# whitespace stops the URL pattern, the NUL stops every pattern that allows whitespace inside a match
+MASK_BATCH_SEPARATOR = ' \x00 '
+
+
+def mask_volatile_tokens(text: str) -> str:
+    """Replace names, amounts, numbers and links that vary between copies of one campaign."""
+    masked = text
+    for pattern, placeholder in VOLATILE_TOKEN_PATTERNS:
+        masked = pattern.sub(placeholder, masked)
+    return ' '.join(masked.lower().split())
+
+
+def mask_volatile_tokens_batch(texts: List[str]) -> List[str]:
+    """
+    mask_volatile_tokens for many texts with one regex pass per pattern over
+    the joined texts. No pattern can match across MASK_BATCH_SEPARATOR, so
+    each result equals mask_volatile_tokens(text).
+    """
+    if not texts:
+        return []
+    if any('\x00' in text for text in texts):
+        return [mask_volatile_tokens(text) for text in texts]
+    masked = MASK_BATCH_SEPARATOR.join(texts)
+    for pattern, placeholder in VOLATILE_TOKEN_PATTERNS:
+        masked = pattern.sub(placeholder, masked)
+    return [' '.join(part.lower().split()) for part in masked.split('\x00')]
+
+
+def compute_simhash(text: str) -> int:
+    """64-bit SimHash over word bigrams of the masked text; 0 when the text is too short to fingerprint."""
+    tokens = re.findall(r'\w+', mask_volatile_tokens(text))
+    if len(tokens) < MIN_FINGERPRINT_TOKENS:
+        return 0
+    weights = [0] * SIMHASH_BITS
+    for shingle in zip(tokens, tokens[1:]):
+        digest = hashlib.blake2b(' '.join(shingle).encode(), digest_size=8).digest()
+        feature = int.from_bytes(digest, 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if feature >> bit & 1 else -1
+    fingerprint = 0
+    for bit in range(SIMHASH_BITS):
+        if weights[bit] > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
 async def watcher_agent(state: AgentState) -> AgentState:
     logger.info(f"Watcher Agent: Processing message from {state['sender']}")
     
@@ -57,8 +135,10 @@ async def watcher_agent(state: AgentState) -> AgentState:
     content_cleaned = clean_content(message, urls)
     
     return {
-        **state,
         "urls": urls,
+        "phone_numbers": canonical_phone_numbers(message),
         "content_cleaned": content_cleaned,
-        "processing_start": datetime.utcnow()
+        "fingerprint": compute_simhash(message),
+        "processing_start": datetime.utcnow(),
+        "agents_involved": ["watcher"]
     }
@@ -13,7 +13,26 @@ from models.message import MessageAnalyzeRequest
 from models.scam import AnalysisResponse, ScamReport, StatsResponse, AgentState
 from services import database
 from services.redis_client import check_rate_limit
-from services.elasticsearch_client import es_client, get_user_stats_aggregation
+from services.elasticsearch_client import update_scam_number
+from services.user_stats import get_user_stats
+from agents.analyzer import get_tier_stats
+from services.analysis_cache import get_analysis_cache_stats
+from services.near_duplicate_index import get_near_duplicate_stats
+from services.single_flight import get_single_flight_stats
+from services.llm_batcher import get_batcher_stats
+from services.llm_governor import get_governor_stats
+from services.circuit_breaker import get_breaker_stats
+from services.llm_stream import get_stream_stats
+from services.llm_hedging import get_hedging_stats
+from services.gemini_client import get_pool_stats
+from services.deadline import new_deadline
+from services.membership_filter import get_filter_stats
+from services.phone_numbers import phone_number_key
+from services.url_reputation import get_url_reputation_stats
+from services.pattern_index import get_pattern_index_stats
+from services.bulk_writer import get_incident_writer_stats
+from services.reputation_writer import get_reputation_writer_stats
+from services.incident_logs import get_incident_retention_stats
 
 logger = logging.getLogger("scamshield.api")
 
@@ -66,7 +85,33 @@ async def root():
         "status": "online",
         "service": settings.APP_NAME,
         "version": settings.APP_VERSION,
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": datetime.utcnow().isoformat(),
+        "circuit_breakers": {name: stats["state"] for name, stats in get_breaker_stats().items()}
+    }
+
+
+@router.get("/api/v1/metrics", tags=["Health"])
+async def metrics():
+    tiers = get_tier_stats()
+    analyzed = sum(tiers.values())
+    return {
+        "analyzer_tiers": tiers,
+        "llm_share": round(tiers.get("llm", 0) / analyzed, 4) if analyzed else 0.0,
+        "analysis_cache": get_analysis_cache_stats(),
+        "near_duplicate_index": get_near_duplicate_stats(),
+        "single_flight": get_single_flight_stats(),
+        "llm_batcher": get_batcher_stats(),
+        "llm_governor": get_governor_stats(),
+        "llm_streaming": get_stream_stats(),
+        "llm_hedging": get_hedging_stats(),
+        "llm_pool": get_pool_stats(),
+        "membership_filters": get_filter_stats(),
+        "url_reputation": get_url_reputation_stats(),
+        "pattern_index": get_pattern_index_stats(),
+        "incident_writer": get_incident_writer_stats(),
+        "reputation_writer": get_reputation_writer_stats(),
+        "incident_retention": get_incident_retention_stats(),
+        "circuit_breakers": get_breaker_stats()
     }
 
 
@@ -128,17 +173,24 @@ async def analyze_message(request: MessageAnalyzeRequest, current_user: dict = D
         "message": request.message,
         "sender": request.sender,
         "user_id": user_id,
+        "priority": request.priority,
         "timestamp": datetime.utcnow(),
         "urls": [],
+        "phone_numbers": [],
         "content_cleaned": "",
+        "fingerprint": 0,
         "risk_score": 0,
         "analysis": {},
         "detected_tactics": [],
         "confidence": 0.0,
+        "analysis_tier": "none",
         "known_scammer": False,
         "previous_reports": 0,
         "similar_patterns": [],
         "url_malicious": False,
+        "reported_numbers": [],
+        "sender_blocked": False,
+        "decision_path": "full",
         "pattern_confidence": 0,
         "alerted": False,
         "channels_used": [],
@@ -148,14 +200,17 @@ async def analyze_message(request: MessageAnalyzeRequest, current_user: dict = D
         "community_updated": False,
         "final_decision": "PASS",
         "actions_taken": [],
-        "processing_start": datetime.utcnow()
+        "processing_start": datetime.utcnow(),
+        "deadline": new_deadline(request.deadline_ms),
+        "agents_involved": [],
+        "degraded_stages": []
     }
     
     start_time = datetime.utcnow()
     result = await scam_workflow.ainvoke(initial_state)
     processing_time = int((datetime.utcnow() - start_time).total_seconds() * 1000)
     
-    logger.info(f"Analysis: {result['final_decision']} (risk: {result['risk_score']}, time: {processing_time}ms)")
+    logger.info(f"Analysis: {result['final_decision']} (risk: {result['risk_score']}, path: {result['decision_path']}, time: {processing_time}ms, degraded: {result.get('degraded_stages', [])})")
     
     return AnalysisResponse(
         risk_score=result['risk_score'],
@@ -163,13 +218,18 @@ async def analyze_message(request: MessageAnalyzeRequest, current_user: dict = D
         analysis={
             "llm_analysis": result['analysis'],
             "detected_tactics": result['detected_tactics'],
+            "analysis_tier": result['analysis_tier'],
             "known_scammer": result['known_scammer'],
             "previous_reports": result['previous_reports'],
             "similar_patterns": result['similar_patterns'][:3],
-            "url_malicious": result['url_malicious']
+            "url_malicious": result['url_malicious'],
+            "reported_numbers": result.get('reported_numbers', []),
+            "sender_blocked": result['sender_blocked']
         },
         actions_taken=result['actions_taken'],
-        processing_time_ms=processing_time
+        processing_time_ms=processing_time,
+        decision_path=result['decision_path'],
+        degraded_stages=result.get('degraded_stages', [])
     )
 
 
@@ -188,48 +248,29 @@ async def get_blocked_scams(limit: int = 50, offset: int = 0, current_user: dict
 
 @router.get("/api/v1/stats", response_model=StatsResponse, tags=["Detection"])
 async def get_stats(current_user: dict = Depends(get_current_user)):
-    user_id = current_user["user_id"]
-    async with database.db_pool.acquire() as conn:
-        total_blocked = await conn.fetchval("SELECT COUNT(*) FROM user_blocklist WHERE user_id = $1", uuid.UUID(user_id)) or 0
-        blocked_today = await conn.fetchval(
-            "SELECT COUNT(*) FROM user_blocklist WHERE user_id = $1 AND blocked_at >= CURRENT_DATE",
-            uuid.UUID(user_id)
-        ) or 0
-    
-    try:
-        stats = await get_user_stats_aggregation(user_id)
-        top_scam_types = [{"type": b["key"], "count": b["doc_count"]} for b in stats.get("scam_types", [])]
-    except Exception:
-        top_scam_types = []
-    
-    protection_score = min(100.0, 50.0 + (total_blocked * 2))
-    return StatsResponse(total_blocked=total_blocked, blocked_today=blocked_today, top_scam_types=top_scam_types, protection_score=protection_score)
+    stats = await get_user_stats(current_user["user_id"])
+    if stats is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Stats unavailable")
+    top_scam_types = [
+        {"type": decision, "count": count}
+        for decision, count in sorted(stats["decisions"].items(), key=lambda item: -item[1])[:5]
+    ]
+    protection_score = min(100.0, 50.0 + (stats["total_blocked"] * 2))
+    return StatsResponse(
+        total_blocked=stats["total_blocked"],
+        blocked_today=stats["blocked_today"],
+        top_scam_types=top_scam_types,
+        average_risk_score=stats["average_risk_score"],
+        protection_score=protection_score
+    )
 
 
 @router.post("/api/v1/report", tags=["Detection"])
 async def report_scam(report: ScamReport, current_user: dict = Depends(get_current_user)):
     user_id = current_user["user_id"]
-    try:
-        await es_client.index(
-            index="scam_numbers",
-            id=report.sender,
-            document={
-                "phone_number": report.sender,
-                "report_count": 1,
-                "first_reported": datetime.utcnow().isoformat(),
-                "last_reported": datetime.utcnow().isoformat(),
-                "scam_types": [report.scam_type] if report.scam_type else ["unknown"],
-                "blocked_by_users": 1,
-                "reported_by": user_id
-            },
-            op_type="create"
-        )
-    except Exception:
-        await es_client.update(
-            index="scam_numbers",
-            id=report.sender,
-            body={"script": {"source": "ctx._source.report_count++; ctx._source.last_reported = params.now", "params": {"now": datetime.utcnow().isoformat()}}}
-        )
-    logger.info(f"Scam reported by {user_id}: {report.sender}")
-    return {"status": "reported", "sender": report.sender}
+    phone_number = phone_number_key(report.sender, settings.DEFAULT_PHONE_COUNTRY_CODE)
+    if not await update_scam_number(phone_number, [report.scam_type or "unknown"], blocked=False, reported_by=user_id):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many pending reports, try again shortly")
+    logger.info(f"Scam reported by {user_id}: {phone_number}")
+    return {"status": "reported", "sender": phone_number}
 
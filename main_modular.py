@@ -10,13 +10,24 @@ from services.database import init_postgres, close_postgres
 from services.elasticsearch_client import init_elasticsearch, close_elasticsearch
 from services.redis_client import init_redis, close_redis
 from services.gemini_client import init_llm
+from services.membership_filter import start_filter_refresh, stop_filter_refresh
+from services.url_reputation import start_url_reputation_refresh, stop_url_reputation_refresh
+from services.pattern_index import start_pattern_index_refresh, stop_pattern_index_refresh
+from services.bulk_writer import start_incident_writer, stop_incident_writer
+from services.reputation_writer import start_reputation_writer, stop_reputation_writer
+from services.user_stats import start_stats_reconciliation, stop_stats_reconciliation
+from services.incident_logs import start_incident_retention, stop_incident_retention
+from agents.keywords import start_keyword_refresh, stop_keyword_refresh
+from agents.local_model import load_local_model
 from agents.watcher import watcher_agent
+from agents.screener import screener_agent, route_after_screening
 from agents.analyzer import analyzer_agent
 from agents.pattern import pattern_agent
 from agents.alerter import alerter_agent, set_websocket_manager
 from agents.blocker import blocker_agent
 from models.scam import AgentState
 from api.routes import router, set_workflow
+from services.circuit_breaker import get_breaker_stats
 from api.websocket import websocket_manager, websocket_endpoint
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -28,14 +39,18 @@ logger = logging.getLogger("scamshield")
 def create_scam_detection_workflow() -> StateGraph:
     workflow = StateGraph(AgentState)
     workflow.add_node("watcher", watcher_agent)
+    workflow.add_node("screener", screener_agent)
     workflow.add_node("analyzer", analyzer_agent)
     workflow.add_node("pattern", pattern_agent)
     workflow.add_node("alerter", alerter_agent)
     workflow.add_node("blocker", blocker_agent)
     workflow.add_edge(START, "watcher")
-    workflow.add_edge("watcher", "analyzer")
-    workflow.add_edge("analyzer", "pattern")
-    workflow.add_edge("pattern", "alerter")
+    workflow.add_edge("watcher", "screener")
+    # known scammers, flagged URLs and already-blocked senders go straight to
+    # alerter; everything else fans out to analyzer (Gemini) and pattern
+    # (Elasticsearch) in parallel, joining before alerter
+    workflow.add_conditional_edges("screener", route_after_screening, ["analyzer", "pattern", "alerter"])
+    workflow.add_edge(["analyzer", "pattern"], "alerter")
     workflow.add_edge("alerter", "blocker")
     workflow.add_edge("blocker", END)
     return workflow.compile()
@@ -48,6 +63,15 @@ async def lifespan(app: FastAPI):
     await init_elasticsearch()
     await init_redis()
     init_llm()
+    await start_keyword_refresh()
+    await start_filter_refresh()
+    await start_url_reputation_refresh()
+    await start_pattern_index_refresh()
+    start_incident_writer()
+    start_reputation_writer()
+    start_stats_reconciliation()
+    start_incident_retention()
+    load_local_model(settings.LOCAL_MODEL_PATH)
     scam_workflow = create_scam_detection_workflow()
     set_workflow(scam_workflow)
     set_websocket_manager(websocket_manager)
@@ -55,6 +79,15 @@ async def lifespan(app: FastAPI):
     logger.info(f"API Docs: http://localhost:8000/docs")
     yield
     logger.info("Shutting down ScamShield API...")
+    await stop_keyword_refresh()
+    await stop_filter_refresh()
+    await stop_url_reputation_refresh()
+    await stop_pattern_index_refresh()
+    await stop_stats_reconciliation()
+    await stop_incident_retention()
+    # before Elasticsearch closes, so buffered writes can still go out
+    await stop_incident_writer()
+    await stop_reputation_writer()
     await close_postgres()
     await close_elasticsearch()
     await close_redis()
@@ -83,7 +116,8 @@ app.include_router(router)
 @app.get("/")
 async def root():
     logger.info("Health check endpoint called")
-    return {"status": "ok", "service": "CortexScan API", "version": settings.APP_VERSION}
+    breakers = {name: stats["state"] for name, stats in get_breaker_stats().items()}
+    return {"status": "ok", "service": "CortexScan API", "version": settings.APP_VERSION, "circuit_breakers": breakers}
 
 
 @app.websocket("/ws/{user_id}")
@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Optional, List, Literal
 from pydantic import BaseModel, Field
 from datetime import datetime
 
@@ -6,6 +6,10 @@ from datetime import datetime
 class MessageAnalyzeRequest(BaseModel):
     message: str = Field(..., min_length=1, max_length=5000)
     sender: str
+    # latency budget for this request; defaults to REQUEST_DEADLINE_MS
+    deadline_ms: Optional[int] = Field(None, ge=100, le=60000)
+    # bulk requests (backfills, rescans) queue behind interactive ones for Gemini capacity
+    priority: Literal["interactive", "bulk"] = "interactive"
 
 
 class MessageResponse(BaseModel):
@@ -1,4 +1,5 @@
-from typing import TypedDict, Optional, List, Dict, Any
+import operator
+from typing import TypedDict, Optional, List, Dict, Any, Annotated
 from pydantic import BaseModel, Field
 from datetime import datetime
 
@@ -7,17 +8,24 @@ class AgentState(TypedDict):
     message: str
     sender: str
     user_id: str
+    priority: str
     timestamp: datetime
     urls: List[str]
+    phone_numbers: List[str]
     content_cleaned: str
+    fingerprint: int
     risk_score: int
     analysis: Dict[str, Any]
     detected_tactics: List[str]
     confidence: float
+    analysis_tier: str
     known_scammer: bool
     previous_reports: int
     similar_patterns: List[Dict[str, Any]]
     url_malicious: bool
+    reported_numbers: List[str]
+    sender_blocked: bool
+    decision_path: str
     pattern_confidence: int
     alerted: bool
     channels_used: List[str]
@@ -28,6 +36,10 @@ class AgentState(TypedDict):
     final_decision: str
     actions_taken: List[str]
     processing_start: datetime
+    deadline: float
+    # analyzer and pattern run in parallel, so fields both branches may write need reducers
+    agents_involved: Annotated[List[str], operator.add]
+    degraded_stages: Annotated[List[str], operator.add]
 
 
 class LLMAnalysis(BaseModel):
@@ -50,6 +62,8 @@ class AnalysisResponse(BaseModel):
     analysis: Dict[str, Any]
     actions_taken: List[str] = Field(default_factory=list)
     processing_time_ms: int
+    decision_path: str = "full"
+    degraded_stages: List[str] = Field(default_factory=list)
 
 
 class ScamReport(BaseModel):
@@ -67,6 +81,7 @@ class StatsResponse(BaseModel):
     total_blocked: int
     blocked_today: int
     top_scam_types: List[Dict[str, Any]] = Field(default_factory=list)
+    average_risk_score: Optional[float] = None
     protection_score: float = Field(..., ge=0, le=100)
 
 
@@ -0,0 +1,91 @@
+"""
+Keyword scorer benchmark.
+Compares the single-pass keyword engine with the per-keyword substring loops
+it replaced, on messages of increasing length and on a larger keyword table.
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from agents.keywords import DEFAULT_TACTIC_RULES, KeywordEngine
+
+FILLER = ("hi just checking in about the weekend plans and the shopping list for the "
+          "party we talked about yesterday let me know what time works best for you").split()
+SCAM_TAIL = " URGENT: your bank account is suspended, send your pin to verify"
+
+
+def legacy_scan(message: str, rules) -> int:
+    """The old fallback_analyze loops: one substring scan per keyword, first hit per rule."""
+    message_lower = message.lower()
+    score = 0
+    for rule in rules:
+        for word in rule["keywords"]:
+            if word in message_lower:
+                score += rule["score"]
+                break
+    return min(100, score)
+
+
+def legacy_scan_with_boundaries(message: str, compiled_rules) -> int:
+    """What the old loops would cost with word-boundary matching: one regex search per keyword."""
+    message_lower = message.lower()
+    score = 0
+    for rule_score, patterns in compiled_rules:
+        for pattern in patterns:
+            if pattern.search(message_lower):
+                score += rule_score
+                break
+    return min(100, score)
+
+
+def make_message(length: int) -> str:
+    words = []
+    while sum(len(w) + 1 for w in words) < length - len(SCAM_TAIL):
+        words.append(random.choice(FILLER))
+    return " ".join(words) + SCAM_TAIL
+
+
+def expanded_rules(extra_keywords: int):
+    rules = [dict(rule, keywords=list(rule["keywords"])) for rule in DEFAULT_TACTIC_RULES]
+    for i in range(extra_keywords):
+        word = "".join(random.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(random.randint(5, 12)))
+        rules[i % len(rules)]["keywords"].append(word)
+    return rules
+
+
+def per_call_us(func, message: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(message)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    random.seed(7)
+    print("=" * 78)
+    print(f"{'table':<12}{'msg chars':>10}{'legacy loops':>16}{'legacy+bounds':>16}{'engine':>12}{'speedup':>10}")
+    print("-" * 78)
+    for label, rules in (("default", DEFAULT_TACTIC_RULES), ("+500 words", expanded_rules(500))):
+        engine = KeywordEngine(rules)
+        compiled = [
+            (rule["score"], [re.compile(r"(?<!\w)" + re.escape(k) + r"(?!\w)") for k in rule["keywords"]])
+            for rule in rules
+        ]
+        for length in (160, 1000, 5000):
+            message = make_message(length)
+            repeat = max(50, 200000 // length)
+            legacy = per_call_us(lambda m: legacy_scan(m, rules), message, repeat)
+            bounded = per_call_us(lambda m: legacy_scan_with_boundaries(m, compiled), message, repeat)
+            single = per_call_us(lambda m: engine.analyze(m), message, repeat)
+            print(f"{label:<12}{len(message):>10}{legacy:>14.1f}us{bounded:>14.1f}us{single:>10.1f}us{bounded / single:>9.1f}x")
+    print("=" * 78)
+    print("speedup is against legacy+bounds, the old loops with the same matching semantics")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Similar-pattern search benchmark.
+Runs the same messages through the in-process pattern index and the fuzzy
+match query it replaces, and reports recall of the ES top-k and per-query
+latency of both. Messages are seed messages padded with filler and with
+typos, which is where fuzzy matching matters.
+
+    python scripts/benchmark_pattern_index.py
+    python scripts/benchmark_pattern_index.py --synthetic 5000   # no ES: index latency only
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from services import elasticsearch_client
+from services.llm_governor import percentile
+from services.pattern_index import PatternIndex
+
+from train_local_model import SEED_SCAM, SEED_LEGITIMATE
+
+FILLER = ("just checking in about the weekend plans and the shopping list for the party we talked "
+          "about yesterday let me know what time works best for you").split()
+SIZE = 5
+
+
+def add_typo(word: str, rng: random.Random) -> str:
+    if len(word) < 4:
+        return word
+    i = rng.randrange(len(word) - 1)
+    edit = rng.choice(("swap", "drop", "double"))
+    if edit == "swap":
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if edit == "drop":
+        return word[:i] + word[i + 1:]
+    return word[:i] + word[i] + word[i:]
+
+
+def make_messages(count: int, rng: random.Random):
+    messages = []
+    for _ in range(count):
+        base = rng.choice(SEED_SCAM if rng.random() < 0.5 else SEED_LEGITIMATE)
+        words = [add_typo(word, rng) if rng.random() < 0.15 else word for word in base.split()]
+        words += [rng.choice(FILLER) for _ in range(rng.randint(0, 15))]
+        messages.append(" ".join(words))
+    return messages
+
+
+def synthetic_index(count: int, rng: random.Random) -> PatternIndex:
+    index = PatternIndex()
+    for i in range(count):
+        words = rng.choice(SEED_SCAM).split()
+        words = [add_typo(word, rng) if rng.random() < 0.2 else word for word in words]
+        index.add(str(i), {"pattern_text": " ".join(words + rng.sample(FILLER, 3)), "category": "synthetic"})
+    index.ready = True
+    return index
+
+
+def report(name: str, seconds):
+    print(f"{name:<12}{percentile(seconds, 50) * 1000:>12.2f}{percentile(seconds, 99) * 1000:>12.2f}"
+          f"{len(seconds) / sum(seconds):>14,.0f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--synthetic", type=int, default=0, help="benchmark an index of this many generated patterns instead of ES")
+    args = parser.parse_args()
+    rng = random.Random(7)
+    messages = make_messages(args.messages, rng)
+
+    es = None if args.synthetic else await elasticsearch_client.init_elasticsearch()
+    if es is None:
+        index = synthetic_index(args.synthetic or 2000, rng)
+        print(f"Index of {len(index.patterns)} synthetic patterns, {len(index.index.postings)} terms")
+    else:
+        index = PatternIndex()
+        await index.rebuild()
+        print(f"Index of {len(index.patterns)} scam_patterns, {len(index.index.postings)} terms")
+
+    local_seconds, es_seconds, recalls = [], [], []
+    try:
+        for message in messages:
+            start = time.perf_counter()
+            local = [pattern_id for pattern_id, _ in index.search(message, SIZE)]
+            local_seconds.append(time.perf_counter() - start)
+            if es is None:
+                continue
+            start = time.perf_counter()
+            result = await es.search(index="scam_patterns", size=SIZE,
+                                     query={"match": {"pattern_text": {"query": message, "fuzziness": "AUTO"}}})
+            es_seconds.append(time.perf_counter() - start)
+            expected = [hit["_id"] for hit in result["hits"]["hits"]]
+            if expected:
+                recalls.append(len(set(local) & set(expected)) / len(expected))
+    finally:
+        if es is not None:
+            await elasticsearch_client.close_elasticsearch()
+
+    print("=" * 50)
+    print(f"{'search':<12}{'p50 ms':>12}{'p99 ms':>12}{'queries/s':>14}")
+    print("-" * 50)
+    report("in-process", local_seconds)
+    if es_seconds:
+        report("ES fuzzy", es_seconds)
+    print("=" * 50)
+    if recalls:
+        print(f"recall of ES top-{SIZE}: {sum(recalls) / len(recalls):.3f} over {len(recalls)} messages with ES hits")
+    elif es is None:
+        print("ES not used: latency only")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
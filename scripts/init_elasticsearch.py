@@ -20,7 +20,9 @@ INDICES = {
                 "last_reported": {"type": "date"},
                 "confidence_score": {"type": "float"},
                 "scam_types": {"type": "keyword"},
-                "blocked_by_users": {"type": "integer"}
+                "blocked_by_users": {"type": "integer"},
+                "reported_by": {"type": "keyword"},
+                "applied_flushes": {"type": "keyword", "index": False}
             }
         }
     },
@@ -36,18 +38,14 @@ INDICES = {
             }
         }
     },
-    "incident_logs": {
+    "keyword_rules": {
         "mappings": {
             "properties": {
-                "timestamp": {"type": "date"},
-                "user_id": {"type": "keyword"},
-                "sender": {"type": "keyword"},
-                "message_hash": {"type": "keyword"},
-                "risk_score": {"type": "integer"},
-                "decision": {"type": "keyword"},
-                "agents_involved": {"type": "keyword"},
-                "actions_taken": {"type": "keyword"},
-                "processing_time_ms": {"type": "integer"}
+                "tactic": {"type": "keyword"},
+                "score": {"type": "integer"},
+                "field": {"type": "keyword"},
+                "label": {"type": "keyword"},
+                "keywords": {"type": "keyword"}
             }
         }
     },
@@ -67,15 +65,42 @@ INDICES = {
     }
 }
 
+# incident_logs is written as one index per UTC day (incident_logs-2026.10.16); the
+# template maps each new one and adds it to the incident_logs alias that readers search.
+# Daily indices past INCIDENT_LOG_RETENTION_DAYS are deleted by the API.
+INDEX_TEMPLATES = {
+    "incident_logs": {
+        "index_patterns": ["incident_logs-*"],
+        "template": {
+            "settings": {"number_of_shards": 1},
+            "aliases": {"incident_logs": {}},
+            "mappings": {
+                "properties": {
+                    "timestamp": {"type": "date"},
+                    "user_id": {"type": "keyword"},
+                    "sender": {"type": "keyword"},
+                    "message_hash": {"type": "keyword"},
+                    "risk_score": {"type": "integer"},
+                    "decision": {"type": "keyword"},
+                    "agents_involved": {"type": "keyword"},
+                    "actions_taken": {"type": "keyword"},
+                    "processing_time_ms": {"type": "integer"}
+                }
+            }
+        }
+    }
+}
+
 SEED_DATA = {
     "scam_patterns": [
         {"pattern_text": "URGENT: Your account has been suspended. Click here to verify.", "keywords": ["urgent", "suspended", "verify"], "risk_score": 95.0, "category": "bank_fraud"},
         {"pattern_text": "You've won $1,000,000! Claim your prize now!", "keywords": ["won", "prize", "claim"], "risk_score": 98.0, "category": "lottery_scam"},
         {"pattern_text": "IRS notice: You owe back taxes. Pay immediately or face arrest.", "keywords": ["irs", "taxes", "arrest"], "risk_score": 99.0, "category": "irs_impersonation"}
     ],
+    # E.164 forms of +1-800-SCAMMER and +1-888-FRAUD01
     "scam_numbers": [
-        {"phone_number": "+1-800-SCAMMER", "report_count": 100, "confidence_score": 99.0, "scam_types": ["irs_impersonation"]},
-        {"phone_number": "+1-888-FRAUD01", "report_count": 50, "confidence_score": 95.0, "scam_types": ["tech_support"]}
+        {"phone_number": "+18007226637", "report_count": 100, "confidence_score": 99.0, "scam_types": ["irs_impersonation"]},
+        {"phone_number": "+18883728301", "report_count": 50, "confidence_score": 95.0, "scam_types": ["tech_support"]}
     ]
 }
 
@@ -104,6 +129,12 @@ async def init_elasticsearch():
             else:
                 print(f"Index exists: {index_name}")
         
+        for template_name, template_config in INDEX_TEMPLATES.items():
+            await es.indices.put_index_template(name=template_name, **template_config)
+            print(f"Index template: {template_name}")
+        if await es.indices.exists(index="incident_logs") and not await es.indices.exists_alias(name="incident_logs"):
+            print("incident_logs is a single index from an older setup; run scripts/migrate_incident_logs.py")
+        
         for pattern in SEED_DATA["scam_patterns"]:
             await es.index(index="scam_patterns", document={**pattern, "detection_count": 0, "last_seen": datetime.utcnow().isoformat()})
         
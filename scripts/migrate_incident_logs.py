@@ -0,0 +1,99 @@
+"""
+Move a single incident_logs index into daily indices.
+
+Older setups wrote every incident to one incident_logs index. The API now
+writes one index per UTC day behind an incident_logs alias, and the alias
+can't be created while an index holds the name. This clones the old index
+aside, deletes it, and reindexes each incident into the daily index of its
+timestamp, where the template maps it and adds the alias. Incidents logged
+while it runs are retried by the API's bulk writer, so run it during a
+quiet period. Run scripts/init_elasticsearch.py first for the template.
+
+    python scripts/migrate_incident_logs.py --dry-run
+    python scripts/migrate_incident_logs.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services import elasticsearch_client
+from services.incident_logs import INCIDENT_LOGS_ALIAS, INCIDENT_INDEX_PREFIX, incident_index
+
+LEGACY_INDEX = "incident_logs_legacy"
+REINDEX_TIMEOUT_SECONDS = 3600
+
+# incidents without a timestamp go to the dest index, today's
+DAILY_INDEX_SCRIPT = """
+def timestamp = ctx._source.timestamp;
+if (timestamp != null && timestamp.length() >= 10) {
+    ctx._index = params.prefix + timestamp.substring(0, 10).replace('-', '.');
+}
+"""
+
+
+async def daily_counts(es, index: str):
+    result = await es.search(index=index, size=0, aggs={
+        "days": {"date_histogram": {"field": "timestamp", "calendar_interval": "day", "format": "yyyy.MM.dd", "min_doc_count": 1}}
+    })
+    return [(bucket["key_as_string"], bucket["doc_count"]) for bucket in result["aggregations"]["days"]["buckets"]]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="print the daily indices that would be created without writing")
+    args = parser.parse_args()
+
+    es = await elasticsearch_client.init_elasticsearch()
+    if es is None:
+        sys.exit("Elasticsearch is not reachable")
+    try:
+        source = LEGACY_INDEX if await es.indices.exists(index=LEGACY_INDEX) else INCIDENT_LOGS_ALIAS
+        if source == INCIDENT_LOGS_ALIAS and (
+            not await es.indices.exists(index=INCIDENT_LOGS_ALIAS) or await es.indices.exists_alias(name=INCIDENT_LOGS_ALIAS)
+        ):
+            print("incident_logs is already an alias over daily indices; nothing to migrate")
+            return
+        if not await es.indices.exists_index_template(name="incident_logs"):
+            sys.exit("The incident_logs index template is missing; run scripts/init_elasticsearch.py first")
+        days = await daily_counts(es, source)
+        print(f"{sum(count for _, count in days)} incidents in {source} across {len(days)} days")
+        if args.dry_run:
+            for day, count in days:
+                print(f"  incident_logs-{day}: {count}")
+            return
+
+        if source == INCIDENT_LOGS_ALIAS:
+            # a clone shares the segments, so this is quick however large the index is
+            await es.indices.put_settings(index=INCIDENT_LOGS_ALIAS, settings={"index.blocks.write": True})
+            await es.indices.clone(index=INCIDENT_LOGS_ALIAS, target=LEGACY_INDEX, wait_for_active_shards="all")
+            await es.indices.delete(index=INCIDENT_LOGS_ALIAS)
+            print(f"Moved incident_logs to {LEGACY_INDEX}")
+
+        result = await es.options(request_timeout=REINDEX_TIMEOUT_SECONDS).reindex(
+            source={"index": LEGACY_INDEX},
+            dest={"index": incident_index({}), "op_type": "create"},
+            script={"source": DAILY_INDEX_SCRIPT, "params": {"prefix": INCIDENT_INDEX_PREFIX}},
+            conflicts="proceed",
+            refresh=True,
+            wait_for_completion=True
+        )
+        print(f"Reindexed {result['created']} incidents ({result['version_conflicts']} already there)")
+        if result["failures"]:
+            for failure in result["failures"][:20]:
+                print(f"  failed: {failure}")
+            sys.exit(f"{len(result['failures'])} incidents failed; {LEGACY_INDEX} is kept, re-run to retry")
+        await es.indices.delete(index=LEGACY_INDEX)
+        print(f"Deleted {LEGACY_INDEX}")
+    finally:
+        await elasticsearch_client.close_elasticsearch()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""
+Re-key scam_numbers documents to E.164.
+
+Documents stored under a formatted or vanity number (+1-800-SCAMMER,
+(555) 234-5678) are moved to the canonical id the API now writes and looks
+up (+18007226637). Reports of one number stored under several spellings are
+merged: counts are summed, the first/last report dates widened, scam types
+combined and the highest confidence kept. Senders that aren't phone numbers
+are left alone. Safe to re-run.
+
+    python scripts/migrate_phone_numbers.py --dry-run
+    python scripts/migrate_phone_numbers.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from elasticsearch.helpers import async_bulk, async_scan
+from config.settings import settings
+from services import elasticsearch_client
+from services.phone_numbers import phone_number_key
+
+INDEX = "scam_numbers"
+MGET_BATCH_SIZE = 1000
+
+
+def merge_scam_numbers(phone_number: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One scam_numbers document from reports of the same number; fields only the first has are kept."""
+    merged: Dict[str, Any] = {}
+    for document in reversed(documents):
+        merged.update(document)
+    first_reported = [d["first_reported"] for d in documents if d.get("first_reported")]
+    last_reported = [d["last_reported"] for d in documents if d.get("last_reported")]
+    confidence = [d["confidence_score"] for d in documents if d.get("confidence_score") is not None]
+    merged.update({
+        "phone_number": phone_number,
+        "report_count": sum(d.get("report_count", 0) for d in documents),
+        "blocked_by_users": sum(d.get("blocked_by_users", 0) for d in documents),
+        "scam_types": list(dict.fromkeys(t for d in documents for t in d.get("scam_types", []))),
+    })
+    # reported_by was a single user id before it became a list
+    reporters = [r for d in documents for r in ([d["reported_by"]] if isinstance(d.get("reported_by"), str) else d.get("reported_by", []))]
+    if reporters:
+        merged["reported_by"] = list(dict.fromkeys(reporters))
+    if first_reported:
+        merged["first_reported"] = min(first_reported)
+    if last_reported:
+        merged["last_reported"] = max(last_reported)
+    if confidence:
+        merged["confidence_score"] = max(confidence)
+    return merged
+
+
+async def find_miskeyed(es) -> Dict[str, List[Tuple[str, Dict[str, Any]]]]:
+    """(doc id, source) of every document not stored under its canonical id, grouped by that id."""
+    groups: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+    async for hit in async_scan(es, index=INDEX, query={"query": {"match_all": {}}}, size=5000):
+        key = phone_number_key(hit["_source"].get("phone_number") or hit["_id"], settings.DEFAULT_PHONE_COUNTRY_CODE)
+        if hit["_id"] != key or hit["_source"].get("phone_number") != key:
+            groups.setdefault(key, []).append((hit["_id"], hit["_source"]))
+    return groups
+
+
+async def load_existing(es, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Documents already stored under the canonical ids, which the moved ones are merged into."""
+    existing = {}
+    for start in range(0, len(keys), MGET_BATCH_SIZE):
+        result = await es.mget(index=INDEX, ids=keys[start:start + MGET_BATCH_SIZE])
+        existing.update({doc["_id"]: doc["_source"] for doc in result["docs"] if doc.get("found")})
+    return existing
+
+
+def migration_actions(groups: Dict[str, List[Tuple[str, Dict[str, Any]]]], existing: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    actions = []
+    for key, documents in groups.items():
+        sources = [source for doc_id, source in documents if doc_id != key]
+        # a canonical id whose phone_number field is still formatted is in documents already
+        target = next((source for doc_id, source in documents if doc_id == key), existing.get(key))
+        if target is not None:
+            sources.insert(0, target)
+        actions.append({"_op_type": "index", "_index": INDEX, "_id": key, "_source": merge_scam_numbers(key, sources)})
+        actions += [{"_op_type": "delete", "_index": INDEX, "_id": doc_id} for doc_id, _ in documents if doc_id != key]
+    return actions
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="print what would change without writing")
+    args = parser.parse_args()
+
+    es = await elasticsearch_client.init_elasticsearch()
+    if es is None:
+        sys.exit("Elasticsearch is not reachable")
+    try:
+        groups = await find_miskeyed(es)
+        existing = await load_existing(es, list(groups))
+        actions = migration_actions(groups, existing)
+        moved = sum(len(documents) for documents in groups.values())
+        print(f"{moved} documents to re-key into {len(groups)} numbers ({len(existing)} merged into existing documents)")
+        if args.dry_run:
+            for key, documents in groups.items():
+                print(f"  {', '.join(doc_id for doc_id, _ in documents)} -> {key}")
+            return
+        succeeded, errors = await async_bulk(es, actions, raise_on_error=False, refresh="wait_for")
+        print(f"Applied {succeeded} of {len(actions)} writes")
+        for error in errors:
+            print(f"  failed: {error}")
+    finally:
+        await elasticsearch_client.close_elasticsearch()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
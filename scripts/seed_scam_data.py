@@ -23,10 +23,11 @@ SCAM_PATTERNS = [
     {"pattern_text": "Double your Bitcoin! Send 0.1 BTC and receive 0.2 BTC back.", "keywords": ["double", "bitcoin", "send"], "risk_score": 99.0, "category": "crypto_scam"}
 ]
 
+# E.164 forms of +1-800-SCAM-001, +1-888-FAKE-IRS and +1-900-LOTTERY
 SCAM_NUMBERS = [
-    {"_id": "+1-800-SCAM-001", "phone_number": "+1-800-SCAM-001", "report_count": 245, "confidence_score": 99.0, "scam_types": ["irs_impersonation"]},
-    {"_id": "+1-888-FAKE-IRS", "phone_number": "+1-888-FAKE-IRS", "report_count": 178, "confidence_score": 98.5, "scam_types": ["irs_impersonation"]},
-    {"_id": "+1-900-LOTTERY", "phone_number": "+1-900-LOTTERY", "report_count": 312, "confidence_score": 99.5, "scam_types": ["lottery_scam"]}
+    {"_id": "+18007226001", "phone_number": "+18007226001", "report_count": 245, "confidence_score": 99.0, "scam_types": ["irs_impersonation"]},
+    {"_id": "+18883253477", "phone_number": "+18883253477", "report_count": 178, "confidence_score": 98.5, "scam_types": ["irs_impersonation"]},
+    {"_id": "+19005688379", "phone_number": "+19005688379", "report_count": 312, "confidence_score": 99.5, "scam_types": ["lottery_scam"]}
 ]
 
 MALICIOUS_URLS = [
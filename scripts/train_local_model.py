@@ -0,0 +1,214 @@
+"""
+Train the local scam classifier used between the keyword scorer and Gemini.
+
+Training data: pattern_text from the scam_patterns index (scam), an optional
+Elasticsearch index of labeled messages (reported messages and reviewed
+incidents, {"message": ..., "label": 0|1}), optional JSONL files in the same
+shape, and the seed messages below so there are always legitimate examples.
+
+Reports precision/recall on a held-out split for the keyword scorer and the
+model, how much of the split the model could decide without Gemini, and
+per-message throughput of both scorers.
+
+    python scripts/train_local_model.py --output local_model.npz
+    python scripts/train_local_model.py --no-es --labeled reviewed.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "training")
+
+from elasticsearch import AsyncElasticsearch
+from config.settings import settings
+from agents.keywords import get_keyword_engine
+from agents.local_model import train_logistic_regression, DEFAULT_FEATURE_BITS
+
+SEED_SCAM = [
+    "URGENT: Your account has been suspended. Click here to verify.",
+    "You've won $1,000,000! Claim your prize now!",
+    "IRS notice: You owe back taxes. Pay immediately or face arrest.",
+    "Your Chase account has been locked due to suspicious activity. Verify at secure-chase-login.com",
+    "USPS: Your package could not be delivered. Update your address here: bit.ly/3xYz",
+    "Congratulations! You've been selected to receive a $500 Walmart gift card. Reply YES to claim",
+    "Your Netflix payment failed. Update your billing details within 24 hours to avoid suspension",
+    "This is the Social Security Administration. Your SSN has been suspended due to illegal activity",
+    "Hi mum, I lost my phone, this is my new number. Can you send me $200 for rent today?",
+    "Your Amazon order #4821 for an iPhone 15 was placed. If this wasn't you call 1-888-555-0134",
+    "Final notice: your car warranty is about to expire. Press 1 to speak to an agent",
+    "We detected a virus on your device. Call Microsoft support immediately at 800-555-0199",
+    "Double your Bitcoin! Send 0.1 BTC and receive 0.2 BTC back within the hour",
+    "Your PayPal account will be limited. Confirm your identity at paypal-secure-check.net",
+    "Dear customer, your bank OTP is required to cancel a pending transfer of $2,300. Reply with the code",
+    "Get paid $500/day working from home! No experience needed. Message us on WhatsApp",
+    "Your electricity will be disconnected tonight unless you pay the overdue balance with gift cards",
+    "Toll services: you have an unpaid toll of $6.99. Pay now to avoid a late fee: ezpass-pay.com",
+    "You have a pending tax refund of $820. Submit your bank details to receive it",
+    "Your Apple ID was used to sign in on a new device. If this wasn't you, verify your password here",
+    "A warrant has been issued for your arrest. Call this number immediately to resolve",
+    "Congratulations winner! Your number was drawn in the international lottery. Pay the release fee",
+    "Your Wells Fargo debit card has been deactivated. Text back your card number and PIN to reactivate",
+    "Investment opportunity: guaranteed 40% monthly returns, limited spots, act now",
+    "Hello dear, I am a soldier overseas and need help moving my inheritance. You will get 30%",
+    "FedEx: a customs fee of $2.99 is due before we can deliver your parcel. Pay here",
+    "Your Medicare card is expiring. Confirm your social security number to get a new one",
+    "Account alert: unusual sign-in detected. Reset your password immediately at the link below",
+]
+
+SEED_LEGITIMATE = [
+    "Hey, are we still on for dinner at 7 tonight?",
+    "Your package was delivered to the front porch. Thanks for shopping with us.",
+    "Reminder: dentist appointment tomorrow at 10:30am. Reply C to confirm.",
+    "Can you pick up milk and bread on the way home?",
+    "Happy birthday! Hope you have an amazing day",
+    "The meeting has moved to conference room B at 3pm",
+    "Your verification code is 482913. Don't share it with anyone. We will never call to ask for it.",
+    "Thanks for your payment of $45.20 to City Water. Your balance is now $0.",
+    "Running 10 minutes late, traffic is terrible",
+    "Did you see the game last night? What a finish",
+    "Your prescription is ready for pickup at the pharmacy on Main St",
+    "Mom says call her when you get a chance",
+    "Flight UA 482 is on time, boarding at gate 12 at 6:45pm",
+    "Your order has shipped and will arrive Thursday. Track it in the app.",
+    "Great job on the presentation today, the client loved it",
+    "School is closed tomorrow because of the snow",
+    "Can you send me the photos from the weekend trip?",
+    "Your library books are due back on Friday",
+    "Let's grab coffee next week, I'm free Tuesday or Wednesday",
+    "The plumber will arrive between 1 and 3pm tomorrow",
+    "Your table for 4 at Rosa's is confirmed for Saturday at 8pm",
+    "I left the keys under the mat, see you later",
+    "Practice is cancelled today, coach is sick",
+    "Your monthly statement is available to view in online banking",
+    "Thanks for the ride yesterday, I owe you one",
+    "Don't forget we have the parent teacher conference on Monday",
+    "Your car is ready for pickup, the total came to $312",
+    "Want to watch a movie tonight? I can bring snacks",
+]
+
+
+def load_jsonl(path: str):
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                row = json.loads(line)
+                yield row["message"], int(row["label"])
+
+
+async def load_from_es(labeled_index: str):
+    if settings.ES_CLOUD_ID and settings.ES_API_KEY:
+        es = AsyncElasticsearch(cloud_id=settings.ES_CLOUD_ID, api_key=settings.ES_API_KEY)
+    else:
+        es = AsyncElasticsearch([settings.ES_URL])
+    examples = []
+    try:
+        result = await es.search(index="scam_patterns", query={"match_all": {}}, size=10000, source=["pattern_text"])
+        examples += [(hit["_source"]["pattern_text"], 1) for hit in result["hits"]["hits"] if hit["_source"].get("pattern_text")]
+        print(f"scam_patterns: {len(examples)} scam examples")
+        if await es.indices.exists(index=labeled_index):
+            result = await es.search(index=labeled_index, query={"match_all": {}}, size=10000, source=["message", "label"])
+            labeled = [(hit["_source"]["message"], int(hit["_source"]["label"])) for hit in result["hits"]["hits"]]
+            examples += labeled
+            print(f"{labeled_index}: {len(labeled)} labeled examples")
+    finally:
+        await es.close()
+    return examples
+
+
+def precision_recall(predicted, actual):
+    true_positive = sum(1 for p, a in zip(predicted, actual) if p and a)
+    predicted_positive = sum(predicted)
+    actual_positive = sum(actual)
+    precision = true_positive / predicted_positive if predicted_positive else 0.0
+    recall = true_positive / actual_positive if actual_positive else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+
+def per_message_us(func, messages, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            func(message)
+    return (time.perf_counter() - start) / (repeat * len(messages)) * 1e6
+
+
+def split(examples, test_fraction, seed):
+    rng = random.Random(seed)
+    train, test = [], []
+    for label in (0, 1):
+        group = [e for e in examples if e[1] == label]
+        rng.shuffle(group)
+        cut = max(1, int(len(group) * test_fraction))
+        test += group[:cut]
+        train += group[cut:]
+    return train, test
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", default="local_model.npz")
+    parser.add_argument("--labeled", action="append", default=[], help="JSONL file of {message, label} rows")
+    parser.add_argument("--labeled-index", default="labeled_messages")
+    parser.add_argument("--no-es", action="store_true", help="train only from seed messages and --labeled files")
+    parser.add_argument("--feature-bits", type=int, default=DEFAULT_FEATURE_BITS)
+    parser.add_argument("--epochs", type=int, default=500)
+    parser.add_argument("--test-fraction", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    examples = [(m, 1) for m in SEED_SCAM] + [(m, 0) for m in SEED_LEGITIMATE]
+    for path in args.labeled:
+        examples += list(load_jsonl(path))
+    if not args.no_es:
+        try:
+            examples += asyncio.run(load_from_es(args.labeled_index))
+        except Exception as e:
+            print(f"Elasticsearch unavailable ({type(e).__name__}: {e}), continuing without it")
+    examples = list(dict.fromkeys(examples))
+    print(f"{len(examples)} examples ({sum(label for _, label in examples)} scam)")
+
+    train, test = split(examples, args.test_fraction, args.seed)
+    model = train_logistic_regression([m for m, _ in train], [l for _, l in train], args.feature_bits, args.epochs)
+
+    engine = get_keyword_engine()
+    actual = [label for _, label in test]
+    keyword_scores = [engine.analyze(m)["risk_score"] for m, _ in test]
+    probabilities = [model.predict_proba(m) for m, _ in test]
+    keyword_metrics = precision_recall([s >= settings.RISK_SCORE_WARN_THRESHOLD for s in keyword_scores], actual)
+    model_metrics = precision_recall([p >= 0.5 for p in probabilities], actual)
+    decided = sum(1 for p in probabilities if p < settings.LOCAL_MODEL_PASS_BELOW or p > settings.LOCAL_MODEL_BLOCK_ABOVE)
+
+    print("=" * 60)
+    print(f"held-out messages: {len(test)}")
+    print(f"{'scorer':<28}{'precision':>10}{'recall':>10}{'f1':>10}")
+    print(f"{'keywords (score >= WARN)':<28}" + "".join(f"{v:>10.3f}" for v in keyword_metrics))
+    print(f"{'local model (p >= 0.5)':<28}" + "".join(f"{v:>10.3f}" for v in model_metrics))
+    print(f"decided locally at {settings.LOCAL_MODEL_PASS_BELOW}/{settings.LOCAL_MODEL_BLOCK_ABOVE}: {decided}/{len(test)}")
+
+    sample = [m for m, _ in examples]
+    keyword_us = per_message_us(engine.analyze, sample)
+    model_us = per_message_us(model.predict_proba, sample)
+    print(f"keyword scorer: {keyword_us:.1f}us/message ({1e6 / keyword_us:,.0f} messages/s)")
+    print(f"local model:    {model_us:.1f}us/message ({1e6 / model_us:,.0f} messages/s)")
+    print("=" * 60)
+
+    model.metadata = {
+        "trained_at": datetime.utcnow().isoformat(),
+        "train_examples": len(train),
+        "test_examples": len(test),
+        "precision": round(model_metrics[0], 4),
+        "recall": round(model_metrics[1], 4)
+    }
+    model.save(args.output)
+    print(f"Saved {args.output} ({os.path.getsize(args.output) / 1024:.1f} KiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+from config.settings import settings
+from services.redis_client import redis_available, cache_get, cache_set, cache_delete_prefix
+from services.gemini_client import SCAM_ANALYSIS_SYSTEM_PROMPT
+
+logger = logging.getLogger("scamshield.analysis_cache")
+
+CACHED_FIELDS = ("risk_score", "detected_tactics", "analysis", "confidence")
+
+cache_counters: Counter = Counter()
+
+
+class LocalTTLCache:
+    """Bounded LRU with a per-entry TTL, used in front of Redis."""
+    
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            cache_counters["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            cache_counters["evictions"] += 1
+    
+    def clear(self):
+        self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+local_cache = LocalTTLCache(
+    max_entries=settings.ANALYSIS_CACHE_LOCAL_MAX_ENTRIES,
+    ttl_seconds=settings.ANALYSIS_CACHE_LOCAL_TTL_SECONDS
+)
+
+
+def normalize_message(message: str) -> str:
+    return ' '.join(message.lower().split())
+
+
+def analysis_cache_version() -> str:
+    """Changes whenever the prompt, model or manual cache version changes, orphaning old entries."""
+    fingerprint = f"{settings.ANALYSIS_CACHE_VERSION}|{settings.GEMINI_MODEL}|{SCAM_ANALYSIS_SYSTEM_PROMPT}"
+    return hashlib.sha256(fingerprint.encode()).hexdigest()[:12]
+
+
+def analysis_cache_key(message: str, urls: List[str]) -> str:
+    content = normalize_message(message) + "\n" + "\n".join(sorted(url.lower() for url in urls))
+    return f"analysis:{analysis_cache_version()}:{hashlib.sha256(content.encode()).hexdigest()}"
+
+
+async def get_cached_analysis(message: str, urls: List[str]) -> Optional[Dict[str, Any]]:
+    if not settings.ANALYSIS_CACHE_ENABLED:
+        return None
+    key = analysis_cache_key(message, urls)
+    
+    result = local_cache.get(key)
+    if result is not None:
+        cache_counters["local_hits"] += 1
+        return result
+    
+    if redis_available():
+        result = await cache_get(key)
+        if isinstance(result, dict):
+            cache_counters["redis_hits"] += 1
+            local_cache.set(key, result)
+            return result
+    
+    cache_counters["misses"] += 1
+    return None
+
+
+async def set_cached_analysis(message: str, urls: List[str], result: Dict[str, Any]) -> bool:
+    if not settings.ANALYSIS_CACHE_ENABLED:
+        return False
+    key = analysis_cache_key(message, urls)
+    value = {field: result[field] for field in CACHED_FIELDS if field in result}
+    local_cache.set(key, value)
+    cache_counters["sets"] += 1
+    if redis_available():
+        return await cache_set(key, value, ttl_seconds=settings.ANALYSIS_CACHE_TTL_SECONDS)
+    return True
+
+
+async def invalidate_analysis_cache() -> int:
+    """Drop every cached analysis, in-process and in Redis, regardless of version."""
+    local_cache.clear()
+    deleted = 0
+    if redis_available():
+        deleted = await cache_delete_prefix("analysis:")
+    cache_counters["invalidations"] += 1
+    logger.info(f"Analysis cache invalidated ({deleted} Redis entries removed)")
+    return deleted
+
+
+def get_analysis_cache_stats() -> Dict[str, Any]:
+    lookups = cache_counters["local_hits"] + cache_counters["redis_hits"] + cache_counters["misses"]
+    hits = cache_counters["local_hits"] + cache_counters["redis_hits"]
+    return {
+        **{name: cache_counters[name] for name in ("local_hits", "redis_hits", "misses", "sets", "evictions", "expirations", "invalidations")},
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "local_size": len(local_cache),
+        "version": analysis_cache_version()
+    }
@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+from config.settings import settings
+from services.incident_logs import INCIDENT_LOGS_ALIAS, incident_index
+
+logger = logging.getLogger("scamshield.bulk_writer")
+
+# bulk item statuses worth another attempt; anything else (mapping errors and the like) would fail again
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class BufferedDocument:
+    __slots__ = ("index", "doc_id", "source", "size", "attempts")
+
+    def __init__(self, index: str, source: Dict[str, Any]):
+        # a fixed index and id make a retry after an ambiguous failure overwrite instead of duplicating
+        self.index = index
+        self.doc_id = uuid.uuid4().hex
+        self.source = source
+        self.size = len(json.dumps(source, default=str))
+        self.attempts = 0
+
+
+class BulkWriter:
+    """
+    Write-behind buffer for one index. Documents are queued by submit() and
+    written with _bulk once batch_docs or batch_bytes are buffered, or every
+    flush interval. index_for, if given, picks each document's index (such
+    as a daily index) and index only names the writer. Items that fail with
+    a retryable status are requeued with backoff up to max_retries. At most
+    max_buffered documents are held: a full buffer makes submit() wait up
+    to backpressure_ms for a flush, after which the new document is dropped.
+    """
+
+    def __init__(self, index: str, batch_docs: int, batch_bytes: int, flush_interval_ms: int,
+                 max_buffered: int, backpressure_ms: int, max_retries: int, retry_backoff_ms: int,
+                 index_for: Optional[Callable[[Dict[str, Any]], str]] = None):
+        self.index = index
+        self.index_for = index_for
+        self.batch_docs = batch_docs
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_buffered = max_buffered
+        self.backpressure = backpressure_ms / 1000
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff_ms / 1000
+        self.buffer: Deque[BufferedDocument] = deque()
+        self.buffered_bytes = 0
+        self.retry_after = 0.0
+        self._space = asyncio.Event()
+        self._space.set()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._interval_task: Optional[asyncio.Task] = None
+        self.counters: Counter = Counter()
+
+    async def submit(self, source: Dict[str, Any]) -> bool:
+        """Queue a document; False if it was dropped because the buffer stayed full."""
+        if len(self.buffer) >= self.max_buffered:
+            self.counters["backpressure_waits"] += 1
+            self._space.clear()
+            self._schedule_flush()
+            try:
+                await asyncio.wait_for(self._space.wait(), self.backpressure)
+            except asyncio.TimeoutError:
+                pass
+            if len(self.buffer) >= self.max_buffered:
+                self.counters["dropped_full"] += 1
+                return False
+        document = BufferedDocument(self.index_for(source) if self.index_for else self.index, source)
+        self.buffer.append(document)
+        self.buffered_bytes += document.size
+        self.counters["submitted"] += 1
+        if len(self.buffer) >= self.batch_docs or self.buffered_bytes >= self.batch_bytes:
+            self._schedule_flush()
+        return True
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self.flush())
+
+    def _take_batch(self) -> List[BufferedDocument]:
+        batch, size = [], 0
+        while self.buffer and len(batch) < self.batch_docs and (not batch or size + self.buffer[0].size <= self.batch_bytes):
+            document = self.buffer.popleft()
+            self.buffered_bytes -= document.size
+            size += document.size
+            batch.append(document)
+        return batch
+
+    def _requeue(self, documents: List[BufferedDocument]):
+        retry = []
+        for document in documents:
+            document.attempts += 1
+            if document.attempts > self.max_retries:
+                self.counters["dropped_failed"] += 1
+            else:
+                retry.append(document)
+        # ahead of newer documents, so a retried incident isn't written after later ones
+        self.buffer.extendleft(reversed(retry))
+        self.buffered_bytes += sum(document.size for document in retry)
+        self.counters["retried"] += len(retry)
+        if retry:
+            attempts = max(document.attempts for document in retry)
+            self.retry_after = time.monotonic() + self.retry_backoff * 2 ** (attempts - 1)
+
+    async def _write(self, batch: List[BufferedDocument]) -> List[BufferedDocument]:
+        """Send one _bulk request; returns the documents to retry."""
+        from services import elasticsearch_client
+        operations: List[Dict[str, Any]] = []
+        for document in batch:
+            operations += [{"index": {"_index": document.index, "_id": document.doc_id}}, document.source]
+        try:
+            result = await elasticsearch_client.es_client.bulk(operations=operations)
+        except Exception as e:
+            logger.error(f"Bulk write to {self.index} failed: {type(e).__name__}: {e}")
+            self.counters["failed_requests"] += 1
+            return batch
+        self.counters["bulk_requests"] += 1
+        if not result.get("errors"):
+            self.counters["written"] += len(batch)
+            return []
+        retry = []
+        for document, item in zip(batch, result["items"]):
+            outcome = item.get("index", {})
+            status = outcome.get("status", 500)
+            if status < 300:
+                self.counters["written"] += 1
+            elif status in RETRYABLE_STATUSES:
+                retry.append(document)
+            else:
+                logger.error(f"Dropping {self.index} document rejected with {status}: {outcome.get('error')}")
+                self.counters["dropped_rejected"] += 1
+        return retry
+
+    async def flush(self, force: bool = False) -> bool:
+        """
+        Write buffered documents in batches until the buffer is empty or the
+        next write has to wait for a retry backoff. force ignores the backoff
+        and stops after one pass over what was buffered. False if anything is left.
+        """
+        from services import elasticsearch_client
+        async with self._flush_lock:
+            remaining = len(self.buffer) if force else float("inf")
+            while self.buffer and remaining > 0:
+                if elasticsearch_client.es_client is None:
+                    return False
+                if not force and time.monotonic() < self.retry_after:
+                    return False
+                batch = self._take_batch()
+                remaining -= len(batch)
+                try:
+                    retry = await self._write(batch)
+                except asyncio.CancelledError:
+                    self.buffer.extendleft(reversed(batch))
+                    self.buffered_bytes += sum(document.size for document in batch)
+                    raise
+                self._requeue(retry)
+                if len(self.buffer) < self.max_buffered:
+                    self._space.set()
+                if retry and not force:
+                    return False
+            return not self.buffer
+
+    async def _interval_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Flushing {self.index} failed: {type(e).__name__}: {e}")
+
+    def start(self):
+        if self._interval_task is None:
+            self._interval_task = asyncio.create_task(self._interval_loop())
+
+    async def stop(self, timeout: float):
+        """Stop the interval flush and write what's buffered, retrying until timeout runs out."""
+        from services import elasticsearch_client
+        if self._interval_task:
+            self._interval_task.cancel()
+            self._interval_task = None
+        deadline = time.monotonic() + timeout
+        while self.buffer and elasticsearch_client.es_client is not None and time.monotonic() < deadline:
+            try:
+                if await asyncio.wait_for(self.flush(force=True), max(0.0, deadline - time.monotonic())):
+                    break
+            except asyncio.TimeoutError:
+                break
+            await asyncio.sleep(min(self.retry_backoff, max(0.0, deadline - time.monotonic())))
+        if self.buffer:
+            logger.error(f"Shutting down with {len(self.buffer)} {self.index} documents unwritten")
+            self.counters["dropped_shutdown"] += len(self.buffer)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered": len(self.buffer),
+            "buffered_bytes": self.buffered_bytes,
+            **{name: self.counters[name] for name in (
+                "submitted", "written", "bulk_requests", "retried", "failed_requests", "backpressure_waits",
+                "dropped_full", "dropped_failed", "dropped_rejected", "dropped_shutdown"
+            )}
+        }
+
+
+incident_writer = BulkWriter(
+    index=INCIDENT_LOGS_ALIAS,
+    batch_docs=settings.INCIDENT_WRITER_BATCH_DOCS,
+    batch_bytes=settings.INCIDENT_WRITER_BATCH_BYTES,
+    flush_interval_ms=settings.INCIDENT_WRITER_FLUSH_INTERVAL_MS,
+    max_buffered=settings.INCIDENT_WRITER_MAX_BUFFERED,
+    backpressure_ms=settings.INCIDENT_WRITER_BACKPRESSURE_MS,
+    max_retries=settings.INCIDENT_WRITER_MAX_RETRIES,
+    retry_backoff_ms=settings.INCIDENT_WRITER_RETRY_BACKOFF_MS,
+    index_for=incident_index
+)
+
+
+def start_incident_writer():
+    incident_writer.start()
+
+
+async def stop_incident_writer():
+    await incident_writer.stop(settings.INCIDENT_WRITER_SHUTDOWN_TIMEOUT_SECONDS)
+
+
+def get_incident_writer_stats() -> Dict[str, Any]:
+    return incident_writer.stats()
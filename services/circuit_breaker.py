@@ -0,0 +1,126 @@
+import logging
+import time
+from collections import Counter, deque
+from typing import Dict, Any
+from config.settings import settings
+
+logger = logging.getLogger("scamshield.circuit_breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """The dependency's circuit is open; callers should use their local fallback."""
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker over a sliding time window.
+
+    Closed: calls flow; the breaker opens once at least min_calls outcomes in
+    the last window_seconds have a failure rate >= failure_rate_threshold.
+    Open: calls are refused until open_seconds have passed.
+    Half-open: up to half_open_probes calls are let through; the circuit
+    closes once that many succeed and reopens on any failure.
+    """
+
+    def __init__(self, name: str, window_seconds: float, failure_rate_threshold: float,
+                 min_calls: int, open_seconds: float, half_open_probes: int):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes: deque = deque()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.counters: Counter = Counter()
+
+    def _prune(self, now: float):
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def _transition(self, state: str):
+        logger.warning(f"Circuit '{self.name}': {self.state} -> {state}")
+        self.state = state
+        self.counters[f"to_{state}"] += 1
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        elif state == HALF_OPEN:
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        elif state == CLOSED:
+            self._outcomes.clear()
+
+    def allow_request(self) -> bool:
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+            self._probes_in_flight += 1
+            return True
+        self.counters["rejected"] += 1
+        return False
+
+    def record_success(self):
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self._transition(CLOSED)
+            return
+        now = time.monotonic()
+        self._outcomes.append((now, True))
+        self._prune(now)
+
+    def record_failure(self):
+        if self.state == HALF_OPEN:
+            self._transition(OPEN)
+            return
+        if self.state == OPEN:
+            return
+        now = time.monotonic()
+        self._outcomes.append((now, False))
+        self._prune(now)
+        if len(self._outcomes) >= self.min_calls and self.failure_rate() >= self.failure_rate_threshold:
+            self._transition(OPEN)
+
+    def release_probe(self):
+        """Give back a half-open probe slot for a call that ended without telling us anything about the dependency."""
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, ok in self._outcomes if not ok) / len(self._outcomes)
+
+    def stats(self) -> Dict[str, Any]:
+        self._prune(time.monotonic())
+        return {
+            "state": self.state,
+            "failure_rate": round(self.failure_rate(), 3),
+            "window_calls": len(self._outcomes),
+            "open_for_seconds": round(max(0.0, self.open_seconds - (time.monotonic() - self.opened_at)), 1) if self.state == OPEN else 0.0,
+            **{name: self.counters[name] for name in ("rejected", "to_open", "to_half_open", "to_closed")}
+        }
+
+
+gemini_breaker = CircuitBreaker(
+    name="gemini",
+    window_seconds=settings.GEMINI_BREAKER_WINDOW_SECONDS,
+    failure_rate_threshold=settings.GEMINI_BREAKER_FAILURE_RATE,
+    min_calls=settings.GEMINI_BREAKER_MIN_CALLS,
+    open_seconds=settings.GEMINI_BREAKER_OPEN_SECONDS,
+    half_open_probes=settings.GEMINI_BREAKER_HALF_OPEN_PROBES
+)
+
+
+def get_breaker_stats() -> Dict[str, Any]:
+    return {"gemini": gemini_breaker.stats()}
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Mapping, Optional, Tuple
+from config.settings import settings
+
+logger = logging.getLogger("scamshield.deadline")
+
+
+def new_deadline(budget_ms: Optional[int] = None) -> float:
+    """Monotonic deadline for a request with budget_ms (default REQUEST_DEADLINE_MS) to spend."""
+    return time.monotonic() + (budget_ms or settings.REQUEST_DEADLINE_MS) / 1000
+
+
+def remaining_seconds(state: Mapping[str, Any]) -> float:
+    """Time left in the request's budget; unlimited for states created without a deadline."""
+    deadline = state.get('deadline')
+    if not deadline:
+        return float("inf")
+    return max(0.0, deadline - time.monotonic())
+
+
+def has_budget(state: Mapping[str, Any], needed_ms: int) -> bool:
+    return remaining_seconds(state) * 1000 >= needed_ms
+
+
+async def within_deadline(state: Mapping[str, Any], awaitable: Awaitable[Any], default: Any, stage: str) -> Tuple[Any, bool]:
+    """
+    Await with whatever is left of the request budget. Returns (result, False),
+    or (default, True) if the budget ran out first; the call is cancelled.
+    """
+    remaining = remaining_seconds(state)
+    if remaining == float("inf"):
+        return await awaitable, False
+    try:
+        return await asyncio.wait_for(awaitable, remaining), False
+    except asyncio.TimeoutError:
+        logger.warning(f"Deadline reached during {stage}, degrading")
+        return default, True
+
+
+def _consume_exception(task: asyncio.Future):
+    # the caller sees the exception if it was still waiting; a detached call has no one to raise to
+    if not task.cancelled():
+        task.exception()
+
+
+async def within_deadline_detached(state: Mapping[str, Any], awaitable: Awaitable[Any], default: Any, stage: str) -> Tuple[Any, bool]:
+    """
+    within_deadline for calls whose effect must not be lost: once the budget
+    runs out the request stops waiting, but the call runs to completion.
+    """
+    task = asyncio.ensure_future(awaitable)
+    task.add_done_callback(_consume_exception)
+    return await within_deadline(state, asyncio.shield(task), default, stage)
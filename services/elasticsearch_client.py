@@ -1,7 +1,14 @@
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from elasticsearch import AsyncElasticsearch
 from config.settings import settings
+from services.membership_filter import scam_number_filter
+from services.url_reputation import url_reputation, canonicalize_url, parent_domains
+from services.phone_numbers import phone_number_key
+from services.pattern_index import pattern_index
+from services.bulk_writer import incident_writer
+from services.reputation_writer import reputation_writer
+from services.incident_logs import INCIDENT_LOGS_ALIAS
 
 logger = logging.getLogger("scamshield.elasticsearch")
 
@@ -41,35 +48,117 @@ async def close_elasticsearch():
         logger.info("Elasticsearch client closed")
 
 
+def scam_number_search(phone_number: str) -> Dict[str, Any]:
+    return {"query": {"term": {"phone_number": phone_number}}, "size": 1}
+
+
+def scam_number_from(result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if result['hits']['total']['value'] > 0:
+        return result['hits']['hits'][0]['_source']
+    return None
+
+
+def scam_numbers_search(phone_numbers: List[str]) -> Dict[str, Any]:
+    return {"query": {"terms": {"phone_number": phone_numbers}}, "size": len(phone_numbers)}
+
+
+def scam_numbers_from(result: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    return {hit['_source']['phone_number']: hit['_source'] for hit in result['hits']['hits']}
+
+
+def malicious_url_search(url: str) -> Dict[str, Any]:
+    """Reports of the URL as written, its canonical form, its host or a parent domain."""
+    terms = [url]
+    canonical = canonicalize_url(url)
+    if canonical is not None:
+        terms += [canonical.key, *parent_domains(canonical.host)]
+    return {"query": {"terms": {"url": list(dict.fromkeys(terms))}}, "size": 1}
+
+
+def url_reported_in(result: Dict[str, Any]) -> bool:
+    return result['hits']['total']['value'] > 0
+
+
 async def search_scam_number(phone_number: str) -> Optional[Dict[str, Any]]:
-    try:
-        result = await es_client.search(
-            index="scam_numbers",
-            query={"term": {"phone_number": phone_number}},
-            size=1
-        )
-        if result['hits']['total']['value'] > 0:
-            return result['hits']['hits'][0]['_source']
+    phone_number = phone_number_key(phone_number, settings.DEFAULT_PHONE_COUNTRY_CODE)
+    if not scam_number_filter.might_contain(phone_number):
         return None
+    try:
+        result = await es_client.search(index="scam_numbers", **scam_number_search(phone_number))
+        scam_number = scam_number_from(result)
+        if scam_number is None:
+            scam_number_filter.record_false_positive()
+        return scam_number
     except Exception as e:
         logger.error(f"Error searching scam number: {e}")
         return None
 
 
 async def search_malicious_url(url: str) -> bool:
+    if url_reputation.ready:
+        return url_reputation.is_flagged(url)
     try:
-        result = await es_client.search(
-            index="reported_urls",
-            query={"term": {"url": url}},
-            size=1
-        )
-        return result['hits']['total']['value'] > 0
+        result = await es_client.search(index="reported_urls", **malicious_url_search(url))
+        return url_reported_in(result)
     except Exception as e:
         logger.error(f"Error searching URL: {e}")
         return False
 
 
+async def search_message_reputation(sender: str, phone_numbers: List[str], urls: List[str]) -> Tuple[Optional[Dict[str, Any]], List[str], List[bool]]:
+    """
+    Look up the sender and every phone number in the message body (already
+    E.164) with one terms query, and every URL, in one _msearch round trip.
+    Returns (sender's scam number document or None, reported body numbers,
+    reported flag per URL); a failed sub-search counts as a miss, like the
+    single lookups. Numbers the membership filter rules out, and URLs once
+    the URL reputation index is loaded, are answered without a request.
+    """
+    sender_key = phone_number_key(sender, settings.DEFAULT_PHONE_COUNTRY_CODE)
+    candidates = list(dict.fromkeys(number for number in [sender_key, *phone_numbers] if number))
+    check_numbers = [number for number in candidates if scam_number_filter.might_contain(number)]
+    if url_reputation.ready:
+        reported = [url_reputation.is_flagged(url) for url in urls]
+        check_urls = []
+    else:
+        reported = [False] * len(urls)
+        check_urls = list(range(len(urls)))
+    if not check_numbers and not check_urls:
+        return None, [], reported
+    
+    searches = []
+    if check_numbers:
+        searches += [{"index": "scam_numbers"}, scam_numbers_search(check_numbers)]
+    for i in check_urls:
+        searches += [{"index": "reported_urls"}, malicious_url_search(urls[i])]
+    try:
+        result = await es_client.msearch(searches=searches)
+    except Exception as e:
+        logger.error(f"Error in reputation msearch: {e}")
+        return None, [], reported
+    
+    responses = result['responses']
+    for response in responses:
+        if 'error' in response:
+            logger.error(f"Error in reputation msearch item: {response['error']}")
+    found = {}
+    if check_numbers:
+        numbers_response, responses = responses[0], responses[1:]
+        if 'error' not in numbers_response:
+            found = scam_numbers_from(numbers_response)
+            for number in check_numbers:
+                if number not in found:
+                    scam_number_filter.record_false_positive()
+    for i, response in zip(check_urls, responses):
+        reported[i] = 'error' not in response and url_reported_in(response)
+    reported_numbers = [number for number in phone_numbers if number in found and number != sender_key]
+    return found.get(sender_key), list(dict.fromkeys(reported_numbers)), reported
+
+
 async def search_similar_patterns(message: str, size: int = 5) -> List[Dict[str, Any]]:
+    if pattern_index.ready:
+        return pattern_index.similar_patterns(message, size)
+    pattern_index.counters["fallbacks"] += 1
     try:
         result = await es_client.search(
             index="scam_patterns",
@@ -91,57 +180,49 @@ async def search_similar_patterns(message: str, size: int = 5) -> List[Dict[str,
 
 
 async def log_incident(incident: Dict[str, Any]) -> bool:
-    try:
-        await es_client.index(index="incident_logs", document=incident)
-        return True
-    except Exception as e:
-        logger.error(f"Error logging incident: {e}")
-        return False
-
-
-async def update_scam_number(phone_number: str, scam_types: List[str], risk_score: float) -> bool:
-    from datetime import datetime
-    try:
-        await es_client.update(
-            index="scam_numbers",
-            id=phone_number,
-            body={
-                "script": {
-                    "source": "ctx._source.report_count++; ctx._source.last_reported = params.now; ctx._source.blocked_by_users++",
-                    "params": {"now": datetime.utcnow().isoformat()}
-                },
-                "upsert": {
-                    "phone_number": phone_number,
-                    "report_count": 1,
-                    "first_reported": datetime.utcnow().isoformat(),
-                    "last_reported": datetime.utcnow().isoformat(),
-                    "confidence_score": risk_score,
-                    "scam_types": scam_types,
-                    "blocked_by_users": 1
-                }
-            }
-        )
-        return True
-    except Exception as e:
-        logger.error(f"Error updating scam number: {e}")
+    """Queue the incident for the next bulk write; False if the write buffer was full."""
+    return await incident_writer.submit(incident)
+
+
+async def update_scam_number(phone_number: str, scam_types: List[str], risk_score: Optional[float] = None,
+                             blocked: bool = True, reported_by: Optional[str] = None) -> bool:
+    """
+    Count a block (or, with blocked=False, a user report) of the number
+    toward its community reputation; reported_by is the reporting user, kept
+    on the document. Written by the next reputation flush; False if the
+    update had to be dropped.
+    """
+    phone_number = phone_number_key(phone_number, settings.DEFAULT_PHONE_COUNTRY_CODE)
+    if not reputation_writer.record(phone_number, scam_types, confidence_score=risk_score, blocked=blocked, reported_by=reported_by):
         return False
+    scam_number_filter.remember(phone_number)
+    return True
 
 
-async def get_user_stats_aggregation(user_id: str) -> Dict[str, Any]:
+async def get_user_stats_aggregation(user_id: str, before: Optional[str] = None) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"term": {"user_id": user_id}}
+    if before:
+        query = {"bool": {"filter": [query, {"range": {"timestamp": {"lt": before}}}]}}
     try:
+        # the alias covers the retained daily indices only, so this stays bounded as history grows
         result = await es_client.search(
-            index="incident_logs",
-            query={"term": {"user_id": user_id}},
+            index=INCIDENT_LOGS_ALIAS,
+            query=query,
             aggs={
                 "scam_types": {"terms": {"field": "decision", "size": 5}},
-                "avg_risk": {"avg": {"field": "risk_score"}}
+                "avg_risk": {"avg": {"field": "risk_score"}},
+                "risk_sum": {"sum": {"field": "risk_score"}},
+                "risk_count": {"value_count": {"field": "risk_score"}}
             },
             size=0
         )
         return {
             "scam_types": result["aggregations"]["scam_types"]["buckets"],
-            "avg_risk": result["aggregations"]["avg_risk"]["value"]
+            "avg_risk": result["aggregations"]["avg_risk"]["value"],
+            "risk_sum": result["aggregations"]["risk_sum"]["value"],
+            "risk_count": result["aggregations"]["risk_count"]["value"],
+            "available": True
         }
     except Exception as e:
         logger.error(f"Error getting user stats: {e}")
-        return {"scam_types": [], "avg_risk": 0}
+        return {"scam_types": [], "avg_risk": 0, "risk_sum": 0, "risk_count": 0, "available": False}
@@ -1,38 +1,199 @@
 import logging
-from typing import Optional
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List, Optional
 from langchain_google_genai import ChatGoogleGenerativeAI
 from config.settings import settings
+from services.llm_governor import TokenBucket, estimate_tokens, is_rate_limit_error
+from services.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED
 
 logger = logging.getLogger("scamshield.gemini")
 
+MAIN_TIER = "main"
+FAST_TIER = "fast"
+
 llm: Optional[ChatGoogleGenerativeAI] = None
 
 
-def init_llm() -> ChatGoogleGenerativeAI:
-    """Initialize Gemini LLM with retry-friendly settings."""
-    global llm
-    
-    try:
-        llm = ChatGoogleGenerativeAI(
-            model=settings.GEMINI_MODEL,
-            google_api_key=settings.GEMINI_API_KEY,
-            temperature=settings.GEMINI_TEMPERATURE,
-            max_output_tokens=settings.GEMINI_MAX_TOKENS,
-            request_timeout=60,  # Longer timeout for rate limiting
-            max_retries=3,  # Retry on transient errors
+class PooledClient:
+    """
+    One API key and model. Tracks its own remaining RPM/TPM quota and
+    health, and records the outcome of every call made through ainvoke()
+    and astream(), so it can be handed out wherever an LLM is expected.
+    A failed init is retried after LLM_INIT_RETRY_SECONDS, not on every call.
+    """
+
+    def __init__(self, name: str, api_key: str, model: str, tier: str):
+        self.name = name
+        self.api_key = api_key
+        self.model = model
+        self.tier = tier
+        self.llm: Optional[ChatGoogleGenerativeAI] = None
+        self.init_failed_at: Optional[float] = None
+        self.request_bucket = TokenBucket(settings.GEMINI_RPM_LIMIT, settings.GEMINI_RPM_LIMIT / 60)
+        self.token_bucket = TokenBucket(settings.GEMINI_TPM_LIMIT, settings.GEMINI_TPM_LIMIT / 60)
+        self.breaker = CircuitBreaker(
+            name=f"gemini:{name}",
+            window_seconds=settings.GEMINI_BREAKER_WINDOW_SECONDS,
+            failure_rate_threshold=settings.GEMINI_BREAKER_FAILURE_RATE,
+            min_calls=settings.GEMINI_BREAKER_MIN_CALLS,
+            open_seconds=settings.GEMINI_BREAKER_OPEN_SECONDS,
+            half_open_probes=settings.GEMINI_BREAKER_HALF_OPEN_PROBES
         )
-        logger.info(f"Gemini {settings.GEMINI_MODEL} initialized successfully")
-        return llm
-    except Exception as e:
-        logger.error(f"Failed to initialize Gemini (Continuing without LLM): {type(e).__name__}: {e}")
-        return None
+        self.counters: Counter = Counter()
+
+    def init(self) -> bool:
+        try:
+            self.llm = ChatGoogleGenerativeAI(
+                model=self.model,
+                google_api_key=self.api_key,
+                temperature=settings.GEMINI_TEMPERATURE,
+                max_output_tokens=settings.GEMINI_MAX_TOKENS,
+                request_timeout=60,  # Longer timeout for rate limiting
+                max_retries=3,  # Retry on transient errors
+            )
+        except Exception as e:
+            self.init_failed_at = time.monotonic()
+            logger.error(f"Failed to initialize Gemini client {self.name}: {type(e).__name__}: {e}")
+            return False
+        self.init_failed_at = None
+        logger.info(f"Gemini client {self.name} initialized successfully")
+        return True
+
+    def ready(self) -> bool:
+        if self.llm is not None:
+            return True
+        if self.init_failed_at is not None and time.monotonic() - self.init_failed_at < settings.LLM_INIT_RETRY_SECONDS:
+            return False
+        return self.init()
+
+    def headroom(self) -> float:
+        """Fraction of this client's quota that is left, by whichever of RPM and TPM is lower."""
+        self.request_bucket._refill()
+        self.token_bucket._refill()
+        return min(self.request_bucket.tokens / self.request_bucket.capacity,
+                   self.token_bucket.tokens / self.token_bucket.capacity)
+
+    def _reserve(self, messages: List[Any]):
+        self.counters["calls"] += 1
+        self.request_bucket.take(1)
+        self.token_bucket.take(estimate_tokens(m.content for m in messages) + settings.GEMINI_MAX_TOKENS)
+
+    def _record_failure(self, error: Exception):
+        self.counters["failures"] += 1
+        if is_rate_limit_error(error):
+            # this key is out of quota; route around it until the buckets refill
+            self.counters["rate_limited"] += 1
+            self.request_bucket.drain()
+            self.token_bucket.drain()
+        self.breaker.record_failure()
+
+    async def ainvoke(self, messages: List[Any]) -> Any:
+        self._reserve(messages)
+        try:
+            response = await self.llm.ainvoke(messages)
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+        self.breaker.record_success()
+        return response
+
+    async def astream(self, messages: List[Any]) -> AsyncIterator[Any]:
+        self._reserve(messages)
+        try:
+            async for chunk in self.llm.astream(messages):
+                yield chunk
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+        self.breaker.record_success()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "tier": self.tier,
+            "ready": self.llm is not None,
+            "state": self.breaker.state,
+            "headroom": round(self.headroom(), 3),
+            **{name: self.counters[name] for name in ("selected", "calls", "failures", "rate_limited")}
+        }
 
 
-def get_llm() -> ChatGoogleGenerativeAI:
+class LLMClientPool:
+    """
+    Gemini clients for every configured key and model. A request goes to
+    the healthy client of its tier with the most quota left, and to the
+    other tier if none of its own is healthy.
+    """
+
+    def __init__(self, clients: List[PooledClient]):
+        self.clients = clients
+        self.counters: Counter = Counter()
+
+    def has_tier(self, tier: str) -> bool:
+        return any(client.tier == tier for client in self.clients)
+
+    def select(self, tier: str = MAIN_TIER) -> PooledClient:
+        preferred = [client for client in self.clients if client.tier == tier]
+        others = [client for client in self.clients if client.tier != tier]
+        for group in (preferred, others):
+            # closed circuits first, then by remaining quota
+            for client in sorted(group, key=lambda c: (c.breaker.state != CLOSED, -c.headroom())):
+                if client.ready() and client.breaker.allow_request():
+                    client.counters["selected"] += 1
+                    if client.tier != tier:
+                        self.counters[f"{tier}_rerouted"] += 1
+                    return client
+        self.counters["unavailable"] += 1
+        raise CircuitOpenError("No healthy Gemini client")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **{name: self.counters[name] for name in ("escalations", "fast_rerouted", "main_rerouted", "unavailable")},
+            "clients": {client.name: client.stats() for client in self.clients}
+        }
+
+
+def build_pool() -> LLMClientPool:
+    models = [(MAIN_TIER, settings.GEMINI_MODEL)]
+    if settings.GEMINI_FAST_MODEL:
+        models.append((FAST_TIER, settings.GEMINI_FAST_MODEL))
+    clients = [
+        PooledClient(f"{model}/key{number}", api_key, model, tier)
+        for tier, model in models
+        for number, api_key in enumerate(settings.gemini_api_keys(), start=1)
+    ]
+    return LLMClientPool(clients)
+
+
+gemini_pool = build_pool()
+
+
+def init_llm() -> Optional[ChatGoogleGenerativeAI]:
+    """Initialize every pooled Gemini client; returns the first main-tier model, or None."""
+    global llm
+    for client in gemini_pool.clients:
+        client.init()
+    llm = next((c.llm for c in gemini_pool.clients if c.tier == MAIN_TIER and c.llm is not None), None)
     if llm is None:
-        return init_llm()
+        logger.error("Failed to initialize Gemini (Continuing without LLM)")
     return llm
- 
+
+
+def get_llm(tier: str = MAIN_TIER) -> PooledClient:
+    """Pick a client for the tier; raises CircuitOpenError if none is healthy."""
+    return gemini_pool.select(tier)
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    return gemini_pool.stats()
+
 
 SCAM_ANALYSIS_SYSTEM_PROMPT = """You are an expert scam detection AI. Analyze the following message for scam indicators.
 
@@ -49,13 +210,13 @@ Respond ONLY in valid JSON format. Do not use markdown code blocks or backticks:
 {
     "risk_score": <0-100 integer>,
     "detected_tactics": [<list of tactics found from above>],
+    "confidence": <0.0-1.0 float>,
     "analysis": {
         "urgency_indicators": [<phrases that create urgency>],
         "authority_claims": [<entities being impersonated>],
         "threats_found": [<threatening language>],
         "suspicious_elements": [<other suspicious elements>]
     },
-    "confidence": <0.0-1.0 float>,
     "explanation": "<brief one-line explanation>"
 }"""
 
@@ -68,3 +229,41 @@ MESSAGE: {message}
 URLS FOUND: {urls if urls else "None"}
 
 Respond with JSON only."""
+
+
+SCAM_BATCH_ANALYSIS_SYSTEM_PROMPT = """You are an expert scam detection AI. You will receive several numbered messages. Analyze each one independently for scam indicators.
+
+Check for these manipulation tactics:
+1. URGENCY: Words like "URGENT", "ACT NOW", "IMMEDIATELY", "LIMITED TIME"
+2. AUTHORITY: Claims from "IRS", "Bank", "Police", "Government", "Social Security"
+3. THREATS: "suspended", "arrested", "legal action", "account closed"
+4. TOO_GOOD: "You won!", "Free money", "Selected winner", "Inheritance"
+5. SUSPICIOUS_URLS: Shortened URLs, misspellings, unusual domains
+6. EMOTIONAL: "Your grandson needs help", "Family emergency"
+7. INFO_REQUEST: Asking for SSN, passwords, OTP, bank details
+
+Respond ONLY with a valid JSON array containing one object per message, in the same order. Do not use markdown code blocks or backticks. Keep every list short:
+[
+    {
+        "id": <message number>,
+        "risk_score": <0-100 integer>,
+        "detected_tactics": [<list of tactics found from above>],
+        "analysis": {
+            "urgency_indicators": [<phrases that create urgency>],
+            "authority_claims": [<entities being impersonated>],
+            "threats_found": [<threatening language>],
+            "suspicious_elements": [<other suspicious elements>]
+        },
+        "confidence": <0.0-1.0 float>
+    }
+]"""
+
+
+def get_batch_analysis_prompt(items: list) -> str:
+    sections = []
+    for number, item in enumerate(items, start=1):
+        sections.append(f"""MESSAGE {number}
+SENDER: {item['sender']}
+MESSAGE: {item['message']}
+URLS FOUND: {item['urls'] if item['urls'] else "None"}""")
+    return "Analyze each of these messages for scam indicators:\n\n" + "\n\n".join(sections) + "\n\nRespond with a JSON array only."
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+from config.settings import settings
+from services.redis_client import acquire_lock
+
+logger = logging.getLogger("scamshield.incident_logs")
+
+# Incidents go to one index per UTC day (incident_logs-2026.10.16). The index
+# template puts each new index behind the incident_logs alias, which readers search.
+INCIDENT_LOGS_ALIAS = "incident_logs"
+INCIDENT_INDEX_PREFIX = "incident_logs-"
+INCIDENT_INDEX_DATE_FORMAT = "%Y.%m.%d"
+RETENTION_LOCK = "incident_logs_retention"
+
+retention_task: Optional[asyncio.Task] = None
+retention_stats: Dict[str, Any] = {"indices_deleted": 0, "last_run": None}
+
+
+def incident_index(incident: Dict[str, Any]) -> str:
+    """The daily index for an incident, from its timestamp (ISO string, UTC)."""
+    timestamp = incident.get("timestamp")
+    try:
+        day = datetime.fromisoformat(timestamp) if timestamp else datetime.utcnow()
+    except ValueError:
+        day = datetime.utcnow()
+    return INCIDENT_INDEX_PREFIX + day.strftime(INCIDENT_INDEX_DATE_FORMAT)
+
+
+def index_day(index_name: str) -> Optional[datetime]:
+    if not index_name.startswith(INCIDENT_INDEX_PREFIX):
+        return None
+    try:
+        return datetime.strptime(index_name[len(INCIDENT_INDEX_PREFIX):], INCIDENT_INDEX_DATE_FORMAT)
+    except ValueError:
+        return None
+
+
+def expired_indices(index_names: Iterable[str], retention_days: int, now: Optional[datetime] = None) -> List[str]:
+    """Daily indices holding only incidents older than retention_days. Names that don't parse are kept."""
+    cutoff = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=retention_days)
+    return sorted(name for name in index_names if (day := index_day(name)) is not None and day < cutoff)
+
+
+async def apply_retention() -> int:
+    """Delete expired daily indices. The lock is left to expire, so one worker runs this per interval."""
+    from services import elasticsearch_client
+    es = elasticsearch_client.es_client
+    if es is None or not await acquire_lock(RETENTION_LOCK, uuid.uuid4().hex, int(settings.INCIDENT_LOG_RETENTION_CHECK_SECONDS * 900)):
+        return 0
+    indices = await es.indices.get(index=INCIDENT_INDEX_PREFIX + "*", ignore_unavailable=True, allow_no_indices=True)
+    expired = expired_indices(indices, settings.INCIDENT_LOG_RETENTION_DAYS)
+    if expired:
+        await es.indices.delete(index=",".join(expired))
+        logger.info(f"Deleted {len(expired)} incident_logs indices past {settings.INCIDENT_LOG_RETENTION_DAYS} days: {expired[0]}..{expired[-1]}")
+    retention_stats["indices_deleted"] += len(expired)
+    retention_stats["last_run"] = datetime.utcnow().isoformat()
+    return len(expired)
+
+
+async def _retention_loop():
+    while True:
+        try:
+            await apply_retention()
+        except Exception as e:
+            logger.error(f"incident_logs retention failed: {type(e).__name__}: {e}")
+        await asyncio.sleep(settings.INCIDENT_LOG_RETENTION_CHECK_SECONDS)
+
+
+def start_incident_retention():
+    global retention_task
+    retention_task = asyncio.create_task(_retention_loop())
+
+
+async def stop_incident_retention():
+    global retention_task
+    if retention_task:
+        retention_task.cancel()
+        retention_task = None
+
+
+def get_incident_retention_stats() -> Dict[str, Any]:
+    return {"retention_days": settings.INCIDENT_LOG_RETENTION_DAYS, **retention_stats}
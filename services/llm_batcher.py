@@ -0,0 +1,151 @@
+import asyncio
+import json
+import logging
+import re
+from collections import Counter
+from typing import Optional, Dict, Any, List, Tuple
+from langchain_core.messages import HumanMessage, SystemMessage
+from config.settings import settings
+from services.gemini_client import get_llm, SCAM_BATCH_ANALYSIS_SYSTEM_PROMPT, get_batch_analysis_prompt
+from services.llm_governor import llm_governor, estimate_tokens, PRIORITY_INTERACTIVE
+
+logger = logging.getLogger("scamshield.llm_batcher")
+
+batch_counters: Counter = Counter()
+
+
+def _valid_item(item: Any) -> bool:
+    if not isinstance(item, dict):
+        return False
+    risk_score = item.get("risk_score")
+    return isinstance(risk_score, (int, float)) and 0 <= risk_score <= 100
+
+
+def parse_batch_response(response_text: str, item_count: int) -> Dict[int, Dict[str, Any]]:
+    """
+    Map message number -> analysis for every item that parsed cleanly.
+
+    A truncated or partly malformed array still yields the objects that
+    decode on their own, so only the broken items need a second call.
+    """
+    text = response_text.strip()
+    if "```" in text:
+        match = re.search(r"```(?:\w+)?\n?(.*?)```", text, re.DOTALL)
+        if match:
+            text = match.group(1).strip()
+
+    try:
+        items = json.loads(text[text.index("["):text.rindex("]") + 1])
+        if not isinstance(items, list):
+            items = []
+    except ValueError:
+        items = []
+        decoder = json.JSONDecoder()
+        position = text.find("{")
+        while position != -1:
+            try:
+                item, end = decoder.raw_decode(text, position)
+                items.append(item)
+                position = text.find("{", end)
+            except json.JSONDecodeError:
+                position = text.find("{", position + 1)
+
+    results: Dict[int, Dict[str, Any]] = {}
+    positional = len(items) == item_count
+    for index, item in enumerate(items, start=1):
+        if not _valid_item(item):
+            continue
+        number = item.get("id", index if positional else None)
+        if isinstance(number, int) and 1 <= number <= item_count:
+            results[number] = item
+    return results
+
+
+class GeminiMicroBatcher:
+    """
+    Collects analysis requests for a short window and sends them to Gemini as
+    one multi-message prompt. Each caller gets its own analysis back, or None
+    if its item was missing from the reply, or the batched call failed, and
+    should be analyzed on its own.
+    """
+
+    def __init__(self, max_batch_size: int, window_ms: int):
+        self.max_batch_size = max_batch_size
+        self.window_seconds = window_ms / 1000
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+    async def submit(self, sender: str, message: str, urls: List[str], priority: int = PRIORITY_INTERACTIVE) -> Optional[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(({"sender": sender, "message": message, "urls": urls, "priority": priority}, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        if len(batch) == 1:
+            # nothing to amortize, let the caller make its usual single call
+            batch_counters["single_items"] += 1
+            batch[0][1].set_result(None)
+            return
+
+        items = [item for item, _ in batch]
+        messages = [
+            SystemMessage(content=SCAM_BATCH_ANALYSIS_SYSTEM_PROMPT),
+            HumanMessage(content=get_batch_analysis_prompt(items))
+        ]
+        # the batch is as urgent as its most urgent item
+        priority = min(item["priority"] for item in items)
+        estimated_tokens = estimate_tokens(m.content for m in messages) + settings.GEMINI_MAX_TOKENS
+        try:
+            llm = get_llm()
+            response = await llm_governor.run(lambda: llm.ainvoke(messages), priority, estimated_tokens)
+            results = parse_batch_response(response.content, len(items))
+        except Exception as e:
+            # each item falls back to its single call, with its own retries and breaker
+            # accounting, rather than one failure counting against the breaker per item
+            logger.error(f"Batched Gemini call failed for {len(batch)} messages, retrying them individually: {type(e).__name__}: {e}")
+            batch_counters["failed_batches"] += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+            return
+
+        batch_counters["batches"] += 1
+        batch_counters["batched_items"] += len(batch)
+        batch_counters["unparsed_items"] += len(batch) - len(results)
+        if len(results) < len(batch):
+            logger.warning(f"Batched Gemini reply parsed {len(results)}/{len(batch)} items, retrying the rest individually")
+        for number, (_, future) in enumerate(batch, start=1):
+            if not future.done():
+                future.set_result(results.get(number))
+
+
+gemini_batcher = GeminiMicroBatcher(
+    max_batch_size=settings.LLM_BATCH_MAX_SIZE,
+    window_ms=settings.LLM_BATCH_WINDOW_MS
+)
+
+
+def get_batcher_stats() -> Dict[str, Any]:
+    batches = batch_counters["batches"]
+    return {
+        **{name: batch_counters[name] for name in ("batches", "batched_items", "unparsed_items", "failed_batches", "single_items")},
+        "avg_batch_size": round(batch_counters["batched_items"] / batches, 2) if batches else 0.0,
+        "pending": len(gemini_batcher._pending)
+    }
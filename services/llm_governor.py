@@ -0,0 +1,239 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import re
+import time
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from config.settings import settings
+
+try:
+    from google.api_core.exceptions import ResourceExhausted, TooManyRequests
+    RATE_LIMIT_EXCEPTIONS: tuple = (ResourceExhausted, TooManyRequests)
+except ImportError:
+    RATE_LIMIT_EXCEPTIONS = ()
+
+logger = logging.getLogger("scamshield.llm_governor")
+
+# Lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_NAMES = {"interactive": PRIORITY_INTERACTIVE, "bulk": PRIORITY_BULK}
+
+
+class GovernorTimeout(Exception):
+    """A request waited longer than LLM_QUEUE_TIMEOUT_SECONDS for a Gemini slot."""
+
+
+# wrappers that only keep the message still carry the status: "429 RESOURCE_EXHAUSTED ..."
+RATE_LIMIT_MESSAGE = re.compile(r"\b429\b|\bRESOURCE_EXHAUSTED\b|\bTOO_MANY_REQUESTS\b")
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """
+    True for quota errors only: the API's 429 exception types, a 429
+    status code, or a 429 status in the message, on the error or anything
+    it was raised from. Other failures must not pause the whole governor.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if RATE_LIMIT_EXCEPTIONS and isinstance(error, RATE_LIMIT_EXCEPTIONS):
+            return True
+        if any(getattr(error, name, None) == 429 for name in ("code", "status_code")):
+            return True
+        if RATE_LIMIT_MESSAGE.search(str(error)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def estimate_tokens(texts: Iterable[str]) -> int:
+    # roughly four characters per token for English text
+    return sum(len(text) for text in texts) // 4 + 1
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount tokens are available (0 if they are now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def drain(self):
+        self._refill()
+        self.tokens = 0
+
+
+class LLMGovernor:
+    """
+    Shared admission control for Gemini calls.
+
+    Requests queue by priority, interactive before bulk. A request is
+    dispatched when a concurrency slot is free and the RPM and TPM buckets
+    can pay for it. The concurrency limit follows AIMD: it grows by
+    1/limit per fast success and halves on a 429. A 429 also pauses
+    dispatch for everyone, instead of each request sleeping on its own.
+    """
+
+    def __init__(self, rpm: int, tpm: int, max_concurrency: int, min_concurrency: int,
+                 latency_target_ms: int, queue_timeout_seconds: float):
+        self.request_bucket = TokenBucket(rpm, rpm / 60)
+        self.token_bucket = TokenBucket(tpm, tpm / 60)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.latency_target = latency_target_ms / 1000
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.active = 0
+        self.paused_until = 0.0
+        self._queue: list = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._consecutive_rate_limits = 0
+        self.wait_times: deque = deque(maxlen=1000)
+        self.counters: Counter = Counter()
+
+    def _schedule_wakeup(self, delay: float):
+        if self._wakeup is not None:
+            return
+        loop = asyncio.get_running_loop()
+
+        def wake():
+            self._wakeup = None
+            self._dispatch()
+        self._wakeup = loop.call_later(delay, wake)
+
+    def _dispatch(self):
+        while self._queue and self.active < int(self.concurrency_limit):
+            _, _, future, tokens, _ = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+            delay = max(
+                self.paused_until - time.monotonic(),
+                self.request_bucket.wait_time(1),
+                self.token_bucket.wait_time(tokens)
+            )
+            if delay > 0:
+                self._schedule_wakeup(delay)
+                return
+            heapq.heappop(self._queue)
+            self.request_bucket.take(1)
+            self.token_bucket.take(tokens)
+            self.active += 1
+            future.set_result(None)
+
+    async def _acquire(self, priority: int, tokens: int):
+        future = asyncio.get_running_loop().create_future()
+        enqueued_at = time.monotonic()
+        heapq.heappush(self._queue, (priority, next(self._sequence), future, tokens, enqueued_at))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # the slot was granted as we gave up; hand it back
+                self._release()
+            else:
+                future.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self.counters["queue_timeouts"] += 1
+                raise GovernorTimeout(f"No Gemini capacity within {self.queue_timeout_seconds}s")
+            raise
+        self.wait_times.append(time.monotonic() - enqueued_at)
+
+    def _release(self):
+        self.active -= 1
+        self._dispatch()
+
+    def _on_success(self, latency: float):
+        self._consecutive_rate_limits = 0
+        if latency > self.latency_target:
+            self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit * 0.9)
+        else:
+            self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+
+    def _on_rate_limited(self):
+        self.counters["rate_limited"] += 1
+        self._consecutive_rate_limits += 1
+        self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+        self.request_bucket.drain()
+        backoff = min(30.0, 2.0 ** self._consecutive_rate_limits)
+        self.paused_until = max(self.paused_until, time.monotonic() + backoff)
+        logger.warning(f"Gemini rate limited: concurrency limit {self.concurrency_limit:.1f}, pausing dispatch {backoff:.0f}s")
+
+    async def run(self, call: Callable[[], Awaitable[Any]], priority: int = PRIORITY_INTERACTIVE, estimated_tokens: int = 0) -> Any:
+        """Wait for a slot under the quota, then run call()."""
+        await self._acquire(priority, estimated_tokens)
+        self.counters["granted_interactive" if priority == PRIORITY_INTERACTIVE else "granted_bulk"] += 1
+        started = time.monotonic()
+        try:
+            result = await call()
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self._on_rate_limited()
+            raise
+        else:
+            self._on_success(time.monotonic() - started)
+            return result
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        waiting = [entry for entry in self._queue if not entry[2].done()]
+        waits = list(self.wait_times)
+        return {
+            "queue_depth": len(waiting),
+            "queue_depth_interactive": sum(1 for entry in waiting if entry[0] == PRIORITY_INTERACTIVE),
+            "queue_depth_bulk": sum(1 for entry in waiting if entry[0] == PRIORITY_BULK),
+            "active": self.active,
+            "concurrency_limit": round(self.concurrency_limit, 2),
+            "paused_for_seconds": round(max(0.0, self.paused_until - time.monotonic()), 2),
+            "wait_ms_p50": round(percentile(waits, 50) * 1000, 1),
+            "wait_ms_p95": round(percentile(waits, 95) * 1000, 1),
+            **{name: self.counters[name] for name in ("granted_interactive", "granted_bulk", "rate_limited", "queue_timeouts")}
+        }
+
+
+# every pooled key and model has its own quota
+POOLED_CLIENTS = len(settings.gemini_api_keys()) * settings.gemini_model_count()
+
+llm_governor = LLMGovernor(
+    rpm=settings.GEMINI_RPM_LIMIT * POOLED_CLIENTS,
+    tpm=settings.GEMINI_TPM_LIMIT * POOLED_CLIENTS,
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    min_concurrency=settings.LLM_MIN_CONCURRENCY,
+    latency_target_ms=settings.LLM_LATENCY_TARGET_MS,
+    queue_timeout_seconds=settings.LLM_QUEUE_TIMEOUT_SECONDS
+)
+
+
+def get_governor_stats() -> Dict[str, Any]:
+    return llm_governor.stats()
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Dict
+from config.settings import settings
+from services.llm_governor import percentile
+
+logger = logging.getLogger("scamshield.llm_hedging")
+
+
+class RequestHedger:
+    """
+    Hedged requests for tail latency.
+
+    If the first attempt hasn't returned after the hedge_percentile of recent
+    attempt latencies, an identical second attempt is started; whichever
+    finishes first wins and the other is cancelled. At most max_hedge_rate of
+    the last window calls may hedge, so a slow period can't double the quota
+    spent. No hedging until min_samples latencies have been seen.
+    """
+
+    def __init__(self, hedge_percentile: float, max_hedge_rate: float, min_delay_ms: int, min_samples: int, window: int = 1000):
+        self.hedge_percentile = hedge_percentile
+        self.max_hedge_rate = max_hedge_rate
+        self.min_delay = min_delay_ms / 1000
+        self.min_samples = min_samples
+        self.attempt_latencies: deque = deque(maxlen=window)
+        self.recent_hedges: deque = deque(maxlen=window)
+        # what callers saw, and a floor on what they would have seen without hedging
+        self.call_latencies: deque = deque(maxlen=window)
+        self.unhedged_latencies: deque = deque(maxlen=window)
+        self.counters: Counter = Counter()
+
+    def hedge_delay(self) -> float:
+        if len(self.attempt_latencies) < self.min_samples:
+            return float("inf")
+        return max(self.min_delay, percentile(list(self.attempt_latencies), self.hedge_percentile))
+
+    def _hedge_allowed(self) -> bool:
+        # the rate this hedge would bring the window to
+        return (sum(self.recent_hedges) + 1) / (len(self.recent_hedges) + 1) <= self.max_hedge_rate
+
+    async def _timed(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.monotonic()
+        result = await call()
+        self.attempt_latencies.append(time.monotonic() - started)
+        return result
+
+    def _record(self, started: float, hedged: bool, primary_floor: float = 0.0):
+        elapsed = time.monotonic() - started
+        self.counters["calls"] += 1
+        self.recent_hedges.append(hedged)
+        self.call_latencies.append(elapsed)
+        self.unhedged_latencies.append(max(elapsed, primary_floor))
+
+    async def run(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run call(), hedging it with a second call() if it is slow."""
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self._timed(call))
+        try:
+            delay = self.hedge_delay()
+            done, _ = await asyncio.wait({primary}, timeout=None if delay == float("inf") else delay)
+            if done:
+                self._record(started, False)
+                return primary.result()
+            if not self._hedge_allowed():
+                self.counters["skipped_rate_cap"] += 1
+                result = await primary
+                self._record(started, False)
+                return result
+
+            self.counters["hedges"] += 1
+            hedge = asyncio.ensure_future(self._timed(call))
+            pending = {primary, hedge}
+            first_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        first_error = first_error or task.exception()
+                        continue
+                    for loser in pending:
+                        loser.cancel()
+                    if task is hedge:
+                        self.counters["hedge_wins"] += 1
+                        self._record(started, True, primary_floor=time.monotonic() - started)
+                    else:
+                        self._record(started, True)
+                    return task.result()
+            raise first_error
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        finally:
+            if not primary.done():
+                primary.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        calls = list(self.call_latencies)
+        unhedged = list(self.unhedged_latencies)
+        delay = self.hedge_delay()
+        return {
+            **{name: self.counters[name] for name in ("calls", "hedges", "hedge_wins", "skipped_rate_cap")},
+            "hedge_rate": round(sum(self.recent_hedges) / len(self.recent_hedges), 3) if self.recent_hedges else 0.0,
+            "hedge_delay_ms": round(delay * 1000, 1) if delay != float("inf") else None,
+            "latency_ms_p50": round(percentile(calls, 50) * 1000, 1),
+            "latency_ms_p99": round(percentile(calls, 99) * 1000, 1),
+            # lower bound: a cancelled primary counts as finishing when the hedge won
+            "unhedged_latency_ms_p99_at_least": round(percentile(unhedged, 99) * 1000, 1)
+        }
+
+
+gemini_hedger = RequestHedger(
+    hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+    max_hedge_rate=settings.LLM_HEDGE_MAX_RATE,
+    min_delay_ms=settings.LLM_HEDGE_MIN_DELAY_MS,
+    min_samples=settings.LLM_HEDGE_MIN_SAMPLES
+)
+
+
+def get_hedging_stats() -> Dict[str, Any]:
+    return gemini_hedger.stats()
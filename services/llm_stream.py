@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import time
+from collections import Counter, deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from services.llm_governor import llm_governor, percentile
+
+logger = logging.getLogger("scamshield.llm_stream")
+
+stream_counters: Counter = Counter()
+decision_times: deque = deque(maxlen=1000)
+completion_times: deque = deque(maxlen=1000)
+background_tasks: set = set()
+
+
+class IncrementalJSONObject:
+    """
+    Decodes the top-level fields of a JSON object while its text is still
+    arriving. Anything before the first "{" (prose, a ``` fence) is skipped,
+    and each field is available in `fields` as soon as the comma or closing
+    brace after its value has streamed in.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self.complete = False
+        self._position = 0
+        self._member_start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def _decode_member(self, member: str):
+        if not member.strip():
+            return
+        try:
+            self.fields.update(json.loads("{" + member + "}"))
+        except ValueError:
+            # not strict JSON; the caller falls back to parsing the full text
+            pass
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        text = self.text
+        position = self._position
+        if self._member_start is None:
+            brace = text.find("{", position)
+            if brace == -1:
+                self._position = len(text)
+                return
+            self._member_start = position = brace + 1
+            self._depth = 1
+        while position < len(text) and not self.complete:
+            char = text[position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._decode_member(text[self._member_start:position])
+                    self.complete = True
+            elif char == "," and self._depth == 1:
+                self._decode_member(text[self._member_start:position])
+                self._member_start = position + 1
+            position += 1
+        self._position = position
+
+    def has(self, names: Tuple[str, ...]) -> bool:
+        return all(name in self.fields for name in names)
+
+
+def _chunk_text(chunk: Any) -> str:
+    content = getattr(chunk, "content", chunk)
+    return content if isinstance(content, str) else ""
+
+
+def _finish_in_background(stream: asyncio.Task, started: float, on_complete: Callable[[str], Awaitable[Any]]):
+    def done(task: asyncio.Task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            stream_counters["failed_after_decision"] += 1
+            logger.warning(f"Gemini stream failed after the early decision: {type(task.exception()).__name__}: {task.exception()}")
+            return
+        completion_times.append(time.monotonic() - started)
+        follow_up = asyncio.create_task(on_complete(task.result()))
+        background_tasks.add(follow_up)
+        follow_up.add_done_callback(background_tasks.discard)
+    stream.add_done_callback(done)
+
+
+async def stream_until_decision(
+    llm,
+    messages: List[Any],
+    decision_fields: Tuple[str, ...],
+    priority: int,
+    estimated_tokens: int,
+    on_complete: Callable[[str], Awaitable[Any]]
+) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    Stream a completion through the governor and return as soon as every
+    decision field has decoded: (fields so far, ""). The rest of the stream
+    keeps its governor slot, is read in the background, and its full text is
+    passed to on_complete. If the decision fields never decode on their own,
+    waits for the whole stream and returns (None, full text).
+    """
+    decision = asyncio.get_running_loop().create_future()
+    started = time.monotonic()
+
+    async def consume() -> str:
+        parser = IncrementalJSONObject()
+        async for chunk in llm.astream(messages):
+            parser.feed(_chunk_text(chunk))
+            if not decision.done() and parser.has(decision_fields):
+                decision.set_result(dict(parser.fields))
+        return parser.text
+
+    stream = asyncio.create_task(llm_governor.run(consume, priority, estimated_tokens))
+    try:
+        await asyncio.wait({decision, stream}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        stream.cancel()
+        raise
+
+    if decision.done():
+        stream_counters["early_decisions"] += 1
+        decision_times.append(time.monotonic() - started)
+        if stream.done():
+            completion_times.append(time.monotonic() - started)
+            return decision.result(), stream.result() if not stream.exception() else ""
+        _finish_in_background(stream, started, on_complete)
+        return decision.result(), ""
+
+    stream_counters["full_parses"] += 1
+    text = stream.result()
+    elapsed = time.monotonic() - started
+    decision_times.append(elapsed)
+    completion_times.append(elapsed)
+    return None, text
+
+
+def get_stream_stats() -> Dict[str, Any]:
+    decisions = list(decision_times)
+    completions = list(completion_times)
+    return {
+        **{name: stream_counters[name] for name in ("early_decisions", "full_parses", "failed_after_decision")},
+        "decision_ms_p50": round(percentile(decisions, 50) * 1000, 1),
+        "decision_ms_p95": round(percentile(decisions, 95) * 1000, 1),
+        "completion_ms_p50": round(percentile(completions, 50) * 1000, 1),
+        "completion_ms_p95": round(percentile(completions, 95) * 1000, 1),
+        "finishing_in_background": len(background_tasks)
+    }
@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+from config.settings import settings
+
+logger = logging.getLogger("scamshield.membership_filter")
+
+
+class BloomFilter:
+    """
+    Bloom filter sized for capacity items at fp_rate false positives.
+    No false negatives: anything added is always reported as present.
+    Positions use double hashing over one blake2b digest.
+    """
+
+    def __init__(self, capacity: int, fp_rate: float):
+        self.capacity = max(1, capacity)
+        self.fp_rate = fp_rate
+        self.size = max(64, int(math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count = 0
+        self._steps = np.arange(self.hash_count, dtype=np.uint64)
+
+    def _hashes(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        # an odd step can't collapse onto a single position
+        return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+    def add(self, item: str):
+        first, step = self._hashes(item)
+        for i in range(self.hash_count):
+            position = (first + i * step) % self.size
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def add_many(self, items: Iterable[str]):
+        digests = b"".join(hashlib.blake2b(item.encode(), digest_size=16).digest() for item in items)
+        if not digests:
+            return
+        # same positions as add(); uint64 arithmetic wraps, so reduce the operands first to stay exact
+        hashes = np.frombuffer(digests, dtype="<u8").reshape(-1, 2)
+        size = np.uint64(self.size)
+        first = hashes[:, :1] % size
+        step = (hashes[:, 1:] | np.uint64(1)) % size
+        positions = ((first + (self._steps * step) % size) % size).ravel()
+        np.bitwise_or.at(self.bits, (positions >> np.uint64(3)).astype(np.int64), (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)))
+        self.count += len(hashes)
+
+    def __contains__(self, item: str) -> bool:
+        first, step = self._hashes(item)
+        for i in range(self.hash_count):
+            position = (first + i * step) % self.size
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def estimated_fp_rate(self) -> float:
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+
+class IndexFilter:
+    """
+    Bloom filter over one keyword field of an Elasticsearch index. Until
+    the first build succeeds it is not ready and every lookup goes to ES.
+    """
+
+    def __init__(self, index: str, field: str, timestamp_field: str):
+        self.index = index
+        self.field = field
+        self.timestamp_field = timestamp_field
+        self.bloom: Optional[BloomFilter] = None
+        self.built_at = 0.0
+        self.refreshed_since: Optional[datetime] = None
+        self._pending: Optional[List[str]] = None
+        self.counters: Counter = Counter()
+
+    @property
+    def ready(self) -> bool:
+        return self.bloom is not None
+
+    def might_contain(self, value: str) -> bool:
+        if self.bloom is None:
+            return True
+        if value in self.bloom:
+            self.counters["forwarded"] += 1
+            return True
+        self.counters["negatives"] += 1
+        return False
+
+    def record_false_positive(self):
+        """The filter let a value through that Elasticsearch didn't have."""
+        if self.bloom is not None:
+            self.counters["false_positives"] += 1
+
+    def remember(self, value: str):
+        """Called on writes so the value is found before the next refresh."""
+        if self.bloom is not None:
+            self.bloom.add(value)
+        if self._pending is not None:
+            self._pending.append(value)
+
+    async def _scan(self, query: Dict[str, Any]) -> List[str]:
+        from elasticsearch.helpers import async_scan
+        from services import elasticsearch_client
+        values = []
+        async for hit in async_scan(elasticsearch_client.es_client, index=self.index, query={"query": query, "_source": [self.field]}, size=5000):
+            value = hit["_source"].get(self.field)
+            if value:
+                values.append(value)
+        return values
+
+    async def rebuild(self) -> bool:
+        started = datetime.utcnow()
+        # values written while the new filter is built are added before it's swapped in
+        self._pending = []
+        try:
+            values = await self._scan({"match_all": {}})
+            capacity = max(settings.MEMBERSHIP_FILTER_CAPACITY, 2 * len(values))
+            bloom = BloomFilter(capacity, settings.MEMBERSHIP_FILTER_FP_RATE)
+            # about two seconds per million values; keep it off the event loop
+            await asyncio.to_thread(bloom.add_many, values)
+        except Exception as e:
+            logger.error(f"Could not build {self.index} filter: {type(e).__name__}: {e}")
+            return False
+        finally:
+            pending, self._pending = self._pending, None
+        bloom.add_many(pending)
+        self.bloom = bloom
+        self.built_at = time.monotonic()
+        self.refreshed_since = started
+        self.counters["rebuilds"] += 1
+        logger.info(f"{self.index} filter built: {len(values)} values, {bloom.bits.nbytes / 1024:.0f} KiB")
+        return True
+
+    async def refresh(self) -> bool:
+        """Add values written since the last build or refresh, by any worker."""
+        if self.bloom is None or self.refreshed_since is None:
+            return await self.rebuild()
+        started = datetime.utcnow()
+        # overlap a little so writes indexed around the boundary aren't missed
+        since = (self.refreshed_since - timedelta(seconds=settings.MEMBERSHIP_FILTER_REFRESH_SECONDS)).isoformat()
+        try:
+            values = await self._scan({"range": {self.timestamp_field: {"gte": since}}})
+        except Exception as e:
+            logger.error(f"Could not refresh {self.index} filter: {type(e).__name__}: {e}")
+            return False
+        self.bloom.add_many(values)
+        self.refreshed_since = started
+        self.counters["refreshes"] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"ready": self.ready, **{name: self.counters[name] for name in ("negatives", "forwarded", "false_positives", "rebuilds", "refreshes")}}
+        if self.bloom is not None:
+            stats.update({
+                "items": self.bloom.count,
+                "capacity": self.bloom.capacity,
+                "memory_bytes": self.bloom.bits.nbytes,
+                "hash_functions": self.bloom.hash_count,
+                "target_fp_rate": self.bloom.fp_rate,
+                "estimated_fp_rate": round(self.bloom.estimated_fp_rate(), 6)
+            })
+        return stats
+
+
+scam_number_filter = IndexFilter("scam_numbers", "phone_number", "last_reported")
+# reported_urls is held in full by services.url_reputation
+filters = (scam_number_filter,)
+refresh_task: Optional[asyncio.Task] = None
+
+
+async def refresh_filters():
+    for index_filter in filters:
+        if time.monotonic() - index_filter.built_at >= settings.MEMBERSHIP_FILTER_REBUILD_SECONDS:
+            await index_filter.rebuild()
+        else:
+            await index_filter.refresh()
+
+
+async def _refresh_loop():
+    while True:
+        await asyncio.sleep(settings.MEMBERSHIP_FILTER_REFRESH_SECONDS)
+        await refresh_filters()
+
+
+async def start_filter_refresh():
+    global refresh_task
+    if not settings.MEMBERSHIP_FILTER_ENABLED:
+        return
+    await refresh_filters()
+    refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def stop_filter_refresh():
+    global refresh_task
+    if refresh_task:
+        refresh_task.cancel()
+        refresh_task = None
+
+
+def get_filter_stats() -> Dict[str, Any]:
+    return {index_filter.index: index_filter.stats() for index_filter in filters}
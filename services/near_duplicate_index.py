@@ -0,0 +1,113 @@
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+from config.settings import settings
+
+logger = logging.getLogger("scamshield.near_duplicate")
+
+index_counters: Counter = Counter()
+
+
+class SimHashIndex:
+    """
+    LSH index over 64-bit SimHash fingerprints.
+    
+    The fingerprint is split into max_distance + 1 bands; by the pigeonhole
+    principle two fingerprints within max_distance bits agree exactly on at
+    least one band, so a band lookup finds every candidate. Memory is bounded
+    by max_entries (LRU) and entries expire after ttl_seconds.
+    """
+    
+    def __init__(self, max_distance: int, max_entries: int, ttl_seconds: float, bits: int = 64):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        band_count = max_distance + 1
+        edges = [round(i * bits / band_count) for i in range(band_count + 1)]
+        self._bands: List[Tuple[int, int]] = [(edges[i], (1 << (edges[i + 1] - edges[i])) - 1) for i in range(band_count)]
+        self._buckets: List[Dict[int, set]] = [{} for _ in self._bands]
+        self._entries: "OrderedDict[int, Tuple[float, Any]]" = OrderedDict()
+    
+    def _band_keys(self, fingerprint: int) -> List[int]:
+        return [(fingerprint >> shift) & mask for shift, mask in self._bands]
+    
+    def _remove(self, fingerprint: int):
+        self._entries.pop(fingerprint, None)
+        for buckets, key in zip(self._buckets, self._band_keys(fingerprint)):
+            bucket = buckets.get(key)
+            if bucket is not None:
+                bucket.discard(fingerprint)
+                if not bucket:
+                    del buckets[key]
+    
+    def add(self, fingerprint: int, value: Any):
+        if fingerprint in self._entries:
+            self._entries.move_to_end(fingerprint)
+        else:
+            for buckets, key in zip(self._buckets, self._band_keys(fingerprint)):
+                buckets.setdefault(key, set()).add(fingerprint)
+        self._entries[fingerprint] = (time.monotonic() + self.ttl_seconds, value)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            index_counters["evictions"] += 1
+    
+    def query(self, fingerprint: int) -> Optional[Tuple[Any, int]]:
+        """Return (value, hamming distance) of the closest live entry within max_distance."""
+        now = time.monotonic()
+        candidates = set()
+        for buckets, key in zip(self._buckets, self._band_keys(fingerprint)):
+            candidates.update(buckets.get(key, ()))
+        
+        best = None
+        for candidate in candidates:
+            expires_at, value = self._entries[candidate]
+            if expires_at < now:
+                self._remove(candidate)
+                index_counters["expirations"] += 1
+                continue
+            distance = bin(candidate ^ fingerprint).count("1")
+            if distance <= self.max_distance and (best is None or distance < best[1]):
+                best = (candidate, distance)
+        
+        if best is None:
+            return None
+        self._entries.move_to_end(best[0])
+        return self._entries[best[0]][1], best[1]
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+near_duplicate_index = SimHashIndex(
+    max_distance=settings.NEAR_DUPLICATE_MAX_HAMMING_DISTANCE,
+    max_entries=settings.NEAR_DUPLICATE_MAX_ENTRIES,
+    ttl_seconds=settings.NEAR_DUPLICATE_TTL_SECONDS
+)
+
+
+def find_near_duplicate(fingerprint: int) -> Optional[Dict[str, Any]]:
+    if not settings.NEAR_DUPLICATE_ENABLED or not fingerprint:
+        return None
+    match = near_duplicate_index.query(fingerprint)
+    if match is None:
+        index_counters["misses"] += 1
+        return None
+    result, distance = match
+    index_counters["hits"] += 1
+    logger.info(f"Near-duplicate campaign match (distance {distance})")
+    return result
+
+
+def remember_analysis(fingerprint: int, result: Dict[str, Any]):
+    if settings.NEAR_DUPLICATE_ENABLED and fingerprint:
+        near_duplicate_index.add(fingerprint, result)
+
+
+def get_near_duplicate_stats() -> Dict[str, Any]:
+    return {
+        **{name: index_counters[name] for name in ("hits", "misses", "evictions", "expirations")},
+        "size": len(near_duplicate_index),
+        "max_hamming_distance": near_duplicate_index.max_distance
+    }
@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import math
+import re
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+from config.settings import settings
+
+logger = logging.getLogger("scamshield.pattern_index")
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Lucene's English stop set, which the english analyzer on pattern_text uses
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "for", "if", "in", "into", "is", "it", "no", "not",
+    "of", "on", "or", "such", "that", "the", "their", "then", "there", "these", "they", "this", "to", "was",
+    "will", "with"
+}
+# Lucene BM25 defaults, so scores stay on the scale of the ES query this replaces
+K1 = 1.2
+B = 0.75
+MAX_CACHED_EXPANSIONS = 50000
+
+
+def stem(token: str) -> str:
+    """Plural and verb-suffix stripping; close enough to the english analyzer for ranking."""
+    if token.endswith("'s"):
+        token = token[:-2]
+    if len(token) > 4 and token.endswith("ies") and not token.endswith(("eies", "aies")):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("es") and not token.endswith(("aes", "ees", "oes")):
+        return token[:-1]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("us", "ss")):
+        return token[:-1]
+    if len(token) > 5 and token.endswith("ing"):
+        return token[:-3]
+    if len(token) > 4 and token.endswith("ed"):
+        return token[:-2]
+    return token
+
+
+def analyze(text: str) -> List[str]:
+    return [stem(token) for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def max_edits(term: str) -> int:
+    """Elasticsearch's fuzziness AUTO: exact up to 2 characters, 1 edit up to 5, then 2."""
+    if len(term) <= 2:
+        return 0
+    return 1 if len(term) <= 5 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (transpositions count as one edit), or limit + 1 once it's exceeded."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"^{term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class BM25Index:
+    """
+    Lucene-style BM25 over analyzed text, where a query term also matches
+    indexed terms within fuzziness AUTO: candidates come from a trigram
+    index over the vocabulary and are weighted down by edit distance. A
+    query term scores with its best expansion in each document.
+    """
+
+    def __init__(self):
+        self.ids: List[Optional[str]] = []
+        self.slots: Dict[str, int] = {}
+        self.lengths: List[int] = []
+        self.terms: List[List[str]] = []
+        self.total_length = 0
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.term_trigrams: Dict[str, Set[str]] = {}
+        # derived from the above; dropped when what they cover changes
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._expansions: Dict[str, List[Tuple[str, float]]] = {}
+        self._norms: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def add(self, doc_id: str, text: str):
+        self.remove(doc_id)
+        tokens = analyze(text)
+        slot = len(self.ids)
+        self.ids.append(doc_id)
+        self.slots[doc_id] = slot
+        self.lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        counts = Counter(tokens)
+        self.terms.append(list(counts))
+        for term, count in counts.items():
+            if term not in self.postings:
+                self.postings[term] = {}
+                for gram in trigrams(term):
+                    self.term_trigrams.setdefault(gram, set()).add(term)
+                self._expansions.clear()
+            self.postings[term][slot] = count
+            self._arrays.pop(term, None)
+        self._norms = None
+
+    def remove(self, doc_id: str):
+        # the slot stays empty until the owner rebuilds the index
+        slot = self.slots.pop(doc_id, None)
+        if slot is None:
+            return
+        self.ids[slot] = None
+        self.total_length -= self.lengths[slot]
+        self.lengths[slot] = 0
+        terms, self.terms[slot] = self.terms[slot], []
+        for term in terms:
+            del self.postings[term][slot]
+            self._arrays.pop(term, None)
+            if not self.postings[term]:
+                del self.postings[term]
+                for gram in trigrams(term):
+                    self.term_trigrams[gram].discard(term)
+                self._expansions.clear()
+        self._norms = None
+
+    def expansions(self, term: str) -> List[Tuple[str, float]]:
+        """Indexed terms within fuzziness AUTO of term, with weight 1 - edits / len(term)."""
+        if term in self._expansions:
+            return self._expansions[term]
+        limit = max_edits(term)
+        if limit == 0:
+            matches = [(term, 1.0)] if term in self.postings else []
+        else:
+            grams = trigrams(term)
+            # an edit changes at most four trigrams (a transposition), so a match shares at least this many;
+            # candidates must share one, which can miss a transposition in a three-letter term
+            needed = max(1, len(grams) - 4 * limit)
+            shared = Counter(candidate for gram in grams for candidate in self.term_trigrams.get(gram, ()))
+            matches = []
+            for candidate, count in shared.items():
+                if count >= needed:
+                    distance = edit_distance(term, candidate, limit)
+                    if distance <= limit:
+                        matches.append((candidate, 1.0 - distance / len(term)))
+        if len(self._expansions) >= MAX_CACHED_EXPANSIONS:
+            self._expansions.clear()
+        self._expansions[term] = matches
+        return matches
+
+    def _postings_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        if term not in self._arrays:
+            docs = self.postings[term]
+            self._arrays[term] = (np.fromiter(docs.keys(), dtype=np.int64, count=len(docs)),
+                                  np.fromiter(docs.values(), dtype=np.float64, count=len(docs)))
+        return self._arrays[term]
+
+    def _norm_array(self) -> np.ndarray:
+        if self._norms is None:
+            average_length = self.total_length / len(self.slots) or 1.0
+            self._norms = K1 * (1 - B + B * np.array(self.lengths, dtype=np.float64) / average_length)
+        return self._norms
+
+    def search(self, text: str, size: int) -> List[Tuple[str, float]]:
+        """Top size (doc id, score) pairs with a positive score, best first."""
+        if not self.slots:
+            return []
+        norms = self._norm_array()
+        scores = np.zeros(len(self.ids))
+        for term, query_count in Counter(analyze(text)).items():
+            parts = []
+            for expansion, weight in self.expansions(term):
+                slots, counts = self._postings_arrays(expansion)
+                matching = len(slots)
+                idf = math.log(1 + (len(self.slots) - matching + 0.5) / (matching + 0.5))
+                parts.append((slots, weight * idf * counts / (counts + norms[slots])))
+            if not parts:
+                continue
+            slots, term_scores = parts[0]
+            if len(parts) > 1:
+                slots, term_scores = np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+                best_first = np.lexsort((-term_scores, slots))
+                slots, term_scores = slots[best_first], term_scores[best_first]
+                first = np.unique(slots, return_index=True)[1]
+                slots, term_scores = slots[first], term_scores[first]
+            scores[slots] += query_count * term_scores
+        size = min(size, len(scores))
+        top = np.argpartition(-scores, size - 1)[:size]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[slot], float(scores[slot])) for slot in top if scores[slot] > 0]
+
+
+class PatternIndex:
+    """
+    In-memory copy of scam_patterns answering the fuzzy match query
+    search_similar_patterns used to send to Elasticsearch, with scores on
+    the same scale. Built at startup, refreshed from last_seen and rebuilt
+    on a schedule; not ready until the first build.
+    """
+
+    def __init__(self):
+        self.index = BM25Index()
+        self.patterns: Dict[str, Dict[str, Any]] = {}
+        self.ready = False
+        self.built_at = 0.0
+        self.refreshed_since: Optional[datetime] = None
+        self.counters: Counter = Counter()
+
+    def add(self, pattern_id: str, source: Dict[str, Any]):
+        self.patterns[pattern_id] = {
+            "pattern_text": source.get("pattern_text", ""),
+            "category": source.get("category", "unknown"),
+            "risk_score": source.get("risk_score", 0)
+        }
+        self.index.add(pattern_id, self.patterns[pattern_id]["pattern_text"])
+
+    def search(self, message: str, size: int = 5) -> List[Tuple[str, float]]:
+        self.counters["searches"] += 1
+        return self.index.search(message, size)
+
+    def similar_patterns(self, message: str, size: int = 5) -> List[Dict[str, Any]]:
+        """search() in the shape search_similar_patterns returns."""
+        return [
+            {
+                "pattern": self.patterns[pattern_id]["pattern_text"][:100],
+                "score": score,
+                "category": self.patterns[pattern_id]["category"],
+                "risk_score": self.patterns[pattern_id]["risk_score"]
+            }
+            for pattern_id, score in self.search(message, size)
+        ]
+
+    async def _scan(self, query: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+        from elasticsearch.helpers import async_scan
+        from services import elasticsearch_client
+        return [
+            (hit["_id"], hit["_source"])
+            async for hit in async_scan(elasticsearch_client.es_client, index="scam_patterns",
+                                        query={"query": query, "_source": ["pattern_text", "category", "risk_score"]}, size=5000)
+        ]
+
+    async def rebuild(self) -> bool:
+        started = datetime.utcnow()
+        try:
+            hits = await self._scan({"match_all": {}})
+        except Exception as e:
+            logger.error(f"Could not build pattern index: {type(e).__name__}: {e}")
+            return False
+        fresh = PatternIndex()
+        for pattern_id, source in hits:
+            fresh.add(pattern_id, source)
+        self.index, self.patterns = fresh.index, fresh.patterns
+        self.ready = True
+        self.built_at = time.monotonic()
+        self.refreshed_since = started
+        self.counters["rebuilds"] += 1
+        logger.info(f"Pattern index built: {len(self.patterns)} patterns, {len(self.index.postings)} terms")
+        return True
+
+    async def refresh(self) -> bool:
+        """Add or replace patterns seen since the last build or refresh."""
+        if not self.ready or self.refreshed_since is None:
+            return await self.rebuild()
+        started = datetime.utcnow()
+        since = (self.refreshed_since - timedelta(seconds=settings.PATTERN_INDEX_REFRESH_SECONDS)).isoformat()
+        try:
+            hits = await self._scan({"range": {"last_seen": {"gte": since}}})
+        except Exception as e:
+            logger.error(f"Could not refresh pattern index: {type(e).__name__}: {e}")
+            return False
+        for pattern_id, source in hits:
+            self.add(pattern_id, source)
+        self.refreshed_since = started
+        self.counters["refreshes"] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "patterns": len(self.patterns),
+            "terms": len(self.index.postings),
+            **{name: self.counters[name] for name in ("searches", "fallbacks", "rebuilds", "refreshes")}
+        }
+
+
+pattern_index = PatternIndex()
+refresh_task: Optional[asyncio.Task] = None
+
+
+async def refresh_pattern_index():
+    # incremental refreshes can't see deleted patterns; the periodic rebuild drops them
+    if time.monotonic() - pattern_index.built_at >= settings.PATTERN_INDEX_REBUILD_SECONDS:
+        await pattern_index.rebuild()
+    else:
+        await pattern_index.refresh()
+
+
+async def _refresh_loop():
+    while True:
+        await asyncio.sleep(settings.PATTERN_INDEX_REFRESH_SECONDS)
+        await refresh_pattern_index()
+
+
+async def start_pattern_index_refresh():
+    global refresh_task
+    if not settings.PATTERN_INDEX_ENABLED:
+        return
+    await pattern_index.rebuild()
+    refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def stop_pattern_index_refresh():
+    global refresh_task
+    if refresh_task:
+        refresh_task.cancel()
+        refresh_task = None
+
+
+def get_pattern_index_stats() -> Dict[str, Any]:
+    return pattern_index.stats()
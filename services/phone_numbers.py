@@ -0,0 +1,54 @@
+import re
+from typing import Optional
+
+KEYPAD = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "22233344455566677778889999")
+VANITY_NUMBER = re.compile(r"^\+?[\d\s().-]*\d[\d\s().-]*[A-Za-z][A-Za-z\d\s().-]*$")
+MIN_DIGITS = 8
+MAX_DIGITS = 15
+
+
+def canonicalize_phone_number(raw: str, default_country_code: str = "1") -> Optional[str]:
+    """
+    E.164 form (+<country code><number>) of a phone number as written in a
+    sender field or message. Vanity letters are mapped to keypad digits
+    (+1-800-SCAMMER -> +18007226637); numbers without an international
+    prefix (+, 00, or 011 in NANP) get default_country_code. None for
+    anything that isn't a phone number, such as emails and alphanumeric
+    sender IDs.
+    """
+    text = raw.strip()
+    if not text or "@" in text:
+        return None
+    if any(char.isalpha() for char in text):
+        # letters only count as a vanity number after some digits
+        if not VANITY_NUMBER.match(text) or sum(char.isdigit() for char in text) < 3:
+            return None
+        text = text.upper().translate(KEYPAD)
+    digits = re.sub(r"\D", "", text)
+    if text.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif default_country_code == "1" and digits.startswith("011"):
+        digits = digits[3:]
+    elif default_country_code == "1":
+        if len(digits) == 10:
+            digits = "1" + digits
+        elif not (len(digits) == 11 and digits.startswith("1")):
+            return None
+    else:
+        digits = default_country_code + digits.lstrip("0")
+    if digits.startswith("1") and (len(digits) != 11 or digits[1] in "01" or digits[4] in "01"):
+        # NANP area codes and exchanges start with 2-9; reference numbers and the like often don't
+        return None
+    if not MIN_DIGITS <= len(digits) <= MAX_DIGITS or digits.startswith("0"):
+        return None
+    return "+" + digits
+
+
+def phone_number_key(sender: str, default_country_code: str = "1") -> str:
+    """
+    Identifier scam_numbers documents are stored and looked up under: the
+    E.164 form for phone numbers, anything else (emails, sender IDs) as given.
+    """
+    return canonicalize_phone_number(sender, default_country_code) or sender.strip()
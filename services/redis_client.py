@@ -28,6 +28,14 @@ async def close_redis():
         logger.info("Redis client closed")
 
 
+def redis_available() -> bool:
+    return redis_client is not None
+
+
+def get_redis() -> Optional[aioredis.Redis]:
+    return redis_client
+
+
 async def check_rate_limit(user_id: str, limit: int = None, window_seconds: int = 60) -> bool:
     if limit is None:
         limit = settings.RATE_LIMIT_PER_MINUTE
@@ -94,6 +102,60 @@ async def cache_delete(key: str) -> bool:
         return False
 
 
+async def cache_delete_prefix(prefix: str) -> int:
+    deleted = 0
+    try:
+        async for key in redis_client.scan_iter(match=f"cache:{prefix}*", count=500):
+            deleted += await redis_client.delete(key)
+    except Exception as e:
+        logger.error(f"Cache prefix delete failed: {e}")
+    return deleted
+
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+async def acquire_lock(name: str, token: str, ttl_ms: int) -> bool:
+    try:
+        return bool(await redis_client.set(f"lock:{name}", token, nx=True, px=ttl_ms))
+    except Exception as e:
+        logger.error(f"Lock acquire failed: {e}")
+        return False
+
+
+async def release_lock(name: str, token: str) -> bool:
+    try:
+        return bool(await redis_client.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{name}", token))
+    except Exception as e:
+        logger.error(f"Lock release failed: {e}")
+        return False
+
+
+async def lock_exists(name: str) -> bool:
+    try:
+        return bool(await redis_client.exists(f"lock:{name}"))
+    except Exception as e:
+        logger.error(f"Lock check failed: {e}")
+        return False
+
+
+async def publish(channel: str, message: str) -> int:
+    try:
+        return await redis_client.publish(channel, message)
+    except Exception as e:
+        logger.error(f"Publish failed: {e}")
+        return 0
+
+
+def pubsub():
+    return redis_client.pubsub(ignore_subscribe_messages=True)
+
+
 async def store_session(user_id: str, session_data: dict, ttl_seconds: int = 900):
     import json
     key = f"session:{user_id}"
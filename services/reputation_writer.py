@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from config.settings import settings
+
+logger = logging.getLogger("scamshield.reputation_writer")
+
+RETRYABLE_STATUSES = {409, 429, 500, 502, 503, 504}
+# flush ids kept per document so a retried delta is applied once
+APPLIED_FLUSHES_KEPT = 20
+# most recent reporting users kept per number, so abusive reports can be traced
+REPORTERS_KEPT = 50
+
+# Adds one flush's delta to a scam_numbers document, creating it if needed (scripted_upsert).
+UPSERT_SCRIPT = """
+def s = ctx._source;
+if (s.applied_flushes == null) { s.applied_flushes = []; }
+if (s.applied_flushes.contains(params.flush_id)) { ctx.op = 'none'; return; }
+s.phone_number = params.phone_number;
+s.report_count = (s.report_count == null ? 0 : s.report_count) + params.report_count;
+s.blocked_by_users = (s.blocked_by_users == null ? 0 : s.blocked_by_users) + params.blocked_by_users;
+if (s.first_reported == null || params.first_reported.compareTo(s.first_reported) < 0) { s.first_reported = params.first_reported; }
+if (s.last_reported == null || params.last_reported.compareTo(s.last_reported) > 0) { s.last_reported = params.last_reported; }
+if (params.confidence_score != null && (s.confidence_score == null || params.confidence_score > s.confidence_score)) { s.confidence_score = params.confidence_score; }
+if (s.scam_types == null) { s.scam_types = []; }
+for (t in params.scam_types) { if (!s.scam_types.contains(t)) { s.scam_types.add(t); } }
+if (s.reported_by == null) { s.reported_by = []; } else if (s.reported_by instanceof String) { s.reported_by = [s.reported_by]; }
+for (r in params.reported_by) { s.reported_by.removeIf(x -> x == r); s.reported_by.add(r); }
+while (s.reported_by.size() > params.reporters_kept) { s.reported_by.remove(0); }
+s.applied_flushes.add(params.flush_id);
+while (s.applied_flushes.size() > params.applied_flushes_kept) { s.applied_flushes.remove(0); }
+"""
+
+
+class ReputationDelta:
+    """Increments for one number since the last flush."""
+
+    __slots__ = ("phone_number", "report_count", "blocked_by_users", "scam_types", "confidence_score",
+                 "reported_by", "first_reported", "last_reported", "flush_id", "attempts")
+
+    def __init__(self, phone_number: str):
+        self.phone_number = phone_number
+        self.report_count = 0
+        self.blocked_by_users = 0
+        self.scam_types: Dict[str, None] = {}
+        self.confidence_score: Optional[float] = None
+        self.reported_by: Dict[str, None] = {}
+        self.first_reported = ""
+        self.last_reported = ""
+        self.flush_id: Optional[str] = None
+        self.attempts = 0
+
+    def add(self, scam_types: List[str], confidence_score: Optional[float], blocked: bool, reported_by: Optional[str], now: str):
+        self.report_count += 1
+        self.blocked_by_users += int(blocked)
+        self.scam_types.update(dict.fromkeys(scam_types))
+        if reported_by:
+            # latest last, like the list on the document
+            self.reported_by.pop(reported_by, None)
+            self.reported_by[reported_by] = None
+            if len(self.reported_by) > REPORTERS_KEPT:
+                del self.reported_by[next(iter(self.reported_by))]
+        if confidence_score is not None and (self.confidence_score is None or confidence_score > self.confidence_score):
+            self.confidence_score = confidence_score
+        self.first_reported = self.first_reported or now
+        self.last_reported = now
+
+    def operation(self) -> List[Dict[str, Any]]:
+        return [
+            {"update": {"_index": "scam_numbers", "_id": self.phone_number, "retry_on_conflict": 3}},
+            {
+                "scripted_upsert": True,
+                "upsert": {},
+                "script": {"source": UPSERT_SCRIPT, "params": {
+                    "flush_id": self.flush_id,
+                    "phone_number": self.phone_number,
+                    "report_count": self.report_count,
+                    "blocked_by_users": self.blocked_by_users,
+                    "scam_types": list(self.scam_types),
+                    "confidence_score": self.confidence_score,
+                    "reported_by": list(self.reported_by),
+                    "reporters_kept": REPORTERS_KEPT,
+                    "first_reported": self.first_reported,
+                    "last_reported": self.last_reported,
+                    "applied_flushes_kept": APPLIED_FLUSHES_KEPT
+                }}
+            }
+        ]
+
+
+class ReputationWriter:
+    """
+    Write-behind aggregation of scam_numbers updates. Reports and blocks of
+    a number are summed in process and written every flush interval as one
+    scripted upsert per number in a _bulk request, so a campaign hitting
+    one number costs one update per interval instead of one per message.
+
+    Counts stay exact across retries: each delta carries a flush id that
+    the script records on the document and refuses to apply twice. Failed
+    deltas are retried on later flushes up to max_retries, separately from
+    increments that arrive meanwhile. At most max_pending numbers are held;
+    reports of further numbers are dropped until the next flush.
+    """
+
+    def __init__(self, flush_interval_ms: int, batch_size: int, max_pending: int, max_retries: int):
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.pending: Dict[str, ReputationDelta] = {}
+        self.retrying: List[ReputationDelta] = []
+        self._flush_lock = asyncio.Lock()
+        self._interval_task: Optional[asyncio.Task] = None
+        self.counters: Counter = Counter()
+
+    def record(self, phone_number: str, scam_types: List[str], confidence_score: Optional[float] = None,
+               blocked: bool = False, reported_by: Optional[str] = None) -> bool:
+        """Count one report of phone_number (already keyed with phone_number_key); False if dropped."""
+        delta = self.pending.get(phone_number)
+        if delta is None:
+            if len(self.pending) >= self.max_pending:
+                self.counters["dropped_full"] += 1
+                return False
+            delta = self.pending[phone_number] = ReputationDelta(phone_number)
+        delta.add(scam_types, confidence_score, blocked, reported_by, datetime.utcnow().isoformat())
+        self.counters["recorded"] += 1
+        return True
+
+    async def _write(self, deltas: List[ReputationDelta]) -> List[ReputationDelta]:
+        """One _bulk request; returns the deltas to retry."""
+        from services import elasticsearch_client
+        operations: List[Dict[str, Any]] = []
+        for delta in deltas:
+            operations += delta.operation()
+        try:
+            result = await elasticsearch_client.es_client.bulk(operations=operations)
+        except Exception as e:
+            logger.error(f"Reputation bulk update failed: {type(e).__name__}: {e}")
+            self.counters["failed_requests"] += 1
+            return deltas
+        self.counters["bulk_requests"] += 1
+        retry = []
+        for delta, item in zip(deltas, result["items"]):
+            outcome = item.get("update", {})
+            status = outcome.get("status", 500)
+            if status < 300:
+                self.counters["numbers_written"] += 1
+            elif status in RETRYABLE_STATUSES:
+                retry.append(delta)
+            else:
+                logger.error(f"Dropping reputation update for {delta.phone_number} rejected with {status}: {outcome.get('error')}")
+                self.counters["dropped_rejected"] += 1
+        return retry
+
+    async def flush(self) -> bool:
+        """Write pending and retrying deltas; False if any are left for a later flush."""
+        from services import elasticsearch_client
+        async with self._flush_lock:
+            if elasticsearch_client.es_client is None:
+                return not self.pending and not self.retrying
+            deltas, self.retrying = self.retrying, []
+            pending, self.pending = self.pending, {}
+            deltas += pending.values()
+            for delta in deltas:
+                delta.flush_id = delta.flush_id or uuid.uuid4().hex
+            failed = []
+            for start in range(0, len(deltas), self.batch_size):
+                try:
+                    failed += await self._write(deltas[start:start + self.batch_size])
+                except asyncio.CancelledError:
+                    # a retry can't double count, so anything possibly unwritten goes back
+                    self.retrying += failed + deltas[start:]
+                    raise
+            for delta in failed:
+                delta.attempts += 1
+                if delta.attempts > self.max_retries:
+                    logger.error(f"Giving up on reputation update for {delta.phone_number} after {delta.attempts} attempts")
+                    self.counters["dropped_failed"] += 1
+                else:
+                    self.retrying.append(delta)
+            return not self.retrying
+
+    async def _interval_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Reputation flush failed: {type(e).__name__}: {e}")
+
+    def start(self):
+        if self._interval_task is None:
+            self._interval_task = asyncio.create_task(self._interval_loop())
+
+    async def stop(self, timeout: float):
+        """Stop the interval flush and write what's pending, retrying until timeout runs out."""
+        from services import elasticsearch_client
+        if self._interval_task:
+            self._interval_task.cancel()
+            self._interval_task = None
+        deadline = time.monotonic() + timeout
+        while (self.pending or self.retrying) and elasticsearch_client.es_client is not None and time.monotonic() < deadline:
+            try:
+                if await asyncio.wait_for(self.flush(), max(0.0, deadline - time.monotonic())):
+                    break
+            except asyncio.TimeoutError:
+                break
+            await asyncio.sleep(min(self.flush_interval, max(0.0, deadline - time.monotonic())))
+        unwritten = len(self.pending) + len(self.retrying)
+        if unwritten:
+            logger.error(f"Shutting down with reputation updates for {unwritten} numbers unwritten")
+            self.counters["dropped_shutdown"] += unwritten
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_numbers": len(self.pending),
+            "retrying_numbers": len(self.retrying),
+            **{name: self.counters[name] for name in (
+                "recorded", "numbers_written", "bulk_requests", "failed_requests",
+                "dropped_full", "dropped_failed", "dropped_rejected", "dropped_shutdown"
+            )}
+        }
+
+
+reputation_writer = ReputationWriter(
+    flush_interval_ms=settings.REPUTATION_WRITER_FLUSH_INTERVAL_MS,
+    batch_size=settings.REPUTATION_WRITER_BATCH_SIZE,
+    max_pending=settings.REPUTATION_WRITER_MAX_PENDING,
+    max_retries=settings.REPUTATION_WRITER_MAX_RETRIES
+)
+
+
+def start_reputation_writer():
+    reputation_writer.start()
+
+
+async def stop_reputation_writer():
+    await reputation_writer.stop(settings.REPUTATION_WRITER_SHUTDOWN_TIMEOUT_SECONDS)
+
+
+def get_reputation_writer_stats() -> Dict[str, Any]:
+    return reputation_writer.stats()
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from services.redis_client import redis_available, acquire_lock, release_lock, lock_exists, publish, pubsub, cache_set, cache_get
+
+logger = logging.getLogger("scamshield.single_flight")
+
+# Futures of computations currently running in this worker, by key
+in_flight: Dict[str, asyncio.Future] = {}
+
+flight_counters: Counter = Counter()
+
+# How long a leader's outcome stays readable for followers that subscribe after it published
+RESULT_TTL_SECONDS = 10
+
+
+class SingleFlightError(Exception):
+    """The leader of a coalesced computation (possibly in another worker) failed."""
+
+
+def _channel(key: str) -> str:
+    return f"singleflight:{key}"
+
+
+def _unpack(payload: Dict[str, Any]) -> Any:
+    if not payload["ok"]:
+        raise SingleFlightError(payload["error"])
+    return payload["result"]
+
+
+async def _finish(key: str, payload: Dict[str, Any]):
+    """Store the outcome before publishing it, so a follower that subscribes too late still finds it."""
+    message = json.dumps(payload)
+    await cache_set(_channel(key), message, RESULT_TTL_SECONDS)
+    await publish(_channel(key), message)
+
+
+async def _follow_remote_leader(
+    key: str,
+    lookup: Optional[Callable[[], Awaitable[Any]]],
+    timeout: float
+) -> Tuple[bool, Any]:
+    """Wait for another worker's result. Returns (found, value); found is False if the leader vanished or timed out."""
+    subscription = pubsub()
+    try:
+        await subscription.subscribe(_channel(key))
+        # the leader may have finished between our lock attempt and the subscribe
+        payload = await cache_get(_channel(key))
+        if isinstance(payload, dict):
+            return True, _unpack(payload)
+        if lookup is not None:
+            value = await lookup()
+            if value is not None:
+                return True, value
+        if not await lock_exists(key):
+            return False, None
+
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = await subscription.get_message(timeout=min(remaining, 1.0))
+            if message is None:
+                continue
+            return True, _unpack(json.loads(message["data"]))
+        flight_counters["remote_timeouts"] += 1
+        return False, None
+    finally:
+        try:
+            await subscription.unsubscribe(_channel(key))
+            await subscription.aclose()
+        except Exception as e:
+            logger.error(f"Pubsub cleanup failed: {e}")
+
+
+async def _lead_across_workers(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    lookup: Optional[Callable[[], Awaitable[Any]]],
+    timeout: float,
+    lock_ttl: float
+) -> Tuple[Any, bool]:
+    if not redis_available():
+        flight_counters["leader_calls"] += 1
+        return await compute(), False
+
+    token = uuid.uuid4().hex
+    if not await acquire_lock(key, token, int(lock_ttl * 1000)):
+        flight_counters["coalesced_remote"] += 1
+        found, value = await _follow_remote_leader(key, lookup, timeout)
+        if found:
+            return value, True
+        logger.warning("Remote single-flight leader did not answer, computing locally")
+        flight_counters["leader_calls"] += 1
+        return await compute(), False
+
+    flight_counters["leader_calls"] += 1
+    try:
+        value = await compute()
+        await _finish(key, {"ok": True, "result": value})
+        return value, False
+    except Exception as e:
+        await _finish(key, {"ok": False, "error": f"{type(e).__name__}: {e}"})
+        raise
+    finally:
+        await release_lock(key, token)
+
+
+async def single_flight(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    lookup: Optional[Callable[[], Awaitable[Any]]] = None,
+    timeout: float = 30.0,
+    lock_ttl: float = 120.0
+) -> Tuple[Any, bool]:
+    """
+    Run compute() once for all concurrent callers with the same key.
+
+    Callers in this worker await the leader's future; other workers wait on a
+    Redis lock and receive the result over pub/sub. The leader also keeps its
+    outcome readable for RESULT_TTL_SECONDS, and lookup() is consulted, in case
+    it finished before a remote follower subscribed. The leader's exception is
+    raised to every waiter; waiters give up after timeout seconds. lock_ttl
+    must outlast the slowest compute(), or a second worker starts leading. Returns (value, shared) where shared is True if the value
+    came from another caller's computation. compute() must return a
+    JSON-serializable value.
+    """
+    existing = in_flight.get(key)
+    if existing is not None:
+        flight_counters["coalesced_local"] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(existing), timeout), True
+        except asyncio.TimeoutError:
+            flight_counters["local_timeouts"] += 1
+            raise
+
+    future = asyncio.get_running_loop().create_future()
+    in_flight[key] = future
+    try:
+        value, shared = await _lead_across_workers(key, compute, lookup, timeout, lock_ttl)
+        future.set_result(value)
+        return value, shared
+    except asyncio.CancelledError:
+        future.set_exception(SingleFlightError("leader was cancelled"))
+        future.exception()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # mark the exception retrieved so an unawaited future doesn't warn
+        future.exception()
+        raise
+    finally:
+        in_flight.pop(key, None)
+
+
+def get_single_flight_stats() -> Dict[str, Any]:
+    return {
+        **{name: flight_counters[name] for name in ("leader_calls", "coalesced_local", "coalesced_remote", "local_timeouts", "remote_timeouts")},
+        "in_flight": len(in_flight)
+    }
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import posixpath
+import time
+from collections import Counter
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+from urllib.parse import quote, unquote, urlsplit
+from config.settings import settings
+
+logger = logging.getLogger("scamshield.url_reputation")
+
+# Suffixes under which anyone can register a name. Flagging one would flag
+# every site below it, so they are never treated as a reported domain.
+MULTI_LABEL_PUBLIC_SUFFIXES = {
+    "co.uk", "org.uk", "ac.uk", "gov.uk", "me.uk", "com.au", "net.au", "org.au", "co.nz", "co.in",
+    "co.jp", "co.za", "co.kr", "com.br", "com.cn", "com.mx", "com.sg", "com.tr", "com.ar", "com.hk"
+}
+SHARED_HOSTING_SUFFIXES = {
+    "blogspot.com", "github.io", "herokuapp.com", "netlify.app", "vercel.app", "web.app", "pages.dev",
+    "firebaseapp.com", "appspot.com", "azurewebsites.net", "wixsite.com", "weebly.com", "glitch.me",
+    "000webhostapp.com", "ngrok.io", "duckdns.org", "s3.amazonaws.com", "workers.dev"
+}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+PATH_SAFE_CHARACTERS = "/:@!$&'()*+,;=-._~"
+
+
+class CanonicalURL(NamedTuple):
+    host: str
+    # scheme-less host[:port]/path[?query], the form reported URLs are matched on
+    key: str
+
+
+def is_public_suffix(domain: str) -> bool:
+    return "." not in domain or domain in MULTI_LABEL_PUBLIC_SUFFIXES or domain in SHARED_HOSTING_SUFFIXES
+
+
+def canonicalize_url(raw: str) -> Optional[CanonicalURL]:
+    """
+    Lower-cased punycode host without userinfo, default port or trailing
+    dot; path with dot segments resolved and percent-encoding normalized;
+    fragment dropped. Bare domains are accepted. None if there's no host.
+    """
+    text = raw.strip()
+    if "://" not in text:
+        text = "http://" + text
+    try:
+        parts = urlsplit(text)
+        port = parts.port
+    except ValueError:
+        return None
+    host = (parts.hostname or "").rstrip(".")
+    if not host:
+        return None
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        pass
+    netloc = host if port is None or port == DEFAULT_PORTS.get(parts.scheme.lower()) else f"{host}:{port}"
+    path = quote(unquote(parts.path), safe=PATH_SAFE_CHARACTERS)
+    path = "/" + posixpath.normpath("/" + path).lstrip("/")
+    key = netloc + path + (f"?{parts.query}" if parts.query else "")
+    return CanonicalURL(host, key)
+
+
+def parent_domains(host: str) -> List[str]:
+    """host and each parent above its public suffix, most specific first."""
+    labels = host.split(".")
+    domains = [".".join(labels[i:]) for i in range(len(labels))]
+    return [domain for domain in domains if not is_public_suffix(domain)]
+
+
+class DomainTrie:
+    """Reported domains keyed by reversed labels; a host matches itself or any reported parent."""
+
+    TERMINAL = ""
+
+    def __init__(self):
+        self.root: Dict[str, Any] = {}
+        self.count = 0
+
+    def add(self, domain: str) -> bool:
+        if is_public_suffix(domain):
+            return False
+        node = self.root
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        if self.TERMINAL not in node:
+            node[self.TERMINAL] = domain
+            self.count += 1
+        return True
+
+    def match(self, host: str) -> Optional[str]:
+        node = self.root
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                return None
+            if self.TERMINAL in node:
+                return node[self.TERMINAL]
+        return None
+
+
+class URLReputationIndex:
+    """
+    In-memory copy of reported_urls: bare-domain reports go into the
+    domain trie, reports with a path are matched on the canonical URL.
+    Rebuilt from the index on a schedule; not ready until the first build.
+    """
+
+    def __init__(self):
+        self.domains = DomainTrie()
+        self.urls: Set[str] = set()
+        self.ready = False
+        self.built_at = 0.0
+        self.counters: Counter = Counter()
+
+    def add(self, reported_url: str) -> bool:
+        canonical = canonicalize_url(reported_url)
+        if canonical is None:
+            return False
+        if canonical.key == canonical.host + "/":
+            if not self.domains.add(canonical.host):
+                logger.warning(f"Ignoring reported URL {reported_url}: it covers a public suffix")
+                return False
+        else:
+            self.urls.add(canonical.key)
+        return True
+
+    def match(self, url: str) -> Optional[str]:
+        """The reported domain or URL that covers url, if any."""
+        canonical = canonicalize_url(url)
+        if canonical is None:
+            return None
+        if canonical.key in self.urls:
+            return canonical.key
+        return self.domains.match(canonical.host)
+
+    def is_flagged(self, url: str) -> bool:
+        flagged = self.match(url) is not None
+        self.counters["flagged" if flagged else "clean"] += 1
+        return flagged
+
+    async def rebuild(self) -> bool:
+        from elasticsearch.helpers import async_scan
+        from services import elasticsearch_client
+        fresh = URLReputationIndex()
+        try:
+            async for hit in async_scan(elasticsearch_client.es_client, index="reported_urls",
+                                        query={"query": {"match_all": {}}, "_source": ["url", "is_malicious"]}, size=5000):
+                source = hit["_source"]
+                if source.get("url") and source.get("is_malicious", True) is not False:
+                    fresh.add(source["url"])
+        except Exception as e:
+            logger.error(f"Could not build URL reputation index: {type(e).__name__}: {e}")
+            return False
+        self.domains, self.urls = fresh.domains, fresh.urls
+        self.ready = True
+        self.built_at = time.monotonic()
+        self.counters["rebuilds"] += 1
+        logger.info(f"URL reputation index built: {self.domains.count} domains, {len(self.urls)} URLs")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "domains": self.domains.count,
+            "urls": len(self.urls),
+            **{name: self.counters[name] for name in ("flagged", "clean", "rebuilds")}
+        }
+
+
+url_reputation = URLReputationIndex()
+refresh_task: Optional[asyncio.Task] = None
+
+
+async def _refresh_loop():
+    while True:
+        await asyncio.sleep(settings.URL_REPUTATION_REFRESH_SECONDS)
+        await url_reputation.rebuild()
+
+
+async def start_url_reputation_refresh():
+    global refresh_task
+    await url_reputation.rebuild()
+    refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def stop_url_reputation_refresh():
+    global refresh_task
+    if refresh_task:
+        refresh_task.cancel()
+        refresh_task = None
+
+
+def get_url_reputation_stats() -> Dict[str, Any]:
+    return url_reputation.stats()
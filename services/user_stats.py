@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from redis.exceptions import WatchError
+from config.settings import settings
+from services import database
+from services.redis_client import get_redis, acquire_lock
+
+logger = logging.getLogger("scamshield.user_stats")
+
+# user_stats:<user_id> is a hash of running counters; user_stats:<user_id>:day:<UTC date> counts that
+# day's blocks; user_stats:<user_id>:recent holds incident increments per minute ("<minute>|<field>")
+# so a reconciliation can add the ones incident_logs doesn't show yet
+RECONCILED_FIELD = "reconciled_at"
+DECISION_PREFIX = "decision:"
+RECONCILE_LOCK = "user_stats_reconcile"
+RECONCILE_ATTEMPTS = 3
+
+
+def stats_key(user_id: str) -> str:
+    return f"user_stats:{user_id}"
+
+
+def day_key(user_id: str, day: Optional[str] = None) -> str:
+    return f"user_stats:{user_id}:day:{day or utc_today()}"
+
+
+def recent_key(user_id: str) -> str:
+    return f"user_stats:{user_id}:recent"
+
+
+def utc_today() -> str:
+    return datetime.utcnow().date().isoformat()
+
+
+def utc_midnight() -> datetime:
+    return datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+async def record_block(user_id: str, new_identifier: bool, new_today: bool):
+    """A blocklist write: new_identifier if the sender wasn't blocked before, new_today if not blocked yet today."""
+    redis = get_redis()
+    if redis is None or not user_id or not (new_identifier or new_today):
+        return
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            if new_identifier:
+                pipe.hincrby(stats_key(user_id), "total_blocked", 1)
+            if new_today:
+                pipe.incr(day_key(user_id))
+                pipe.expire(day_key(user_id), settings.USER_STATS_DAY_TTL_SECONDS)
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"Could not record block for {user_id}: {e}")
+
+
+def reconcile_cutoff() -> datetime:
+    """Incidents before this minute are assumed searchable in incident_logs."""
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.USER_STATS_RECONCILE_LAG_SECONDS)
+    return cutoff.replace(second=0, microsecond=0)
+
+
+async def record_incident(user_id: str, decision: str, risk_score: float, timestamp: str):
+    """A logged incident; timestamp is the incident's, so it lands on the same side of a reconcile cutoff as in incident_logs."""
+    redis = get_redis()
+    if redis is None or not user_id:
+        return
+    minute = timestamp[:16]
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            for key, prefix in ((stats_key(user_id), ""), (recent_key(user_id), f"{minute}|")):
+                pipe.hincrby(key, prefix + DECISION_PREFIX + decision, 1)
+                pipe.hincrbyfloat(key, prefix + "risk_sum", risk_score)
+                pipe.hincrby(key, prefix + "risk_count", 1)
+            pipe.expire(recent_key(user_id), int(settings.USER_STATS_RECONCILE_SECONDS * 2 + settings.USER_STATS_RECONCILE_LAG_SECONDS))
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"Could not record incident for {user_id}: {e}")
+
+
+def _from_counters(counters: Dict[str, Any], blocked_today: Optional[str]) -> Dict[str, Any]:
+    risk_count = int(counters.get("risk_count", 0))
+    return {
+        "total_blocked": int(counters.get("total_blocked", 0)),
+        "blocked_today": int(blocked_today or 0),
+        "decisions": {field[len(DECISION_PREFIX):]: int(value) for field, value in counters.items() if field.startswith(DECISION_PREFIX)},
+        "average_risk_score": round(float(counters.get("risk_sum", 0)) / risk_count, 2) if risk_count else None
+    }
+
+
+def _recent_since(recent: Dict[str, str], cutoff: datetime) -> Dict[str, Any]:
+    """Sum of the per-minute increments at or after cutoff."""
+    since = cutoff.isoformat()[:16]
+    totals: Dict[str, Any] = {}
+    for key, value in recent.items():
+        minute, field = key.split("|", 1)
+        if minute >= since:
+            totals[field] = totals.get(field, 0) + (float(value) if field == "risk_sum" else int(value))
+    return totals
+
+
+async def compute_user_stats(user_id: str, before: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """
+    Stats from the source of truth: user_blocklist, and incident_logs before
+    the given time. None if the blocklist can't be read; if incident_logs
+    can't, the blocklist counts come back with "complete" False.
+    """
+    from services.elasticsearch_client import get_user_stats_aggregation
+    try:
+        async with database.db_pool.acquire() as conn:
+            total_blocked = await conn.fetchval("SELECT COUNT(*) FROM user_blocklist WHERE user_id = $1", uuid.UUID(user_id)) or 0
+            blocked_today = await conn.fetchval(
+                "SELECT COUNT(*) FROM user_blocklist WHERE user_id = $1 AND blocked_at >= $2",
+                uuid.UUID(user_id), utc_midnight()
+            ) or 0
+    except Exception as e:
+        logger.error(f"Could not count blocklist for {user_id}: {e}")
+        return None
+    incidents = await get_user_stats_aggregation(user_id, before=before.isoformat() if before else None)
+    return {
+        "total_blocked": total_blocked,
+        "blocked_today": blocked_today,
+        "decisions": {bucket["key"]: bucket["doc_count"] for bucket in incidents["scam_types"]},
+        "risk_sum": incidents["risk_sum"] or 0.0,
+        "risk_count": int(incidents["risk_count"] or 0),
+        "average_risk_score": round(incidents["avg_risk"], 2) if incidents["available"] and incidents["avg_risk"] is not None else None,
+        "complete": incidents["available"]
+    }
+
+
+async def reconcile_user(user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Rebuild the user's counters: incident_logs up to a cutoff a few minutes
+    back, plus the recorded increments since, so incidents still buffered or
+    not yet refreshed aren't lost. Counters changed while this runs make it
+    start over. Returns the stats, or None if the blocklist can't be read.
+    Incomplete stats are returned but not stored.
+    """
+    redis = get_redis()
+    if redis is None:
+        return await compute_user_stats(user_id)
+    keys = (stats_key(user_id), day_key(user_id), recent_key(user_id))
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            for _ in range(RECONCILE_ATTEMPTS):
+                await pipe.watch(*keys)
+                cutoff = reconcile_cutoff()
+                stats = await compute_user_stats(user_id, before=cutoff)
+                if stats is None or not stats["complete"]:
+                    await pipe.unwatch()
+                    return stats
+                recent = await pipe.hgetall(recent_key(user_id))
+                counters: Dict[str, Any] = {
+                    "total_blocked": stats["total_blocked"],
+                    "risk_sum": stats["risk_sum"],
+                    "risk_count": stats["risk_count"],
+                    **{DECISION_PREFIX + decision: count for decision, count in stats["decisions"].items()}
+                }
+                for field, amount in _recent_since(recent, cutoff).items():
+                    counters[field] = counters.get(field, 0) + amount
+                stale = [key for key in recent if key.split("|", 1)[0] < cutoff.isoformat()[:16]]
+                pipe.multi()
+                pipe.delete(stats_key(user_id))
+                pipe.hset(stats_key(user_id), mapping={**counters, RECONCILED_FIELD: datetime.utcnow().isoformat()})
+                pipe.set(day_key(user_id), stats["blocked_today"], ex=settings.USER_STATS_DAY_TTL_SECONDS)
+                if stale:
+                    pipe.hdel(recent_key(user_id), *stale)
+                try:
+                    await pipe.execute()
+                except WatchError:
+                    continue
+                return _from_counters(counters, stats["blocked_today"])
+        logger.warning(f"Stats for {user_id} kept changing, left for the next reconciliation")
+    except Exception as e:
+        logger.error(f"Could not reconcile stats for {user_id}: {e}")
+    return await compute_user_stats(user_id)
+
+
+async def get_user_stats(user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Stats from the Redis counters: one HGETALL and one GET. Users without
+    reconciled counters (none since Redis was emptied, or new since the
+    last reconciliation) are computed and stored on first read.
+    """
+    redis = get_redis()
+    if redis is not None:
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hgetall(stats_key(user_id))
+                pipe.get(day_key(user_id))
+                counters, blocked_today = await pipe.execute()
+            if RECONCILED_FIELD in counters:
+                return _from_counters(counters, blocked_today)
+        except Exception as e:
+            logger.error(f"Could not read stats for {user_id}: {e}")
+    return await reconcile_user(user_id)
+
+
+async def reconcile_all() -> int:
+    """
+    Rebuild the counters of every user that has them. The lock is left to
+    expire, so one worker runs this per interval however many are up.
+    """
+    redis = get_redis()
+    if redis is None or not await acquire_lock(RECONCILE_LOCK, uuid.uuid4().hex, int(settings.USER_STATS_RECONCILE_SECONDS * 900)):
+        return 0
+    reconciled = 0
+    async for key in redis.scan_iter(match="user_stats:*", count=500):
+        user_id = key.split(":")[1]
+        if key == stats_key(user_id):
+            stats = await reconcile_user(user_id)
+            # incomplete stats come back without being stored
+            reconciled += stats is not None and stats.get("complete", True)
+    logger.info(f"Reconciled stats for {reconciled} users")
+    return reconciled
+
+
+reconcile_task: Optional[asyncio.Task] = None
+
+
+async def _reconcile_loop():
+    while True:
+        await asyncio.sleep(settings.USER_STATS_RECONCILE_SECONDS)
+        try:
+            await reconcile_all()
+        except Exception as e:
+            logger.error(f"Stats reconciliation failed: {type(e).__name__}: {e}")
+
+
+def start_stats_reconciliation():
+    global reconcile_task
+    reconcile_task = asyncio.create_task(_reconcile_loop())
+
+
+async def stop_stats_reconciliation():
+    global reconcile_task
+    if reconcile_task:
+        reconcile_task.cancel()
+        reconcile_task = None
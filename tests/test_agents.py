@@ -11,17 +11,24 @@ def create_test_state(message: str = "Test message", sender: str = "+1-555-123-4
         message=message,
         sender=sender,
         user_id=user_id,
+        priority="interactive",
         timestamp=datetime.utcnow(),
         urls=[],
+        phone_numbers=[],
         content_cleaned="",
+        fingerprint=0,
         risk_score=0,
         analysis={},
         detected_tactics=[],
         confidence=0.0,
+        analysis_tier="none",
         known_scammer=False,
         previous_reports=0,
         similar_patterns=[],
         url_malicious=False,
+        reported_numbers=[],
+        sender_blocked=False,
+        decision_path="full",
         pattern_confidence=0,
         alerted=False,
         channels_used=[],
@@ -31,7 +38,9 @@ def create_test_state(message: str = "Test message", sender: str = "+1-555-123-4
         community_updated=False,
         final_decision="PASS",
         actions_taken=[],
-        processing_start=datetime.utcnow()
+        processing_start=datetime.utcnow(),
+        agents_involved=[],
+        degraded_stages=[]
     )
 
 
@@ -50,6 +59,26 @@ class TestWatcherAgent:
         cleaned = clean_content(text, urls)
         assert "[URL]" in cleaned
         assert "https://scam.com" not in cleaned
+    
+    def test_simhash_ignores_campaign_variables(self):
+        from agents.watcher import compute_simhash
+        first = compute_simhash("Dear John, your account is suspended. Pay $499 at https://x.co/a1 or call +1 (800) 555-0100 today.")
+        second = compute_simhash("Hi Maria, your account is suspended. Pay $120 at https://bit.ly/zz or call 1-888-555-0199 today.")
+        other = compute_simhash("Are we still on for dinner tonight at the italian place downtown?")
+        assert bin(first ^ second).count("1") <= 3
+        assert bin(first ^ other).count("1") > 3
+        assert compute_simhash("ok thanks") == 0
+    
+    def test_batch_masking_matches_single(self):
+        from agents.watcher import mask_volatile_tokens, mask_volatile_tokens_batch
+        texts = ["Dear John, call 555-123-4567", "4567 hi", "pay $5", "usd 10 at https://x.co/a", "", "Hi\x00Ann 12"]
+        assert mask_volatile_tokens_batch(texts) == [mask_volatile_tokens(t) for t in texts]
+    
+    def test_canonical_phone_numbers(self):
+        from agents.watcher import canonical_phone_numbers
+        text = "Call +1-800-SCAM-001 or (555) 234-5678, UK +44 20 7946 0958, again 555.234.5678. Order 12345."
+        assert canonical_phone_numbers(text) == ["+18007226001", "+15552345678", "+442079460958"]
+        assert canonical_phone_numbers("Ref 1234567890 paid. Invoice #4155551234, order no. 4155559876") == []
 
 
 class TestAnalyzerAgent:
@@ -61,6 +90,205 @@ class TestAnalyzerAgent:
         assert 'URGENCY' in parsed['detected_tactics']
 
 
+class TestKeywordEngine:
+    def test_matches_respect_word_boundaries(self):
+        from agents.keywords import get_keyword_engine
+        engine = get_keyword_engine()
+        assert engine.scan("shopping message at t.com") == []
+        keywords = [m.keyword for m in engine.scan("send your pin via https://t.co/x")]
+        assert keywords == ["pin", "t.co"]
+    
+    def test_reports_overlapping_matches_with_offsets(self):
+        from agents.keywords import get_keyword_engine
+        matches = get_keyword_engine().scan("send bank details")
+        assert ("bank details", 5, 17) in matches
+        assert ("bank", 5, 9) in matches
+    
+    def test_fallback_analyze_scores(self):
+        from agents.analyzer import fallback_analyze
+        result = fallback_analyze("URGENT: your bank account is suspended, send your PIN", "+1")
+        assert result["risk_score"] == 90
+        assert result["detected_tactics"] == ["URGENCY", "AUTHORITY", "THREATS", "INFO_REQUEST"]
+        assert result["analysis"]["suspicious_elements"] == ["Requests: pin"]
+    
+    def test_score_batch_matches_analyze(self):
+        from agents.keywords import get_keyword_engine
+        engine = get_keyword_engine()
+        messages = ["URGENT: your BANK details", "shopping at t.com", "pin", "", "Ünïcode ßpin bank",
+                    "verify at secure-login.com", "a\x00pin", "send your pin via t.co/x"]
+        assert engine.score_batch(messages).tolist() == [engine.analyze(m)["risk_score"] for m in messages]
+    
+    def test_hot_reload_from_file(self, tmp_path):
+        import json
+        from agents import keywords
+        rules_file = tmp_path / "rules.json"
+        rules_file.write_text(json.dumps([{"tactic": "CRYPTO", "score": 60, "field": "suspicious_elements", "keywords": ["bitcoin"]}]))
+        original = keywords.get_keyword_engine()
+        try:
+            assert keywords.reload_rules_from_file(str(rules_file))
+            assert keywords.get_keyword_engine().analyze("Send bitcoin now")["risk_score"] == 60
+            rules_file.write_text(json.dumps([{"tactic": "BROKEN"}]))
+            import os
+            os.utime(rules_file, (0, 0))
+            assert not keywords.reload_rules_from_file(str(rules_file))
+            assert keywords.get_keyword_engine().analyze("Send bitcoin now")["risk_score"] == 60
+        finally:
+            keywords.active_engine = original
+            keywords.rules_source.update({"origin": "default", "mtime": None})
+
+
+class TestScreenerAgent:
+    def test_route_after_screening(self):
+        from agents.screener import route_after_screening
+        state = create_test_state()
+        assert route_after_screening(state) == ["analyzer", "pattern"]
+        state['decision_path'] = "fast_path"
+        assert route_after_screening(state) == "alerter"
+
+    @pytest.mark.asyncio
+    async def test_blocklist_matches_number_however_written(self):
+        from unittest.mock import MagicMock
+        from agents.blocker import add_to_blocklist
+        from agents.screener import is_sender_blocked
+        conn = AsyncMock()
+        pool = MagicMock()
+        pool.acquire.return_value.__aenter__.return_value = conn
+        user_id = "00000000-0000-0000-0000-000000000001"
+        with patch('services.database.db_pool', pool), \
+             patch('agents.blocker.record_block', AsyncMock()):
+            await add_to_blocklist(user_id, "(555) 234-5678", "scam")
+            assert await is_sender_blocked(user_id, "+1 555 234 5678")
+        assert conn.fetchval.await_args_list[0].args[2:4] == ("+15552345678", "phone")
+        assert "+15552345678" in conn.fetchval.await_args_list[1].args[2]
+
+
+class TestAnalyzerCascade:
+    @pytest.mark.asyncio
+    async def test_confident_local_score_skips_llm(self):
+        from agents.analyzer import analyzer_agent, get_tier_stats
+        llm = AsyncMock()
+        before = get_tier_stats().get("local_block", 0)
+        with patch('agents.analyzer.get_llm', return_value=llm), \
+             patch('agents.analyzer.settings.CASCADE_ENABLED', True):
+            result = await analyzer_agent(create_test_state(message="URGENT: your bank account is suspended, send your PIN"))
+        llm.ainvoke.assert_not_called()
+        assert result['analysis_tier'] == "local_block"
+        assert get_tier_stats()["local_block"] == before + 1
+
+    @pytest.mark.asyncio
+    async def test_low_keyword_score_is_not_passed_locally(self):
+        from agents.analyzer import analyzer_agent
+        llm = AsyncMock()
+        llm.ainvoke.return_value.content = '{"risk_score": 5, "detected_tactics": [], "analysis": {}, "confidence": 0.9}'
+        with patch('agents.analyzer.get_llm', return_value=llm), \
+             patch('agents.analyzer.get_local_model', return_value=None), \
+             patch('agents.analyzer.settings.CASCADE_ENABLED', True):
+            result = await analyzer_agent(create_test_state(message="See you at lunch tomorrow"))
+        llm.ainvoke.assert_called_once()
+        assert result['analysis_tier'] == "llm"
+
+    @pytest.mark.asyncio
+    async def test_ambiguous_local_score_goes_to_llm(self):
+        from agents.analyzer import analyzer_agent
+        llm = AsyncMock()
+        llm.ainvoke.return_value.content = '{"risk_score": 90, "detected_tactics": ["AUTHORITY"], "analysis": {}, "confidence": 0.9}'
+        with patch('agents.analyzer.get_llm', return_value=llm), \
+             patch('agents.analyzer.settings.CASCADE_ENABLED', True):
+            result = await analyzer_agent(create_test_state(message="Your bank account is suspended"))
+        llm.ainvoke.assert_called_once()
+        assert result['analysis_tier'] == "llm"
+        assert result['risk_score'] == 90
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_skips_gemini(self):
+        from agents.analyzer import analyzer_agent
+        from services.circuit_breaker import gemini_breaker
+        llm = AsyncMock()
+        with patch('agents.analyzer.get_llm', return_value=llm), \
+             patch.object(gemini_breaker, 'allow_request', return_value=False):
+            result = await analyzer_agent(create_test_state(message="The bank has suspended your card"))
+        llm.ainvoke.assert_not_called()
+        assert result['analysis_tier'] == "circuit_open"
+
+    @pytest.mark.asyncio
+    async def test_bulk_request_queues_at_bulk_priority(self):
+        from agents.analyzer import analyzer_agent
+        from services.llm_governor import PRIORITY_BULK
+        state = create_test_state(message="Your bank account is suspended")
+        state['priority'] = "bulk"
+        gemini = AsyncMock(return_value={"risk_score": 90, "detected_tactics": ["AUTHORITY"], "analysis": {}, "confidence": 0.9})
+        with patch('agents.analyzer.analyze_with_gemini', gemini), \
+             patch('agents.analyzer.settings.SINGLE_FLIGHT_ENABLED', False), \
+             patch('agents.analyzer.get_cached_analysis', AsyncMock(return_value=None)):
+            result = await analyzer_agent(state)
+        assert gemini.await_args.args[4] == PRIORITY_BULK
+        assert result['risk_score'] == 90
+
+    @pytest.mark.asyncio
+    async def test_cancelled_call_releases_probe(self):
+        import asyncio
+        from agents.analyzer import analyze_with_gemini
+        from services.circuit_breaker import CircuitBreaker
+        breaker = CircuitBreaker(name="test", window_seconds=60, failure_rate_threshold=0.5, min_calls=1, open_seconds=0, half_open_probes=1)
+        breaker.record_failure()
+        with patch('agents.analyzer.gemini_breaker', breaker), \
+             patch('agents.analyzer.request_gemini_analysis', AsyncMock(side_effect=asyncio.CancelledError)):
+            with pytest.raises(asyncio.CancelledError):
+                await analyze_with_gemini("+15552345678", "Your bank account is suspended", [], 0)
+        assert breaker.state == "half_open"
+        assert breaker.allow_request()
+
+
+class TestLocalModel:
+    SCAM = ["Your account is suspended, verify your password now", "You won a prize, pay the release fee to claim",
+            "Send your bank details to receive your tax refund", "Final notice: pay the overdue balance with gift cards"]
+    LEGITIMATE = ["See you at dinner tonight", "The meeting moved to 3pm",
+                  "Can you pick up milk on the way home", "Happy birthday, have a great day"]
+
+    def train(self):
+        from agents.local_model import train_logistic_regression
+        return train_logistic_regression(self.SCAM + self.LEGITIMATE, [1] * 4 + [0] * 4, feature_bits=12)
+
+    def test_training_separates_classes(self):
+        model = self.train()
+        assert min(model.predict_proba(m) for m in self.SCAM) > max(model.predict_proba(m) for m in self.LEGITIMATE)
+
+    def test_save_and_load_roundtrip(self, tmp_path):
+        from agents.local_model import LocalModel
+        model = self.train()
+        path = str(tmp_path / "model.npz")
+        model.save(path)
+        loaded = LocalModel.load(path)
+        for message in self.SCAM + self.LEGITIMATE:
+            assert loaded.predict_proba(message) == pytest.approx(model.predict_proba(message))
+
+    def test_corrupt_model_file_is_skipped(self, tmp_path):
+        from agents.local_model import load_local_model, get_local_model
+        path = tmp_path / "model.npz"
+        path.write_bytes(b"PK\x03\x04 not a zip archive")
+        assert load_local_model(str(path)) is False
+        assert get_local_model() is None
+
+    def test_batch_matches_single(self):
+        model = self.train()
+        messages = self.SCAM + self.LEGITIMATE + ["", "Call 555-123-4567 now"]
+        assert model.predict_proba_batch(messages).tolist() == [model.predict_proba(m) for m in messages]
+
+    @pytest.mark.asyncio
+    async def test_confident_model_decides_ambiguous_band(self):
+        from agents.analyzer import analyzer_agent
+        model = self.train()
+        model.bias = 10.0
+        llm = AsyncMock()
+        with patch('agents.analyzer.get_llm', return_value=llm), \
+             patch('agents.analyzer.get_local_model', return_value=model), \
+             patch('agents.analyzer.settings.CASCADE_ENABLED', True):
+            result = await analyzer_agent(create_test_state(message="Your bank account is suspended"))
+        llm.ainvoke.assert_not_called()
+        assert result['analysis_tier'] == "model_block"
+        assert "AUTHORITY" in result['detected_tactics']
+
+
 class TestPatternAgent:
     def test_calculate_pattern_confidence(self):
         from agents.pattern import calculate_pattern_confidence
@@ -68,6 +296,8 @@ class TestPatternAgent:
         assert confidence == 40
         confidence = calculate_pattern_confidence(known_scammer=True, previous_reports=0, url_malicious=True, similar_patterns=[])
         assert confidence == 70
+        confidence = calculate_pattern_confidence(known_scammer=False, previous_reports=0, url_malicious=False, similar_patterns=[], number_reported=True)
+        assert confidence == 30
 
 
 class TestBlockerAgent:
@@ -81,6 +311,122 @@ class TestBlockerAgent:
         assert determine_decision(state) == "WARN"
         state['risk_score'] = 20
         assert determine_decision(state) == "PASS"
+        state['reported_numbers'] = ["+18007226637"]
+        assert determine_decision(state) == "PASS"
+        state['reported_numbers'] = []
+        state['sender_blocked'] = True
+        assert determine_decision(state) == "BLOCK"
+    
+    def test_reported_body_number_is_not_held_against_sender(self):
+        from agents.blocker import blocks_on_sender_evidence
+        state = create_test_state()
+        state['reported_numbers'] = ["+18007226637"]
+        state['risk_score'] = 60
+        state['pattern_confidence'] = 80
+        assert blocks_on_sender_evidence(state) is False
+        state['known_scammer'] = True
+        assert blocks_on_sender_evidence(state) is True
+    
+    @pytest.mark.asyncio
+    async def test_blocklisted_sender_is_not_reported_to_community(self):
+        from unittest.mock import MagicMock
+        from agents.blocker import blocker_agent
+        state = create_test_state()
+        state['sender_blocked'] = True
+        state['risk_score'] = 10
+        writer = MagicMock()
+        with patch('agents.blocker.add_to_blocklist', AsyncMock(return_value=True)), \
+             patch('agents.blocker.log_incident_to_es', AsyncMock(return_value=True)), \
+             patch('services.elasticsearch_client.reputation_writer', writer):
+            result = await blocker_agent(state)
+        assert result['final_decision'] == "BLOCK"
+        writer.record.assert_not_called()
+        assert "community_database_updated" not in result['actions_taken']
+
+
+class TestWorkflow:
+    @pytest.mark.asyncio
+    async def test_analyzer_and_pattern_run_concurrently(self):
+        import asyncio
+        import time
+        from main_modular import create_scam_detection_workflow
+
+        async def slow_llm_call(messages):
+            await asyncio.sleep(0.2)
+            return type("Response", (), {"content": '{"risk_score": 20, "detected_tactics": [], "analysis": {}, "confidence": 0.9}'})()
+
+        async def slow_search(*args, **kwargs):
+            await asyncio.sleep(0.2)
+            return []
+
+        llm = AsyncMock()
+        llm.ainvoke = slow_llm_call
+        with patch('agents.analyzer.get_llm', return_value=llm), \
+             patch('agents.analyzer.settings.CASCADE_ENABLED', False), \
+             patch('agents.screener.search_message_reputation', AsyncMock(return_value=(None, [], []))), \
+             patch('agents.pattern.search_similar_patterns', slow_search):
+            workflow = create_scam_detection_workflow()
+            start = time.perf_counter()
+            result = await workflow.ainvoke(create_test_state(message="Hello there"))
+            elapsed = time.perf_counter() - start
+
+        assert elapsed < 0.35
+        assert result['final_decision'] == "PASS"
+        assert result['risk_score'] == 20
+        assert result['decision_path'] == "full"
+        assert sorted(result['agents_involved']) == ["alerter", "analyzer", "blocker", "pattern", "screener", "watcher"]
+    
+    @pytest.mark.asyncio
+    async def test_known_scammer_skips_llm(self):
+        from main_modular import create_scam_detection_workflow
+        llm = AsyncMock()
+        with patch('agents.analyzer.get_llm', return_value=llm), \
+             patch('agents.screener.search_message_reputation', AsyncMock(return_value=({'report_count': 12}, [], []))), \
+             patch('agents.pattern.search_similar_patterns', AsyncMock(return_value=[])) as similar:
+            workflow = create_scam_detection_workflow()
+            result = await workflow.ainvoke(create_test_state(message="Call me back"))
+        
+        llm.ainvoke.assert_not_called()
+        similar.assert_not_called()
+        assert result['decision_path'] == "fast_path"
+        assert result['final_decision'] == "BLOCK"
+        # 40 for a known scammer plus 12 reports at 0.5, not a made-up 100
+        assert result['risk_score'] == 46
+        assert "analyzer" not in result['agents_involved']
+    
+    @pytest.mark.asyncio
+    async def test_deadline_degrades_slow_stages(self):
+        import asyncio
+        import time
+        from main_modular import create_scam_detection_workflow
+        from services.deadline import new_deadline
+
+        async def slow_llm_call(messages):
+            await asyncio.sleep(1)
+
+        async def slow_search(*args, **kwargs):
+            await asyncio.sleep(1)
+            return []
+
+        llm = AsyncMock()
+        llm.ainvoke = slow_llm_call
+        with patch('agents.analyzer.get_llm', return_value=llm), \
+             patch('agents.analyzer.settings.CASCADE_ENABLED', False), \
+             patch('agents.analyzer.settings.SINGLE_FLIGHT_ENABLED', False), \
+             patch('agents.analyzer.settings.DEADLINE_LLM_MIN_MS', 0), \
+             patch('agents.analyzer.get_cached_analysis', AsyncMock(return_value=None)), \
+             patch('agents.screener.search_message_reputation', AsyncMock(return_value=(None, [], []))), \
+             patch('agents.pattern.search_similar_patterns', slow_search):
+            workflow = create_scam_detection_workflow()
+            state = create_test_state(message="Your bank account is suspended")
+            state['deadline'] = new_deadline(200)
+            start = time.perf_counter()
+            result = await workflow.ainvoke(state)
+            elapsed = time.perf_counter() - start
+
+        assert elapsed < 0.5
+        assert result['analysis_tier'] == "deadline"
+        assert {"llm", "pattern_search"} <= set(result['degraded_stages'])
 
 
 if __name__ == "__main__":
@@ -14,6 +14,45 @@ class TestElasticsearchClient:
             result = await search_scam_number('+1-555-SCAM')
             assert result is not None
             assert result['phone_number'] == '+1-555-SCAM'
+    
+    @pytest.mark.asyncio
+    async def test_numbers_and_urls_share_one_msearch(self):
+        numbers = {'hits': {'total': {'value': 2}, 'hits': [
+            {'_source': {'phone_number': '+15552345678', 'report_count': 3}},
+            {'_source': {'phone_number': '+18007226637', 'report_count': 9}}
+        ]}}
+        hit = {'hits': {'total': {'value': 1}, 'hits': [{'_source': {'url': 'c.com'}}]}}
+        miss = {'hits': {'total': {'value': 0}, 'hits': []}}
+        mock_result = {'responses': [numbers, miss, {'error': {'type': 'index_not_found_exception'}}, hit]}
+        with patch('services.elasticsearch_client.es_client') as mock_es:
+            mock_es.msearch = AsyncMock(return_value=mock_result)
+            from services.elasticsearch_client import search_message_reputation
+            sender, reported_numbers, reported = await search_message_reputation(
+                '(555) 234-5678', ['+18007226637', '+442079460958'], ['https://a.com', 'https://b.com', 'https://c.com']
+            )
+        mock_es.msearch.assert_called_once()
+        searches = mock_es.msearch.call_args.kwargs['searches']
+        assert len(searches) == 8
+        assert searches[1]['query'] == {'terms': {'phone_number': ['+15552345678', '+18007226637', '+442079460958']}}
+        assert sender['report_count'] == 3
+        assert reported_numbers == ['+18007226637']
+        assert reported == [False, False, True]
+    
+    def test_merge_scam_numbers(self):
+        from scripts.migrate_phone_numbers import merge_scam_numbers
+        merged = merge_scam_numbers('+18007226637', [
+            {'phone_number': '+18007226637', 'report_count': 4, 'blocked_by_users': 2, 'confidence_score': 90.0, 'reported_by': ['user-2'],
+             'scam_types': ['irs_impersonation'], 'first_reported': '2024-03-01T00:00:00', 'last_reported': '2024-05-01T00:00:00'},
+            {'phone_number': '+1-800-SCAMMER', 'report_count': 100, 'confidence_score': 99.0, 'country_code': 'US', 'reported_by': 'user-1',
+             'scam_types': ['irs_impersonation', 'tech_support'], 'first_reported': '2023-01-01T00:00:00', 'last_reported': '2024-04-01T00:00:00'}
+        ])
+        assert merged['phone_number'] == '+18007226637'
+        assert merged['report_count'] == 104 and merged['blocked_by_users'] == 2
+        assert merged['confidence_score'] == 99.0
+        assert merged['scam_types'] == ['irs_impersonation', 'tech_support']
+        assert merged['first_reported'] == '2023-01-01T00:00:00' and merged['last_reported'] == '2024-05-01T00:00:00'
+        assert merged['country_code'] == 'US'
+        assert merged['reported_by'] == ['user-2', 'user-1']
 
 
 class TestElasticsearchIndexMappings:
@@ -0,0 +1,761 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+import sys
+sys.path.insert(0, '..')
+
+
+class TestAnalysisCache:
+    def test_key_ignores_case_whitespace_and_url_order(self):
+        from services.analysis_cache import analysis_cache_key
+        key = analysis_cache_key("URGENT:  verify   now", ["https://b.com", "https://a.com"])
+        assert key == analysis_cache_key("urgent: verify now", ["https://A.com", "https://b.com"])
+        assert key != analysis_cache_key("urgent: verify today", ["https://a.com", "https://b.com"])
+    
+    def test_key_changes_with_model(self):
+        from services.analysis_cache import analysis_cache_key
+        from config.settings import settings
+        key = analysis_cache_key("hello", [])
+        with patch.object(settings, 'GEMINI_MODEL', 'another-model'):
+            assert analysis_cache_key("hello", []) != key
+    
+    def test_local_cache_lru_eviction_and_ttl(self):
+        from services.analysis_cache import LocalTTLCache
+        cache = LocalTTLCache(max_entries=2, ttl_seconds=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        expired = LocalTTLCache(max_entries=2, ttl_seconds=-1)
+        expired.set("a", 1)
+        assert expired.get("a") is None
+    
+    @pytest.mark.asyncio
+    async def test_redis_hit_populates_local_tier(self):
+        from services import analysis_cache
+        analysis_cache.local_cache.clear()
+        cached = {"risk_score": 80, "detected_tactics": ["URGENCY"], "analysis": {}, "confidence": 0.9}
+        with patch('services.analysis_cache.redis_available', return_value=True), \
+             patch('services.analysis_cache.cache_get', AsyncMock(return_value=cached)) as redis_get:
+            assert await analysis_cache.get_cached_analysis("Act now", []) == cached
+            assert await analysis_cache.get_cached_analysis("Act now", []) == cached
+        redis_get.assert_called_once()
+
+
+class TestNearDuplicateIndex:
+    def test_finds_entries_within_distance(self):
+        from services.near_duplicate_index import SimHashIndex
+        index = SimHashIndex(max_distance=3, max_entries=10, ttl_seconds=60)
+        fingerprint = 0xDEADBEEFCAFEBABE
+        index.add(fingerprint, {"risk_score": 90})
+        assert index.query(fingerprint ^ 0b111) == ({"risk_score": 90}, 3)
+        assert index.query(fingerprint ^ 0b1111) is None
+    
+    def test_bounded_size_and_ttl(self):
+        from services.near_duplicate_index import SimHashIndex
+        index = SimHashIndex(max_distance=3, max_entries=2, ttl_seconds=60)
+        for fingerprint in (0x00000000FFFFFFFF, 0xFFFFFFFF00000000, 0x5555555555555555):
+            index.add(fingerprint, fingerprint)
+        assert len(index) == 2
+        assert index.query(0x00000000FFFFFFFF) is None
+        expired = SimHashIndex(max_distance=3, max_entries=2, ttl_seconds=-1)
+        expired.add(42, "stale")
+        assert expired.query(42) is None
+        assert len(expired) == 0
+
+
+class TestSingleFlight:
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_share_one_call(self):
+        import asyncio
+        from services.single_flight import single_flight
+        calls = 0
+        
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return {"risk_score": 77}
+        
+        with patch('services.single_flight.redis_available', return_value=False):
+            results = await asyncio.gather(*(single_flight("same-key", compute) for _ in range(10)))
+        assert calls == 1
+        assert all(value == {"risk_score": 77} for value, _ in results)
+        assert sum(shared for _, shared in results) == 9
+    
+    @pytest.mark.asyncio
+    async def test_leader_failure_reaches_every_waiter(self):
+        import asyncio
+        from services.single_flight import single_flight
+        
+        async def compute():
+            await asyncio.sleep(0.05)
+            raise RuntimeError("gemini down")
+        
+        with patch('services.single_flight.redis_available', return_value=False):
+            results = await asyncio.gather(*(single_flight("failing-key", compute) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+    
+    @pytest.mark.asyncio
+    async def test_remote_follower_receives_published_result(self):
+        import json
+        from services.single_flight import single_flight
+        subscription = AsyncMock()
+        subscription.get_message.return_value = {"data": json.dumps({"ok": True, "result": {"risk_score": 65}})}
+        compute = AsyncMock()
+        with patch('services.single_flight.redis_available', return_value=True), \
+             patch('services.single_flight.acquire_lock', AsyncMock(return_value=False)), \
+             patch('services.single_flight.lock_exists', AsyncMock(return_value=True)), \
+             patch('services.single_flight.pubsub', return_value=subscription):
+            value, shared = await single_flight("remote-key", compute, timeout=1)
+        compute.assert_not_called()
+        assert value == {"risk_score": 65}
+        assert shared
+
+    @pytest.mark.asyncio
+    async def test_late_follower_reads_stored_result(self):
+        import json
+        from services.single_flight import single_flight
+        subscription = AsyncMock()
+        subscription.get_message.return_value = None
+        compute = AsyncMock()
+        with patch('services.single_flight.redis_available', return_value=True), \
+             patch('services.single_flight.acquire_lock', AsyncMock(return_value=False)), \
+             patch('services.single_flight.lock_exists', AsyncMock(return_value=True)), \
+             patch('services.single_flight.cache_get', AsyncMock(return_value={"ok": True, "result": {"risk_score": 65}})), \
+             patch('services.single_flight.pubsub', return_value=subscription):
+            value, shared = await single_flight("late-key", compute, timeout=5)
+        compute.assert_not_called()
+        subscription.get_message.assert_not_called()
+        assert value == {"risk_score": 65}
+        assert shared
+
+
+class TestMicroBatcher:
+    def test_parse_batch_response_keeps_valid_items(self):
+        from services.llm_batcher import parse_batch_response
+        text = '[{"id": 1, "risk_score": 90, "detected_tactics": ["URGENCY"]}, {"id": 2, "risk_score": "high"}, {"id": 3, "risk_score": 10, "detec'
+        results = parse_batch_response(text, 3)
+        assert list(results) == [1]
+        assert results[1]["risk_score"] == 90
+    
+    @pytest.mark.asyncio
+    async def test_batch_demultiplexes_results(self):
+        import asyncio
+        from services.llm_batcher import GeminiMicroBatcher
+        llm = AsyncMock()
+        llm.ainvoke.return_value.content = '[{"id": 2, "risk_score": 20}, {"id": 1, "risk_score": 80}]'
+        batcher = GeminiMicroBatcher(max_batch_size=3, window_ms=10)
+        with patch('services.llm_batcher.get_llm', return_value=llm):
+            results = await asyncio.gather(
+                batcher.submit("+1", "first", []),
+                batcher.submit("+2", "second", []),
+                batcher.submit("+3", "third", [])
+            )
+        llm.ainvoke.assert_called_once()
+        assert results[0]["risk_score"] == 80
+        assert results[1]["risk_score"] == 20
+        assert results[2] is None
+    
+    @pytest.mark.asyncio
+    async def test_failed_batch_falls_back_to_single_calls(self):
+        import asyncio
+        from services.llm_batcher import GeminiMicroBatcher, batch_counters
+        llm = AsyncMock()
+        llm.ainvoke.side_effect = RuntimeError("Error calling generateContent: 500 Internal")
+        batcher = GeminiMicroBatcher(max_batch_size=3, window_ms=10)
+        failed_batches = batch_counters["failed_batches"]
+        with patch('services.llm_batcher.get_llm', return_value=llm):
+            results = await asyncio.gather(*(batcher.submit(f"+{i}", f"message {i}", []) for i in range(3)))
+        assert results == [None, None, None]
+        assert batch_counters["failed_batches"] == failed_batches + 1
+
+
+class TestLLMGovernor:
+    @pytest.mark.asyncio
+    async def test_interactive_requests_jump_the_bulk_queue(self):
+        import asyncio
+        from services.llm_governor import LLMGovernor, PRIORITY_BULK, PRIORITY_INTERACTIVE
+        governor = LLMGovernor(rpm=6000, tpm=10**9, max_concurrency=1, min_concurrency=1, latency_target_ms=5000, queue_timeout_seconds=5)
+        order = []
+        release = asyncio.Event()
+        
+        async def hold():
+            await release.wait()
+        
+        async def record(name):
+            order.append(name)
+        
+        holder = asyncio.create_task(governor.run(hold))
+        await asyncio.sleep(0)
+        bulk = asyncio.create_task(governor.run(lambda: record("bulk"), PRIORITY_BULK))
+        interactive = asyncio.create_task(governor.run(lambda: record("interactive"), PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        assert governor.stats()["queue_depth"] == 2
+        release.set()
+        await asyncio.gather(holder, bulk, interactive)
+        assert order == ["interactive", "bulk"]
+    
+    @pytest.mark.asyncio
+    async def test_rate_limit_halves_concurrency_and_pauses(self):
+        from services.llm_governor import LLMGovernor
+        governor = LLMGovernor(rpm=6000, tpm=10**9, max_concurrency=8, min_concurrency=1, latency_target_ms=5000, queue_timeout_seconds=5)
+        
+        async def rate_limited():
+            raise RuntimeError("429 Resource has been exhausted")
+        
+        with pytest.raises(RuntimeError):
+            await governor.run(rate_limited)
+        stats = governor.stats()
+        assert stats["concurrency_limit"] == 4
+        assert stats["rate_limited"] == 1
+        assert stats["paused_for_seconds"] > 0
+    
+    @pytest.mark.asyncio
+    async def test_other_errors_do_not_pause(self):
+        from google.api_core.exceptions import ResourceExhausted
+        from services.llm_governor import LLMGovernor, is_rate_limit_error
+        governor = LLMGovernor(rpm=6000, tpm=10**9, max_concurrency=8, min_concurrency=1, latency_target_ms=5000, queue_timeout_seconds=5)
+        
+        async def server_error():
+            raise RuntimeError("Error calling generateContent: 500 Internal")
+        
+        with pytest.raises(RuntimeError):
+            await governor.run(server_error)
+        stats = governor.stats()
+        assert stats["rate_limited"] == 0 and stats["concurrency_limit"] == 8 and stats["paused_for_seconds"] == 0
+        assert not is_rate_limit_error(ValueError("could not parse the rate field"))
+        assert is_rate_limit_error(ResourceExhausted("quota"))
+        try:
+            try:
+                raise ResourceExhausted("quota")
+            except ResourceExhausted as cause:
+                raise RuntimeError("Gemini call failed") from cause
+        except RuntimeError as wrapped:
+            assert is_rate_limit_error(wrapped)
+    
+    @pytest.mark.asyncio
+    async def test_queue_timeout(self):
+        import asyncio
+        from services.llm_governor import LLMGovernor, GovernorTimeout
+        governor = LLMGovernor(rpm=6000, tpm=10**9, max_concurrency=1, min_concurrency=1, latency_target_ms=5000, queue_timeout_seconds=0.05)
+        blocker = asyncio.create_task(governor.run(lambda: asyncio.sleep(0.2)))
+        await asyncio.sleep(0)
+        with pytest.raises(GovernorTimeout):
+            await governor.run(lambda: asyncio.sleep(0))
+        await blocker
+        assert governor.active == 0
+
+
+class TestCircuitBreaker:
+    def test_opens_on_failure_rate(self):
+        from services.circuit_breaker import CircuitBreaker
+        breaker = CircuitBreaker(name="test", window_seconds=60, failure_rate_threshold=0.5, min_calls=4, open_seconds=30, half_open_probes=2)
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_success()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow_request()
+    
+    def test_half_open_probes_close_or_reopen(self):
+        from services.circuit_breaker import CircuitBreaker
+        breaker = CircuitBreaker(name="test", window_seconds=60, failure_rate_threshold=0.5, min_calls=1, open_seconds=0, half_open_probes=2)
+        breaker.record_failure()
+        assert breaker.allow_request() and breaker.state == "half_open"
+        assert breaker.allow_request()
+        assert not breaker.allow_request()
+        breaker.record_success()
+        breaker.record_success()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+        assert breaker.allow_request() and breaker.state == "half_open"
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+
+class TestLLMStream:
+    def test_incremental_parser_decodes_fields_as_they_close(self):
+        from services.llm_stream import IncrementalJSONObject
+        text = '```json\n{"risk_score": 85, "detected_tactics": ["URGENCY", "a, \\"b\\" {"], "confidence": 0.9, "analysis": {"threats_found": ["x"]}, "explanation": "done"}\n```'
+        parser = IncrementalJSONObject()
+        seen = []
+        for char in text:
+            parser.feed(char)
+            seen.append(len(parser.fields))
+        assert parser.complete
+        assert parser.fields["detected_tactics"] == ["URGENCY", 'a, "b" {']
+        assert parser.fields["analysis"] == {"threats_found": ["x"]}
+        assert parser.fields["explanation"] == "done"
+        assert seen.index(3) < text.index('"analysis"') + 1
+    
+    @pytest.mark.asyncio
+    async def test_analyzer_returns_on_decision_fields_and_caches_later(self):
+        import asyncio
+        from types import SimpleNamespace
+        from agents.analyzer import request_gemini_analysis
+        from services.llm_governor import PRIORITY_INTERACTIVE
+        release = asyncio.Event()
+        stored = asyncio.Event()
+        
+        async def astream(messages):
+            yield SimpleNamespace(content='{"risk_score": 92, "detected_tactics": ["THREATS"], "confidence": 0.8,')
+            await release.wait()
+            yield SimpleNamespace(content=' "analysis": {}, "explanation": "arrest threat"}')
+        
+        async def store(message, urls, fingerprint, result):
+            stored.set()
+            return result
+        
+        llm = SimpleNamespace(astream=astream)
+        with patch('agents.analyzer.settings.LLM_STREAMING_ENABLED', True), \
+             patch('agents.analyzer.settings.LLM_BATCH_ENABLED', False), \
+             patch('agents.analyzer.get_llm', return_value=llm), \
+             patch('agents.analyzer.store_gemini_result', side_effect=store) as store_mock:
+            result = await asyncio.wait_for(request_gemini_analysis("+1", "pay or be arrested", [], 0, PRIORITY_INTERACTIVE), 1)
+            assert result == {"risk_score": 92, "detected_tactics": ["THREATS"], "confidence": 0.8}
+            assert not stored.is_set()
+            release.set()
+            await asyncio.wait_for(stored.wait(), 1)
+        assert store_mock.call_args.args[3]["explanation"] == "arrest threat"
+
+
+class TestRequestHedger:
+    @pytest.mark.asyncio
+    async def test_slow_primary_is_hedged_and_cancelled(self):
+        import asyncio
+        from services.llm_hedging import RequestHedger
+        hedger = RequestHedger(hedge_percentile=95, max_hedge_rate=1.0, min_delay_ms=10, min_samples=1)
+        hedger.attempt_latencies.append(0.01)
+        calls = []
+        
+        async def call():
+            calls.append(len(calls))
+            await asyncio.sleep(1 if len(calls) == 1 else 0)
+            return len(calls)
+        
+        assert await asyncio.wait_for(hedger.run(call), 0.5) == 2
+        stats = hedger.stats()
+        assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+        assert stats["unhedged_latency_ms_p99_at_least"] >= stats["latency_ms_p99"]
+    
+    @pytest.mark.asyncio
+    async def test_hedge_rate_cap(self):
+        import asyncio
+        from services.llm_hedging import RequestHedger
+        hedger = RequestHedger(hedge_percentile=95, max_hedge_rate=0.0, min_delay_ms=10, min_samples=1)
+        hedger.attempt_latencies.append(0.01)
+        
+        async def call():
+            await asyncio.sleep(0.03)
+            return "slow"
+        
+        assert await hedger.run(call) == "slow"
+        assert hedger.stats()["hedges"] == 0
+        assert hedger.stats()["skipped_rate_cap"] == 1
+
+
+class TestLLMClientPool:
+    def make_pool(self):
+        from services.gemini_client import PooledClient, LLMClientPool
+        clients = [
+            PooledClient("main/key1", "k1", "main-model", "main"),
+            PooledClient("main/key2", "k2", "main-model", "main"),
+            PooledClient("fast/key1", "k1", "fast-model", "fast")
+        ]
+        for client in clients:
+            client.llm = AsyncMock()
+        return LLMClientPool(clients)
+    
+    @pytest.mark.asyncio
+    async def test_routes_around_exhausted_and_unhealthy_clients(self):
+        from services.circuit_breaker import CircuitOpenError
+        pool = self.make_pool()
+        main1, main2, fast = pool.clients
+        main1.llm.ainvoke.side_effect = RuntimeError("429 quota exceeded")
+        with pytest.raises(RuntimeError):
+            await main1.ainvoke([])
+        assert pool.select("main") is main2
+        
+        main2.breaker.state = "open"
+        main2.breaker.opened_at = float("inf")
+        main1.breaker.state = "open"
+        main1.breaker.opened_at = float("inf")
+        assert pool.select("main") is fast
+        assert pool.stats()["main_rerouted"] == 1
+        fast.breaker.state = "open"
+        fast.breaker.opened_at = float("inf")
+        with pytest.raises(CircuitOpenError):
+            pool.select("main")
+    
+    def test_failed_init_is_not_retried_on_every_call(self):
+        from services.gemini_client import PooledClient
+        client = PooledClient("main/key1", "k1", "main-model", "main")
+        with patch('services.gemini_client.ChatGoogleGenerativeAI', side_effect=ValueError("bad key")) as constructor:
+            assert not client.ready()
+            assert not client.ready()
+        assert constructor.call_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_low_confidence_fast_answer_is_escalated(self):
+        from agents.analyzer import request_gemini_analysis
+        from services.llm_governor import PRIORITY_INTERACTIVE
+        pool = self.make_pool()
+        main1, main2, fast = pool.clients
+        fast.llm.ainvoke.return_value.content = '{"risk_score": 55, "detected_tactics": [], "confidence": 0.4}'
+        main1.llm.ainvoke.return_value.content = '{"risk_score": 90, "detected_tactics": ["THREATS"], "confidence": 0.9}'
+        main2.llm.ainvoke.return_value.content = main1.llm.ainvoke.return_value.content
+        
+        async def store(message, urls, fingerprint, result):
+            return result
+        
+        with patch('agents.analyzer.gemini_pool', pool), \
+             patch('agents.analyzer.get_llm', side_effect=pool.select), \
+             patch('agents.analyzer.settings.LLM_BATCH_ENABLED', False), \
+             patch('agents.analyzer.settings.LLM_STREAMING_ENABLED', False), \
+             patch('agents.analyzer.settings.LLM_HEDGING_ENABLED', False), \
+             patch('agents.analyzer.store_gemini_result', side_effect=store) as store_mock:
+            result = await request_gemini_analysis("+1", "pay now", [], 0, PRIORITY_INTERACTIVE)
+        assert result["risk_score"] == 90
+        assert fast.llm.ainvoke.call_count == 1
+        assert store_mock.call_count == 1
+        assert pool.stats()["escalations"] == 1
+
+
+class TestMembershipFilter:
+    def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives(self):
+        from services.membership_filter import BloomFilter
+        bloom = BloomFilter(capacity=5000, fp_rate=0.01)
+        members = [f"+1-555-{i:07d}" for i in range(5000)]
+        bloom.add_many(members[:2500])
+        for member in members[2500:]:
+            bloom.add(member)
+        assert all(member in bloom for member in members)
+        false_positives = sum(f"+44-20-{i:07d}" in bloom for i in range(20000))
+        assert false_positives / 20000 < 0.02
+        assert 0.005 < bloom.estimated_fp_rate() < 0.02
+    
+    @pytest.mark.asyncio
+    async def test_filtered_lookups_skip_elasticsearch(self):
+        from services.membership_filter import BloomFilter, IndexFilter
+        from services.url_reputation import URLReputationIndex
+        from services.elasticsearch_client import search_message_reputation
+        numbers = IndexFilter("scam_numbers", "phone_number", "last_reported")
+        numbers.bloom = BloomFilter(100, 0.001)
+        numbers.remember("+18007226637")
+        urls = URLReputationIndex()
+        urls.add("bad.example")
+        urls.ready = True
+        hit = {'hits': {'total': {'value': 1}, 'hits': [{'_source': {'phone_number': '+18007226637'}}]}}
+        with patch('services.elasticsearch_client.scam_number_filter', numbers), \
+             patch('services.elasticsearch_client.url_reputation', urls), \
+             patch('services.elasticsearch_client.es_client') as mock_es:
+            mock_es.msearch = AsyncMock(return_value={'responses': [hit]})
+            result = await search_message_reputation("+1-555-0100", ["+15551230000"], ["https://fine.example", "https://login.bad.example/x"])
+            assert result == (None, [], [False, True])
+            mock_es.msearch.assert_not_called()
+            sender, reported_numbers, reported = await search_message_reputation("+1-800-SCAMMER", [], ["https://fine.example"])
+        assert mock_es.msearch.call_args.kwargs['searches'] == [{"index": "scam_numbers"}, {"query": {"terms": {"phone_number": ["+18007226637"]}}, "size": 1}]
+        assert sender["phone_number"] == "+18007226637" and reported_numbers == [] and reported == [False]
+        assert numbers.stats()["negatives"] == 2
+
+
+class TestURLReputation:
+    def test_canonicalize_url(self):
+        from services.url_reputation import canonicalize_url
+        assert canonicalize_url("HTTPS://User:pw@Secure-Bank-Verify.COM.:443/a/./b/../login#top") == ("secure-bank-verify.com", "secure-bank-verify.com/a/login")
+        assert canonicalize_url("secure-bank-verify.com").key == "secure-bank-verify.com/"
+        assert canonicalize_url("http://example.com:8080/%7Euser?id=1").key == "example.com:8080/~user?id=1"
+        assert canonicalize_url("http://bücher.example/").host == "xn--bcher-kva.example"
+        assert canonicalize_url("http:///nohost") is None
+    
+    def test_domain_and_parent_matching(self):
+        from services.url_reputation import URLReputationIndex
+        index = URLReputationIndex()
+        assert index.add("secure-bank-verify.com")
+        assert index.add("https://docs.example.com/phish/form")
+        assert index.add("evil.github.io")
+        assert not index.add("co.uk") and not index.add("github.io")
+        assert index.match("https://secure-bank-verify.com/login") == "secure-bank-verify.com"
+        assert index.match("http://a.b.SECURE-BANK-VERIFY.com") == "secure-bank-verify.com"
+        assert index.match("https://not-secure-bank-verify.com") is None
+        assert index.match("docs.example.com/phish/form/") == "docs.example.com/phish/form"
+        assert index.match("https://docs.example.com/other") is None
+        assert index.match("https://x.evil.github.io") == "evil.github.io"
+        assert index.match("https://good.github.io") is None
+    
+    def test_elasticsearch_fallback_matches_parent_domains(self):
+        from services.elasticsearch_client import malicious_url_search
+        terms = malicious_url_search("https://login.secure-bank-verify.com/x")["query"]["terms"]["url"]
+        assert terms == ["https://login.secure-bank-verify.com/x", "login.secure-bank-verify.com/x", "login.secure-bank-verify.com", "secure-bank-verify.com"]
+
+
+class TestPhoneNumbers:
+    def test_canonicalize_phone_number(self):
+        from services.phone_numbers import canonicalize_phone_number
+        for raw in ("+1 (800) 555-0100", "800.555.0100", "18005550100", "011 1 800 555 0100"):
+            assert canonicalize_phone_number(raw) == "+18005550100"
+        assert canonicalize_phone_number("+1-800-SCAMMER") == "+18007226637"
+        assert canonicalize_phone_number("0044 20 7946 0958") == "+442079460958"
+        assert canonicalize_phone_number("020 7946 0958", default_country_code="44") == "+442079460958"
+        for raw in ("AMAZON", "VM-HDFCBK", "scam@example.com", "555-1234", "+1 555 12345", "1234567890", "+1 415 055 1234", ""):
+            assert canonicalize_phone_number(raw) is None
+    
+    def test_phone_number_key(self):
+        from services.phone_numbers import phone_number_key
+        assert phone_number_key(" (555) 234-5678 ") == "+15552345678"
+        assert phone_number_key(" scam@example.com ") == "scam@example.com"
+
+
+class TestPatternIndex:
+    def test_fuzzy_bm25_ranking(self):
+        from services.pattern_index import PatternIndex, edit_distance
+        index = PatternIndex()
+        index.add("irs", {"pattern_text": "IRS notice: You owe back taxes. Pay immediately or face arrest.", "category": "irs_impersonation", "risk_score": 99})
+        index.add("prize", {"pattern_text": "You've won $1,000,000! Claim your prize now!", "category": "lottery_scam"})
+        index.add("bank", {"pattern_text": "Your bank account has been suspended. Verify your account now.", "category": "phishing"})
+        assert edit_distance("arrest", "arrets", 2) == 1
+        ranked = index.search("Pay your bak taxes immediatly or you face arest", 5)
+        assert ranked[0][0] == "irs"
+        assert all(score > 0 for _, score in ranked)
+        assert [p["category"] for p in index.similar_patterns("claim the prize", 1)] == ["lottery_scam"]
+        assert index.search("dinner tonight", 5) == []
+    
+    def test_replacing_a_pattern_updates_postings(self):
+        from services.pattern_index import PatternIndex
+        index = PatternIndex()
+        index.add("1", {"pattern_text": "gift card payment required"})
+        index.add("1", {"pattern_text": "crypto wallet recovery"})
+        assert index.search("gift card", 5) == []
+        assert index.search("wallet", 5)[0][0] == "1"
+        index.index.remove("1")
+        assert len(index.index) == 0 and index.index.postings == {}
+    
+    @pytest.mark.asyncio
+    async def test_search_falls_back_to_elasticsearch_until_built(self):
+        from services.pattern_index import PatternIndex
+        from services.elasticsearch_client import search_similar_patterns
+        index = PatternIndex()
+        index.add("1", {"pattern_text": "gift card payment required", "category": "gift_card", "risk_score": 90})
+        hit = {'hits': {'hits': [{'_score': 3.2, '_source': {'pattern_text': 'gift card payment required', 'category': 'gift_card'}}]}}
+        with patch('services.elasticsearch_client.pattern_index', index), \
+             patch('services.elasticsearch_client.es_client') as mock_es:
+            mock_es.search = AsyncMock(return_value=hit)
+            assert (await search_similar_patterns("gift card"))[0]["score"] == 3.2
+            index.ready = True
+            local = await search_similar_patterns("gift card")
+        mock_es.search.assert_called_once()
+        assert local[0]["category"] == "gift_card" and local[0]["risk_score"] == 90
+        assert index.stats()["fallbacks"] == 1
+
+
+class TestBulkWriter:
+    @pytest.mark.asyncio
+    async def test_flushes_full_batches_in_one_bulk_request(self):
+        import asyncio
+        from services.bulk_writer import BulkWriter
+        writer = BulkWriter(index="incident_logs", batch_docs=3, batch_bytes=10_000, flush_interval_ms=1000, max_buffered=5,
+                            backpressure_ms=10, max_retries=2, retry_backoff_ms=0)
+        with patch('services.elasticsearch_client.es_client') as mock_es:
+            mock_es.bulk = AsyncMock(return_value={"errors": False, "items": []})
+            for i in range(3):
+                assert await writer.submit({"n": i})
+            await asyncio.sleep(0)
+            await writer._flush_task
+        operations = mock_es.bulk.call_args.kwargs["operations"]
+        assert [op["n"] for op in operations[1::2]] == [0, 1, 2]
+        assert operations[0]["index"]["_index"] == "incident_logs"
+        assert writer.stats()["written"] == 3 and writer.stats()["buffered"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_retries_only_failed_items(self):
+        from services.bulk_writer import BulkWriter
+        writer = BulkWriter(index="incident_logs", batch_docs=10, batch_bytes=10_000, flush_interval_ms=1000, max_buffered=5,
+                            backpressure_ms=10, max_retries=2, retry_backoff_ms=0)
+        partial = {"errors": True, "items": [{"index": {"status": 201}}, {"index": {"status": 429}}, {"index": {"status": 400, "error": "mapping"}}]}
+        with patch('services.elasticsearch_client.es_client') as mock_es:
+            mock_es.bulk = AsyncMock(side_effect=[partial, {"errors": False, "items": []}])
+            for i in range(3):
+                await writer.submit({"n": i})
+            assert await writer.flush() is False
+            first_ids = [op["index"]["_id"] for op in mock_es.bulk.call_args.kwargs["operations"][::2]]
+            assert await writer.flush() is True
+        retried = mock_es.bulk.call_args.kwargs["operations"]
+        assert retried[0]["index"]["_id"] == first_ids[1] and retried[1] == {"n": 1}
+        stats = writer.stats()
+        assert stats["written"] == 2 and stats["retried"] == 1 and stats["dropped_rejected"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_full_buffer_drops_and_shutdown_flushes(self):
+        from services.bulk_writer import BulkWriter
+        writer = BulkWriter(index="incident_logs", batch_docs=100, batch_bytes=10_000, flush_interval_ms=1000, max_buffered=5,
+                            backpressure_ms=10, max_retries=2, retry_backoff_ms=0)
+        with patch('services.elasticsearch_client.es_client', None):
+            for i in range(5):
+                assert await writer.submit({"n": i})
+            assert await writer.submit({"n": 5}) is False
+        assert writer.stats()["dropped_full"] == 1
+        with patch('services.elasticsearch_client.es_client') as mock_es:
+            mock_es.bulk = AsyncMock(return_value={"errors": False, "items": []})
+            await writer.stop(timeout=1)
+        assert len(mock_es.bulk.call_args.kwargs["operations"]) == 10
+        assert writer.stats()["buffered"] == 0
+
+
+class TestIncidentLogs:
+    def test_incidents_go_to_the_daily_index_of_their_timestamp(self):
+        from services.incident_logs import incident_index
+        assert incident_index({"timestamp": "2026-10-16T23:59:59.5"}) == "incident_logs-2026.10.16"
+        assert incident_index({"timestamp": "not a date"}).startswith("incident_logs-")
+    
+    def test_expired_indices(self):
+        from datetime import datetime
+        from services.incident_logs import expired_indices
+        names = ["incident_logs-2026.07.17", "incident_logs-2026.07.18", "incident_logs-2026.10.16", "incident_logs-legacy"]
+        assert expired_indices(names, retention_days=90, now=datetime(2026, 10, 16, 12)) == ["incident_logs-2026.07.17"]
+    
+    @pytest.mark.asyncio
+    async def test_writer_routes_each_incident_to_its_day(self):
+        from services.bulk_writer import BulkWriter
+        from services.incident_logs import incident_index
+        writer = BulkWriter(index="incident_logs", batch_docs=10, batch_bytes=10_000, flush_interval_ms=1000, max_buffered=10,
+                            backpressure_ms=10, max_retries=2, retry_backoff_ms=0, index_for=incident_index)
+        await writer.submit({"timestamp": "2026-10-15T23:59:00"})
+        await writer.submit({"timestamp": "2026-10-16T00:01:00"})
+        with patch('services.elasticsearch_client.es_client') as mock_es:
+            mock_es.bulk = AsyncMock(return_value={"errors": False, "items": []})
+            assert await writer.flush()
+        operations = mock_es.bulk.call_args.kwargs["operations"]
+        assert [op["index"]["_index"] for op in operations[0::2]] == ["incident_logs-2026.10.15", "incident_logs-2026.10.16"]
+
+
+class TestReputationWriter:
+    @pytest.mark.asyncio
+    async def test_aggregates_one_upsert_per_number(self):
+        from services.reputation_writer import ReputationWriter
+        writer = ReputationWriter(flush_interval_ms=1000, batch_size=100, max_pending=10, max_retries=2)
+        for _ in range(50):
+            writer.record("+18007226637", ["irs_impersonation"], confidence_score=80, blocked=True)
+        writer.record("+18007226637", ["tech_support"], confidence_score=95, reported_by="user-2")
+        writer.record("+18007226637", ["tech_support"], reported_by="user-1")
+        writer.record("+18007226637", ["tech_support"], reported_by="user-2")
+        writer.record("+15551234567", ["unknown"])
+        with patch('services.elasticsearch_client.es_client') as mock_es:
+            mock_es.bulk = AsyncMock(return_value={"errors": False, "items": [{"update": {"status": 200}}] * 2})
+            assert await writer.flush() is True
+        operations = mock_es.bulk.call_args.kwargs["operations"]
+        assert len(operations) == 4
+        assert operations[0]["update"]["_id"] == "+18007226637"
+        params = operations[1]["script"]["params"]
+        assert params["report_count"] == 53 and params["blocked_by_users"] == 50
+        assert params["reported_by"] == ["user-1", "user-2"]
+        assert params["scam_types"] == ["irs_impersonation", "tech_support"] and params["confidence_score"] == 95
+        assert operations[1]["scripted_upsert"] is True
+        assert writer.stats()["pending_numbers"] == 0 and writer.stats()["numbers_written"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_failed_delta_retries_with_same_flush_id(self):
+        from services.reputation_writer import ReputationWriter
+        writer = ReputationWriter(flush_interval_ms=1000, batch_size=100, max_pending=10, max_retries=2)
+        writer.record("+18007226637", ["irs_impersonation"], blocked=True)
+        with patch('services.elasticsearch_client.es_client') as mock_es:
+            mock_es.bulk = AsyncMock(side_effect=[ConnectionError("reset"), {"errors": False, "items": [{"update": {"status": 200}}] * 2}])
+            assert await writer.flush() is False
+            first_id = mock_es.bulk.call_args.kwargs["operations"][1]["script"]["params"]["flush_id"]
+            writer.record("+18007226637", ["irs_impersonation"], blocked=True)
+            assert await writer.flush() is True
+        operations = mock_es.bulk.call_args.kwargs["operations"]
+        # the retried delta and the newer one are applied separately, each exactly once
+        assert [op["script"]["params"]["flush_id"] == first_id for op in operations[1::2]] == [True, False]
+        assert [op["script"]["params"]["report_count"] for op in operations[1::2]] == [1, 1]
+    
+    @pytest.mark.asyncio
+    async def test_update_scam_number_records_canonical_number(self):
+        from services.reputation_writer import ReputationWriter
+        from services.elasticsearch_client import update_scam_number
+        writer = ReputationWriter(flush_interval_ms=1000, batch_size=100, max_pending=1, max_retries=2)
+        with patch('services.elasticsearch_client.reputation_writer', writer):
+            assert await update_scam_number("+1-800-SCAMMER", ["irs_impersonation"], risk_score=90)
+            assert await update_scam_number("(555) 234-5678", ["unknown"], blocked=False) is False
+        assert list(writer.pending) == ["+18007226637"]
+        assert writer.stats()["dropped_full"] == 1
+
+
+def redis_with_pipeline(results=None, recent=None):
+    """Redis mock: pipeline(transaction=False) queues reads returning results; transactions watch and read recent."""
+    from unittest.mock import MagicMock
+    reads, writes = MagicMock(), MagicMock()
+    reads.execute = AsyncMock(return_value=results or [])
+    writes.execute = AsyncMock(return_value=[])
+    writes.watch, writes.unwatch = AsyncMock(), AsyncMock()
+    writes.hgetall = AsyncMock(return_value=recent or {})
+    for pipe in (reads, writes):
+        pipe.__aenter__ = AsyncMock(return_value=pipe)
+        pipe.__aexit__ = AsyncMock(return_value=False)
+    redis = MagicMock()
+    redis.pipeline.side_effect = lambda transaction=True: writes if transaction else reads
+    return redis, writes
+
+
+class TestUserStats:
+    @pytest.mark.asyncio
+    async def test_reads_reconciled_counters(self):
+        from services.user_stats import get_user_stats
+        counters = {"total_blocked": "4", "decision:block": "3", "decision:warn": "1",
+                    "risk_sum": "250.5", "risk_count": "3", "reconciled_at": "2026-01-01T00:00:00"}
+        redis, _ = redis_with_pipeline([counters, "2"])
+        with patch('services.user_stats.get_redis', return_value=redis), \
+             patch('services.user_stats.compute_user_stats', AsyncMock()) as compute:
+            stats = await get_user_stats("user-1")
+        compute.assert_not_called()
+        assert stats == {"total_blocked": 4, "blocked_today": 2, "decisions": {"block": 3, "warn": 1}, "average_risk_score": 83.5}
+    
+    @pytest.mark.asyncio
+    async def test_reconcile_keeps_increments_past_the_cutoff(self):
+        from datetime import datetime
+        from services.user_stats import get_user_stats, day_key
+        computed = {"total_blocked": 2, "blocked_today": 1, "decisions": {"block": 2},
+                    "risk_sum": 180.0, "risk_count": 2, "average_risk_score": 90.0, "complete": True}
+        now = datetime.utcnow().isoformat()[:16]
+        # the old minute is already in incident_logs; the current one may still be buffered
+        recent = {"2000-01-01T00:00|decision:block": "5", f"{now}|decision:warn": "1",
+                  f"{now}|risk_sum": "60", f"{now}|risk_count": "1"}
+        # counters from increments alone aren't trusted until a reconciliation has seeded them
+        redis, pipe = redis_with_pipeline([{"decision:warn": "1"}, None], recent)
+        with patch('services.user_stats.get_redis', return_value=redis), \
+             patch('services.user_stats.compute_user_stats', AsyncMock(return_value=computed)):
+            stats = await get_user_stats("user-1")
+        assert stats == {"total_blocked": 2, "blocked_today": 1, "decisions": {"block": 2, "warn": 1}, "average_risk_score": 80.0}
+        stored = pipe.hset.call_args.kwargs["mapping"]
+        assert stored["decision:block"] == 2 and stored["decision:warn"] == 1 and "reconciled_at" in stored
+        assert pipe.set.call_args.args == (day_key("user-1"), 1)
+        pipe.hdel.assert_called_once_with("user_stats:user-1:recent", "2000-01-01T00:00|decision:block")
+    
+    @pytest.mark.asyncio
+    async def test_blocklist_counts_survive_elasticsearch_outage(self):
+        from services.user_stats import get_user_stats
+        partial = {"total_blocked": 2, "blocked_today": 1, "decisions": {}, "risk_sum": 0.0,
+                   "risk_count": 0, "average_risk_score": None, "complete": False}
+        redis, pipe = redis_with_pipeline([{}, None])
+        with patch('services.user_stats.get_redis', return_value=redis), \
+             patch('services.user_stats.compute_user_stats', AsyncMock(return_value=partial)):
+            stats = await get_user_stats("user-1")
+        assert stats["total_blocked"] == 2 and stats["decisions"] == {}
+        pipe.hset.assert_not_called()
+    
+    @pytest.mark.asyncio
+    async def test_record_block_counts_new_identifiers_only(self):
+        from services.user_stats import record_block
+        redis, pipe = redis_with_pipeline()
+        with patch('services.user_stats.get_redis', return_value=redis):
+            await record_block("user-1", new_identifier=False, new_today=False)
+            redis.pipeline.assert_not_called()
+            await record_block("user-1", new_identifier=False, new_today=True)
+        pipe.hincrby.assert_not_called()
+        pipe.incr.assert_called_once()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])